@@ -1,118 +1,45 @@
+import startup_timing
 import os
-import sys
+import copy
+import multiprocessing
 import time
 import threading
-import subprocess
-import configparser
-import cv2
-import numpy as np
-from datetime import datetime
-from pathlib import Path
 import tkinter as tk
 from tkinter import filedialog, messagebox
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
-try:
-    from win32com.shell import shell, shellcon
-except ImportError:
-    shell = None
-
-def cv2_imread_unicode(path):
-    try:
-        # Support Chinese characters in path
-        img = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
-        return img
-    except Exception as e:
-        print(f"Error reading {path}: {e}")
-        return None
-
-class LdPlayerManager:
-    def __init__(self, ld_path, screenshot_dir, index=0):
-        self.ld_path = ld_path
-        self.screenshot_dir = screenshot_dir
-        self.index = index
-
-    def run_command(self, *args):
-        try:
-            cmd = [self.ld_path, "-s", str(self.index)] + list(args)
-            subprocess.run(cmd, check=False, creationflags=subprocess.CREATE_NO_WINDOW)
-        except Exception as e:
-            print(f"RunCommand Error: {e}")
-
-    def click(self, x, y):
-        self.run_command("input", "tap", str(x), str(y))
-
-    def screencap(self):
-        filename = f"trace_cap_{self.index}.png"
-        local_path = os.path.join(self.screenshot_dir, filename)
-        remote_path = f"/sdcard/Pictures/{filename}"
-        
-        # Remove old file if exists
-        if os.path.exists(local_path):
-            try: os.remove(local_path)
-            except: pass
-
-        try:
-            self.run_command("screencap", remote_path)
-            # Wait for file to appear (up to 5 seconds)
-            for _ in range(50):
-                if os.path.exists(local_path):
-                    # Try to read it to ensure it's not being written
-                    img = cv2.imread(local_path)
-                    if img is not None:
-                        return img
-                time.sleep(0.1)
-            return None
-        except Exception as e:
-            print(f"Screencap Error: {e}")
-            return None
-
-class ImageMatcher:
-    def __init__(self):
-        self.template_cache = {}
-
-    def load_templates(self, trace_dir):
-        self.template_cache.clear()
-        if not os.path.exists(trace_dir):
-            return
-        
-        for file in os.listdir(trace_dir):
-            if file.lower().endswith(".png"):
-                path = os.path.join(trace_dir, file)
-                img = cv2_imread_unicode(path)
-                if img is not None:
-                    self.template_cache[file] = img
-
-    def find_image(self, source_img, template_name, threshold=0.9, search_region=None):
-        if template_name not in self.template_cache:
-            return None
-        
-        template = self.template_cache[template_name]
-        
-        # Apply search region if provided (x, y, w, h)
-        offset_x, offset_y = 0, 0
-        if search_region:
-            x, y, w, h = search_region
-            if x >= 0 and y >= 0 and x + w <= source_img.shape[1] and y + h <= source_img.shape[0]:
-                source_img = source_img[y:y+h, x:x+w]
-                offset_x, offset_y = x, y
-
-        res = cv2.matchTemplate(source_img, template, cv2.TM_CCOEFF_NORMED)
-        min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
-
-        if max_val >= threshold:
-            return {
-                "success": True,
-                "location": (max_loc[0] + offset_x, max_loc[1] + offset_y),
-                "score": max_val
-            }
-        return {"success": False}
+from status_board import REFRESH_MS
+import ld_discovery
+startup_timing.mark("import tkinter / ttkbootstrap")
+
+# trace_engine (cv2, numpy, pywin32, ...) is imported on a background thread
+# once the window is up; see load_engine()
+trace_engine = None
+# How often the window checks whether the startup probe has finished (ms)
+PROBE_POLL_MS = 50
+# LdPlayerManager / ImageMatcher / RegionChangeDetector moved to trace_engine; re-exported for old imports
+ENGINE_EXPORTS = ("LdPlayerManager", "ImageMatcher", "RegionChangeDetector", "TraceEngine", "TraceSettings",
+                  "SUPERVISOR_INTERVAL", "app_dir", "auto_detect_paths", "find_trace_dir", "ordered_images",
+                  "read_config", "write_log")
+
+def load_engine():
+    # Safe from any thread; a second caller waits for an import in progress
+    global trace_engine
+    if trace_engine is None:
+        import trace_engine as module
+        trace_engine = module
+    return trace_engine
+
+def __getattr__(name):
+    if name in ENGINE_EXPORTS:
+        return getattr(load_engine(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 class TraceLDApp:
     def __init__(self, root):
         self.root = root
         self.root.title("LDPlayer Trace 腳本 (Python)")
-        self.root.geometry("550x750")
+        self.root.geometry("550x900")
         
         # Set icon if exists
         if os.path.exists("favicon.ico"):
@@ -123,32 +50,88 @@ class TraceLDApp:
         
         self.style = ttk.Style(theme="superhero")
         
-        self.is_running = False
-        self.worker_thread = None
-        self.ld_manager = None
-        self.matcher = ImageMatcher()
-        # For Nuitka onefile: use the original exe location, not temp extraction dir
-        # Check if running as compiled exe by looking at sys.argv[0]
-        exe_path = sys.argv[0] if sys.argv else sys.executable
-        if exe_path.lower().endswith('.exe'):
-            # Running as compiled exe - use argv[0] which has the real path
-            self.script_dir = os.path.dirname(os.path.abspath(exe_path))
-        elif getattr(sys, 'frozen', False):
-            self.script_dir = os.path.dirname(sys.executable)
-        else:
-            self.script_dir = os.path.dirname(os.path.abspath(__file__))
-            
-        self.trace_dir = os.path.join(self.script_dir, "trace")
-        self.config_path = os.path.join(self.script_dir, "trace.ini")
+        # The automation itself runs in trace_engine.TraceEngine; this window
+        # only edits the settings and pushes them to the engine
+        self.engine = None
+        self.pushed_selection = None
+        self.board_version = 0
+        # Filled in by the startup probe; Start / Save wait for it (self.ready)
+        self.settings = None
+        self.script_dir = None
+        self.trace_dir = None
+        self.config_path = None
+        self.ready = False
+        self.probe_result = None
         
         self.setup_ui()
-        self.load_config()
-        self.load_images()
-        self.refresh_emulators()
+        self.lbl_status.config(text="狀態：載入中...")
         
         # Add trace to LD path for auto-detection
         self.txt_ld_path.bind("<FocusOut>", lambda e: self.on_ld_path_changed())
         self.txt_ld_path.bind("<Return>", lambda e: self.on_ld_path_changed())
+        self.root.after(REFRESH_MS, self.refresh_status)
+        startup_timing.mark("build window")
+        self.root.after_idle(lambda: startup_timing.mark("window shown"))
+
+        # Imports, path detection and "ldconsole list2" run after the window is up
+        threading.Thread(target=self.probe, daemon=True, name="startup-probe").start()
+        self.root.after(PROBE_POLL_MS, self.finish_startup)
+
+    def probe(self):
+        # Startup work that does not touch widgets, on a background thread
+        try:
+            engine = load_engine()
+            startup_timing.mark("import trace_engine")
+            script_dir = engine.app_dir()
+            config_path = os.path.join(script_dir, "trace.ini")
+            settings = engine.TraceSettings.load(config_path)
+            startup_timing.mark("config + path detection")
+            trace_dir = engine.find_trace_dir(script_dir)
+            images = engine.ordered_images(trace_dir, settings.image_order) if os.path.exists(trace_dir) else None
+            startup_timing.mark("image list")
+            emulators, error = {}, None
+            if os.path.exists(settings.ld_path):
+                try:
+                    import ldplayer
+                    emulators = ldplayer.list_emulators(settings.ld_path)
+                except Exception as e:
+                    error = e
+            startup_timing.mark("emulator list")
+            self.probe_result = (script_dir, config_path, settings, trace_dir, images, emulators, error)
+        except Exception as e:
+            self.probe_result = e
+
+    def finish_startup(self):
+        # Polled on the Tk thread until probe() is done, then fills the window
+        result = self.probe_result
+        if result is None:
+            self.root.after(PROBE_POLL_MS, self.finish_startup)
+            return
+        if isinstance(result, Exception):
+            self.lbl_status.config(text=f"狀態：載入失敗: {result}")
+            return
+        self.script_dir, self.config_path, settings, self.trace_dir, images, emulators, error = result
+        self.load_config(settings)
+        if images is None:
+            # Creates the folder and tells the user
+            self.load_images()
+        else:
+            self.show_images(images)
+        if error is not None:
+            messagebox.showerror("錯誤", f"讀取模擬器清單失敗: {error}")
+        else:
+            self.show_emulators(emulators)
+        self.ready = True
+        startup_timing.mark("ready")
+
+        lines = startup_timing.report()
+        print("啟動時間:")
+        for line in lines:
+            print("  " + line)
+        if settings.debug_mode:
+            for line in lines:
+                self.log(f"啟動 {line}")
+        self.update_status(f"準備就緒 (啟動 {startup_timing.elapsed():.1f} 秒)")
 
     def setup_ui(self):
         main_frame = ttk.Frame(self.root, padding=10)
@@ -181,6 +164,10 @@ class TraceLDApp:
         self.num_wait_seconds = ttk.Spinbox(wait_frame, from_=0.1, to=60.0, increment=0.5, width=10)
         self.num_wait_seconds.set(1.0)
         self.num_wait_seconds.pack(side=LEFT)
+        # On: min_wait_seconds .. max_wait_seconds from trace.ini, depending on screen activity
+        self.chk_adaptive = ttk.Checkbutton(wait_frame, text="依畫面變化自動調整", command=self.on_adaptive_changed)
+        self.chk_adaptive.pack(side=LEFT, padx=10)
+        self.chk_adaptive.state(['!selected'])
 
         # --- Lists Container ---
         lists_frame = ttk.Frame(main_frame)
@@ -257,6 +244,21 @@ class TraceLDApp:
         self.chk_debug.pack(side=LEFT, padx=10)
         self.chk_debug.state(['!selected'])
 
+        # --- Per-emulator status ---
+        status_group = ttk.Labelframe(main_frame, text="模擬器狀態", padding=5)
+        status_group.pack(fill=X, pady=5)
+        self.tree_status = ttk.Treeview(status_group, columns=("emu", "status", "time"), show="headings", height=6)
+        self.tree_status.heading("emu", text="模擬器")
+        self.tree_status.heading("status", text="狀態")
+        self.tree_status.heading("time", text="時間")
+        self.tree_status.column("emu", width=60, anchor=CENTER, stretch=False)
+        self.tree_status.column("status", width=320)
+        self.tree_status.column("time", width=80, anchor=CENTER, stretch=False)
+        self.tree_status.pack(side=LEFT, fill=X, expand=YES)
+        tree_scroll = ttk.Scrollbar(status_group, orient=VERTICAL, command=self.tree_status.yview)
+        tree_scroll.pack(side=RIGHT, fill=Y)
+        self.tree_status.config(yscrollcommand=tree_scroll.set)
+
         # --- Status Bar ---
         self.lbl_status = ttk.Label(main_frame, text="狀態：準備就緒", relief=SUNKEN, anchor=W, padding=5)
         self.lbl_status.pack(fill=X, pady=(5, 0))
@@ -279,8 +281,9 @@ class TraceLDApp:
 
     def on_ld_path_changed(self):
         ld_path = self.txt_ld_path.get()
+        # Runs on every <FocusOut>; ld_discovery only re-reads leidian.config when it changed
         if os.path.exists(ld_path):
-            _, auto_scr = self.auto_detect_paths(ld_path)
+            _, auto_scr = ld_discovery.detect_paths(ld_path)
             current_scr = self.txt_screenshot_dir.get()
             if not current_scr or not os.path.exists(current_scr):
                 self.txt_screenshot_dir.delete(0, END)
@@ -313,225 +316,99 @@ class TraceLDApp:
             self.lst_images.insert(new_index, item)
             self.lst_images.selection_set(new_index)
 
-    def load_config(self):
-        config = configparser.ConfigParser()
-        
-        ld_path = ""
-        screenshot_dir = ""
-        wait_seconds = "1.0"
-        debug_mode = "False"
-        selected_emus = ""
-        
-        if os.path.exists(self.config_path):
-            # Try UTF-8 first, then CP950 (Big5)
-            try:
-                config.read(self.config_path, encoding='utf-8')
-            except UnicodeDecodeError:
-                try:
-                    config.read(self.config_path, encoding='cp950')
-                except Exception as e:
-                    print(f"Error reading config: {e}")
-            
-            if 'Settings' in config:
-                ld_path = config['Settings'].get('ld_path', '')
-                screenshot_dir = config['Settings'].get('screenshot_dir', '')
-                wait_seconds = config['Settings'].get('wait_seconds', '1.0')
-                debug_mode = config['Settings'].get('debug_mode', 'False')
-                selected_emus = config['Settings'].get('selected_emulators', '')
-
-        # Auto detect missing paths
-        auto_ld, auto_scr = self.auto_detect_paths(ld_path)
-        
-        if not ld_path or not os.path.exists(ld_path):
-            ld_path = auto_ld
-            # If LD path changed, re-detect screenshot dir
-            _, auto_scr = self.auto_detect_paths(ld_path)
-            
-        if not screenshot_dir or not os.path.exists(screenshot_dir):
-            screenshot_dir = auto_scr
 
+    def load_config(self, settings=None):
+        self.settings = settings or load_engine().TraceSettings.load(self.config_path)
         self.txt_ld_path.delete(0, END)
-        self.txt_ld_path.insert(0, ld_path)
+        self.txt_ld_path.insert(0, self.settings.ld_path)
         self.txt_screenshot_dir.delete(0, END)
-        self.txt_screenshot_dir.insert(0, screenshot_dir)
-        self.num_wait_seconds.set(wait_seconds)
-        if debug_mode.lower() == "true":
+        self.txt_screenshot_dir.insert(0, self.settings.screenshot_dir)
+        self.num_wait_seconds.set(self.settings.wait_seconds)
+        self.chk_adaptive.state(['selected' if self.settings.adaptive_wait else '!selected'])
+        self.on_adaptive_changed()
+        if self.settings.debug_mode:
             self.chk_debug.state(['selected'])
-        
-        self.saved_selected_emus = selected_emus.split('|') if selected_emus else []
-
-    def auto_detect_paths(self, current_ld=""):
-        common_paths = [
-            r"C:\LDPlayer\LDPlayer9\ld.exe",
-            r"D:\LDPlayer\LDPlayer9\ld.exe",
-            r"E:\LDPlayer\LDPlayer9\ld.exe",
-            r"F:\LDPlayer\LDPlayer9\ld.exe",
-            r"C:\Program Files\LDPlayer\LDPlayer9\ld.exe",
-            r"C:\XuanZhi\LDPlayer9\ld.exe"
-        ]
-        
-        ld_path = current_ld
-        if not ld_path or not os.path.exists(ld_path):
-            ld_path = ""
-            for p in common_paths:
-                if os.path.exists(p):
-                    ld_path = p
-                    break
-        
-        if not ld_path:
-            path_env = os.environ.get("PATH", "")
-            for p in path_env.split(os.pathsep):
-                potential = os.path.join(p, "ld.exe")
-                if os.path.exists(potential):
-                    ld_path = potential
-                    break
-        
-        scr_dir = ""
-        if ld_path:
-            try:
-                ld_dir = os.path.dirname(ld_path)
-                # Check multiple possible config locations
-                cfg_candidates = [
-                    os.path.join(ld_dir, "leidian.config"),
-                    os.path.join(ld_dir, "vms", "config", "leidian.config"),
-                    os.path.join(ld_dir, "vms", "config", "leidians.config")
-                ]
-                for cfg_path in cfg_candidates:
-                    if os.path.exists(cfg_path):
-                        with open(cfg_path, 'r', encoding='utf-8', errors='ignore') as f:
-                            for line in f:
-                                if '"picturePath"' in line:
-                                    parts = line.split(':')
-                                    if len(parts) > 1:
-                                        val = parts[1].strip().strip('", ').replace('\\\\', '\\')
-                                        if os.path.exists(val):
-                                            scr_dir = val
-                                            break
-                    if scr_dir: break
-            except: pass
-            
-        # Fallback 1: Documents/XuanZhi9/Pictures (Using win32com for reliability)
-        if not scr_dir and shell:
-            try:
-                docs = shell.SHGetFolderPath(0, shellcon.CSIDL_PERSONAL, None, 0)
-                xz_pics = os.path.join(docs, "XuanZhi9", "Pictures")
-                if os.path.exists(xz_pics):
-                    scr_dir = xz_pics
-            except: pass
-
-        # Fallback 2: Pictures/LDPlayer
-        if not scr_dir and shell:
-            try:
-                pics = shell.SHGetFolderPath(0, shellcon.CSIDL_MYPICTURES, None, 0)
-                ld_pics = os.path.join(pics, "LDPlayer")
-                if os.path.exists(ld_pics):
-                    scr_dir = ld_pics
-            except: pass
-
-        # Final Fallback
-        if not scr_dir:
-            scr_dir = r"D:\Screenshots"
-            
-        return ld_path, scr_dir
+
+    def read_settings(self):
+        # Copy the widget state into self.settings; only called on the Tk thread
+        settings = self.settings
+        settings.ld_path = self.txt_ld_path.get()
+        settings.screenshot_dir = self.txt_screenshot_dir.get()
+        try:
+            settings.wait_seconds = float(self.num_wait_seconds.get())
+        except ValueError:
+            # Half-typed or empty field: keep the last good value
+            pass
+        settings.adaptive_wait = 'selected' in self.chk_adaptive.state()
+        settings.debug_mode = 'selected' in self.chk_debug.state()
+        settings.selected_emulators = [e[0] for e in self.emu_vars if e[2].get()]
+        settings.image_order = list(self.lst_images.get(0, END))
+        return settings
+
+    def on_adaptive_changed(self):
+        # The fixed interval is unused while adaptive waiting is on
+        adaptive = 'selected' in self.chk_adaptive.state()
+        self.num_wait_seconds.config(state=DISABLED if adaptive else NORMAL)
 
     def save_config(self):
-        config = configparser.ConfigParser()
-        config['Settings'] = {
-            'ld_path': self.txt_ld_path.get(),
-            'screenshot_dir': self.txt_screenshot_dir.get(),
-            'wait_seconds': self.num_wait_seconds.get(),
-            'debug_mode': str('selected' in self.chk_debug.state()),
-            'selected_emulators': '|'.join([str(e[0]) for e in self.emu_vars if e[2].get()]),
-            'image_order': '|'.join(self.lst_images.get(0, END))
-        }
-        
-        with open(self.config_path, 'w', encoding='utf-8') as f:
-            config.write(f)
+        if not self.ready:
+            return
+        self.read_settings().save(self.config_path)
         messagebox.showinfo("提示", "設定已儲存")
 
     def load_images(self):
-        # Fallback to TraceLD_Project/trace if local trace is missing or empty
-        if not os.path.exists(self.trace_dir) or not any(f.lower().endswith(".png") for f in os.listdir(self.trace_dir) if os.path.isdir(self.trace_dir)):
-            fallback = os.path.join(self.script_dir, "TraceLD_Project", "trace")
-            if os.path.exists(fallback) and any(f.lower().endswith(".png") for f in os.listdir(fallback)):
-                self.trace_dir = fallback
+        if self.script_dir is None:
+            return
+        engine = load_engine()
+        self.trace_dir = engine.find_trace_dir(self.script_dir)
         
         if not os.path.exists(self.trace_dir):
             os.makedirs(self.trace_dir, exist_ok=True)
             messagebox.showwarning("提示", f"找不到 trace 資料夾，已自動建立：\n{self.trace_dir}\n請將比對圖片放入此資料夾。")
             return
 
-        config = configparser.ConfigParser()
-        try:
-            config.read(self.config_path, encoding='utf-8')
-        except UnicodeDecodeError:
-            try:
-                config.read(self.config_path, encoding='cp950')
-            except:
-                pass
-        
+        config = engine.read_config(self.config_path)
         saved_order = config.get('Settings', 'image_order', fallback='')
         saved_items = [i for i in saved_order.split('|') if i]
         
-        current_files = set([f for f in os.listdir(self.trace_dir) if f.lower().endswith(".png")])
-        
-        if not current_files and not saved_items:
+        self.show_images(engine.ordered_images(self.trace_dir, saved_items))
+
+    def show_images(self, images):
+        if not images:
             self.update_status("trace 資料夾內無圖片")
 
         self.lst_images.delete(0, END)
-        for item in saved_items:
-            if item in current_files:
-                self.lst_images.insert(END, item)
-                current_files.remove(item)
-        
-        for file in sorted(list(current_files)):
-            self.lst_images.insert(END, file)
+        for item in images:
+            self.lst_images.insert(END, item)
 
     def refresh_emulators(self):
         ld_path = self.txt_ld_path.get()
         if not os.path.exists(ld_path):
             return
 
-        ld_dir = os.path.dirname(ld_path)
-        console_path = os.path.join(ld_dir, "ldconsole.exe")
-        if not os.path.exists(console_path):
-            console_path = ld_path
-
         try:
-            # Try UTF-8 first
-            try:
-                result = subprocess.run([console_path, "list2"], capture_output=True, text=True, encoding='utf-8', creationflags=subprocess.CREATE_NO_WINDOW)
-                stdout = result.stdout
-            except UnicodeDecodeError:
-                result = subprocess.run([console_path, "list2"], capture_output=True, text=True, encoding='cp950', creationflags=subprocess.CREATE_NO_WINDOW)
-                stdout = result.stdout
-
-            lines = stdout.strip().split('\n')
-            
-            # Clear existing
-            for _, _, _, cb in self.emu_vars:
-                cb.destroy()
-            self.emu_vars = []
-
-            for line in lines:
-                if not line: continue
-                parts = line.split(',')
-                if len(parts) >= 5:
-                    idx = int(parts[0])
-                    name = parts[1]
-                    is_running = parts[4] == "1"
-                    
-                    var = tk.BooleanVar(value=is_running)
-                    # If we had saved selection, override
-                    if hasattr(self, 'saved_selected_emus') and str(idx) in self.saved_selected_emus:
-                        var.set(True)
-
-                    cb = ttk.Checkbutton(self.emu_scrollable_frame, text=f"{idx}: {name}", variable=var)
-                    cb.pack(fill=X, anchor=W, padx=5, pady=2)
-                    self.emu_vars.append((idx, name, var, cb))
+            import ldplayer
+            self.show_emulators(ldplayer.list_emulators(ld_path))
         except Exception as e:
             messagebox.showerror("錯誤", f"讀取模擬器清單失敗: {e}")
 
+    def show_emulators(self, emulators):
+        # Clear existing
+        for _, _, _, cb in self.emu_vars:
+            cb.destroy()
+        self.emu_vars = []
+
+        for idx, info in emulators.items():
+            name = info["name"]
+            var = tk.BooleanVar(value=info["running"])
+            # If we had saved selection, override
+            if idx in self.settings.selected_emulators:
+                var.set(True)
+
+            cb = ttk.Checkbutton(self.emu_scrollable_frame, text=f"{idx}: {name}", variable=var)
+            cb.pack(fill=X, anchor=W, padx=5, pady=2)
+            self.emu_vars.append((idx, name, var, cb))
+
     def select_all_emus(self):
         for _, _, var, _ in self.emu_vars:
             var.set(True)
@@ -546,40 +423,61 @@ class TraceLDApp:
             self.log(msg)
 
     def log(self, msg):
-        now = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-        with open("trace_log.txt", "a", encoding='utf-8') as f:
-            f.write(f"[{now}] {msg}\n")
+        load_engine().write_log(msg)
+
+    def refresh_status(self):
+        # Pulls what changed on the engine's status board at a fixed rate,
+        # however many emulators are publishing
+        engine = self.engine
+        if engine is not None:
+            self.board_version, changed = engine.board.changes(self.board_version)
+            for key, (msg, ts) in changed.items():
+                if key is None:
+                    self.lbl_status.config(text=f"狀態：{msg}")
+                    continue
+                values = (key, msg, time.strftime("%H:%M:%S", time.localtime(ts)))
+                iid = str(key)
+                if self.tree_status.exists(iid):
+                    self.tree_status.item(iid, values=values)
+                else:
+                    rows = [int(i) for i in self.tree_status.get_children()]
+                    self.tree_status.insert("", sum(1 for i in rows if i < key), iid=iid, values=values)
+        self.root.after(REFRESH_MS, self.refresh_status)
+
+    def on_emulator_closed(self, index):
+        def uncheck():
+            for idx, _, var, _ in self.emu_vars:
+                if idx == index:
+                    var.set(False)
+                    break
+        self.root.after(0, uncheck)
 
-    def check_emulator_status(self, index):
-        ld_path = self.txt_ld_path.get()
-        if not os.path.exists(ld_path):
-            return False
+    def on_engine_finished(self):
+        self.root.after(0, lambda: self.set_running(False))
 
-        ld_dir = os.path.dirname(ld_path)
-        console_path = os.path.join(ld_dir, "ldconsole.exe")
-        if not os.path.exists(console_path):
-            console_path = ld_path
+    def set_running(self, running):
+        self.btn_start.config(state=DISABLED if running else NORMAL)
+        self.btn_stop.config(state=NORMAL if running else DISABLED)
 
+    def push_settings(self):
+        # Runs on the Tk thread every SUPERVISOR_INTERVAL while the engine runs;
+        # the engine never touches the widgets itself
+        engine = self.engine
+        if engine is None or not engine.is_running:
+            return
         try:
-            # Try UTF-8 first
-            try:
-                result = subprocess.run([console_path, "list2"], capture_output=True, text=True, encoding='utf-8', creationflags=subprocess.CREATE_NO_WINDOW)
-                stdout = result.stdout
-            except UnicodeDecodeError:
-                result = subprocess.run([console_path, "list2"], capture_output=True, text=True, encoding='cp950', creationflags=subprocess.CREATE_NO_WINDOW)
-                stdout = result.stdout
-                
-            lines = stdout.strip().split('\n')
-            for line in lines:
-                parts = line.split(',')
-                if len(parts) >= 5 and parts[0] == str(index):
-                    return parts[4] == "1"
-        except:
-            pass
-        return False
+            settings = self.read_settings()
+            selection = tuple(settings.selected_emulators)
+            # The engine drops closed emulators itself; only forward changes made here
+            selected = selection if selection != self.pushed_selection else None
+            self.pushed_selection = selection
+            engine.configure(settings.image_order, settings.wait_seconds, settings.debug_mode, selected,
+                             settings.adaptive_wait)
+        finally:
+            self.root.after(int(trace_engine.SUPERVISOR_INTERVAL * 1000), self.push_settings)
 
     def start_script(self):
-        if self.is_running:
+        if not self.ready or (self.engine and self.engine.is_running):
             return
 
         ld_path = self.txt_ld_path.get()
@@ -592,85 +490,35 @@ class TraceLDApp:
             messagebox.showwarning("提示", "請至少勾選一個模擬器！")
             return
 
-        if 'selected' in self.chk_debug.state():
-            if os.path.exists("trace_log.txt"):
-                os.remove("trace_log.txt")
-
-        self.update_status("載入圖片快取...")
-        self.matcher.load_templates(self.trace_dir)
-        
-        self.ld_manager = LdPlayerManager(ld_path, self.txt_screenshot_dir.get())
-        self.is_running = True
-        self.btn_start.config(state=DISABLED)
-        self.btn_stop.config(state=NORMAL)
-        
-        self.worker_thread = threading.Thread(target=self.run_automation, daemon=True)
-        self.worker_thread.start()
+        settings = self.read_settings()
+        self.pushed_selection = tuple(settings.selected_emulators)
+        self.board_version = 0
+        self.tree_status.delete(*self.tree_status.get_children())
+        # The engine keeps its own copy; later edits reach it through push_settings
+        self.engine = trace_engine.TraceEngine(copy.copy(settings), self.trace_dir,
+                                  on_emulator_closed=self.on_emulator_closed, on_finished=self.on_engine_finished)
+        self.engine.start()
+        self.set_running(True)
+        self.root.after(int(trace_engine.SUPERVISOR_INTERVAL * 1000), self.push_settings)
 
     def stop_script(self):
-        self.is_running = False
-        self.btn_start.config(state=NORMAL)
+        engine = self.engine
+        if engine is None or not engine.is_running:
+            self.set_running(False)
+            return
+        # stop() waits for the cycles in progress; keep both buttons off until it is done
+        self.btn_start.config(state=DISABLED)
         self.btn_stop.config(state=DISABLED)
-        self.update_status("已停止")
-
-    def run_automation(self):
-        try:
-            self.update_status("開始執行...")
-            
-            while self.is_running:
-                images = list(self.lst_images.get(0, END))
-                selected_indices = [e[0] for e in self.emu_vars if e[2].get()]
-                wait_sec = float(self.num_wait_seconds.get())
-
-                if not selected_indices:
-                    self.root.after(0, lambda: self.update_status("未選擇任何模擬器"))
-                    break
-
-                for emu_index in selected_indices:
-                    if not self.is_running:
-                        break
-                    
-                    self.ld_manager.index = emu_index
-                    self.root.after(0, lambda idx=emu_index: self.update_status(f"[{idx}] 截圖中..."))
-
-                    cap_img = self.ld_manager.screencap()
-                    if cap_img is not None:
-                        matched = False
-                        # Search region from C#: Rectangle(180, 120, 430, 60)
-                        search_region = (180, 120, 430, 60)
-
-                        for img_name in images:
-                            self.root.after(0, lambda idx=emu_index, name=img_name: self.update_status(f"[{idx}] 比對: {name}"))
-                            result = self.matcher.find_image(cap_img, img_name, threshold=0.9, search_region=search_region)
-                            
-                            if result and result["success"]:
-                                loc = result["location"]
-                                self.root.after(0, lambda idx=emu_index, name=img_name, x=loc[0]: self.update_status(f"[{idx}] 匹配: {name} -> 點擊 ({x}, 320)"))
-                                self.ld_manager.click(loc[0], 320)
-                                matched = True
-                                break
-                        
-                        if not matched:
-                            self.root.after(0, lambda idx=emu_index: self.update_status(f"[{idx}] 無匹配項"))
-                    else:
-                        self.root.after(0, lambda idx=emu_index: self.update_status(f"[{idx}] 截圖失敗，檢查狀態..."))
-                        if not self.check_emulator_status(emu_index):
-                            self.root.after(0, lambda idx=emu_index: self.update_status(f"[{idx}] 模擬器已關閉，取消勾選"))
-                            # Find the var and uncheck it
-                            for idx, _, var, _ in self.emu_vars:
-                                if idx == emu_index:
-                                    self.root.after(0, lambda v=var: v.set(False))
-                                    break
-
-                if self.is_running:
-                    time.sleep(wait_sec)
-        except Exception as e:
-            self.root.after(0, lambda msg=str(e): self.update_status(f"錯誤: {msg}"))
-            self.is_running = False
-            self.root.after(0, lambda: self.btn_start.config(state=NORMAL))
-            self.root.after(0, lambda: self.btn_stop.config(state=DISABLED))
+        self.lbl_status.config(text="狀態：停止中...")
+        def stop():
+            engine.stop()
+            self.root.after(0, lambda: self.set_running(False))
+        threading.Thread(target=stop, daemon=True, name="engine-stop").start()
 
 if __name__ == "__main__":
+    # match_backend=processes starts worker processes from this executable
+    multiprocessing.freeze_support()
     root = ttk.Window()
+    startup_timing.mark("create Tk root")
     app = TraceLDApp(root)
     root.mainloop()
@@ -0,0 +1,302 @@
+import os
+import io
+import sys
+import json
+import time
+import platform
+import multiprocessing
+import argparse
+import threading
+import contextlib
+import cv2
+import numpy as np
+from trace_engine import ImageMatcher
+import diary_engine
+import match_modes
+from match_pool import ProcessMatcher
+from frame_ring import FrameRing
+
+# Synthetic-frame benchmark for ImageMatcher (TraceLD) and diary_ld's CachedMatcher (diary_engine).
+# Templates are pasted into generated backgrounds at known positions, so
+# every call can also be checked for the right location.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TRACE_DIR = os.path.join(BASE_DIR, "TraceLD_Project", "trace")
+DIARY_DIR = os.path.join(BASE_DIR, "DiaryLD_Project")
+DIARY_TEMPLATES = ["diary.png", "ball.png", "check1.png", "check2.png"]
+
+FRAME_SIZE = (960, 540)
+# TraceLD's skill bar region, a quarter of the screen and the full screen
+TRACE_REGIONS = ["180,120,430,60", "0,0,480,270", "full"]
+TRACE_COUNTS = [1, 8, 0]  # 0 = every template
+TRACE_THRESHOLD = 0.9
+# Location tolerance in pixels
+LOC_TOLERANCE = 1
+
+def parse_region(text):
+    if text == "full":
+        return None
+    x, y, w, h = (int(v) for v in text.split(","))
+    return (x, y, w, h)
+
+def make_background(rng, size, noise):
+    # Smooth random colour blobs plus fine noise, so templates cannot match by accident
+    w, h = size
+    low = rng.integers(0, 256, (h // 24 + 2, w // 24 + 2, 3), dtype=np.uint8)
+    frame = cv2.resize(low, (w, h), interpolation=cv2.INTER_CUBIC)
+    for _ in range(12):
+        x, y = int(rng.integers(0, w)), int(rng.integers(0, h))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cv2.rectangle(frame, (x, y), (x + int(rng.integers(10, 120)), y + int(rng.integers(10, 60))), color, -1)
+    if noise:
+        frame = np.clip(frame + rng.normal(0, noise, frame.shape), 0, 255).astype(np.uint8)
+    return frame
+
+def paste(rng, frame, tpl, region, noise):
+    # Paste tpl at a random position inside region; returns its location
+    x, y, w, h = region or (0, 0, frame.shape[1], frame.shape[0])
+    th, tw = tpl.shape[:2]
+    px = x + int(rng.integers(0, w - tw + 1))
+    py = y + int(rng.integers(0, h - th + 1))
+    patch = tpl
+    if noise:
+        patch = np.clip(tpl + rng.normal(0, noise, tpl.shape), 0, 255).astype(np.uint8)
+    frame[py:py + th, px:px + tw] = patch
+    return (px, py)
+
+def close_to(loc, expected):
+    return loc is not None and abs(loc[0] - expected[0]) <= LOC_TOLERANCE and abs(loc[1] - expected[1]) <= LOC_TOLERANCE
+
+def summarize(name, params, times, correct, wrong, false_positives):
+    times_ms = np.array(times) * 1000.0
+    return {
+        "bench": name,
+        **params,
+        "calls": len(times),
+        "throughput_per_s": len(times) / (times_ms.sum() / 1000.0) if times_ms.sum() else 0.0,
+        "mean_ms": float(times_ms.mean()),
+        "p50_ms": float(np.percentile(times_ms, 50)),
+        "p95_ms": float(np.percentile(times_ms, 95)),
+        "p99_ms": float(np.percentile(times_ms, 99)),
+        "correct": correct,
+        "wrong": wrong,
+        "false_positives": false_positives
+    }
+
+def bench_trace(args, rng):
+    matcher = ImageMatcher()
+    matcher.load_templates(TRACE_DIR)
+    matcher.set_modes({}, args.match_mode)
+    all_names = sorted(matcher.template_cache)
+    results = []
+    for region_text in args.trace_regions:
+        region = parse_region(region_text)
+        for count in args.trace_counts:
+            names = all_names[:count] if count else all_names
+            single, batch = [], []
+            stats = {"find_image": [0, 0, 0], "find_first": [0, 0, 0]}
+            for i in range(args.frames):
+                frame = make_background(rng, FRAME_SIZE, args.noise)
+                target = names[i % len(names)]
+                expected = paste(rng, frame, matcher.template_cache[target], region, args.noise)
+
+                # One find_image per template, the way a TraceLD cycle checks its list
+                for name in names:
+                    t0 = time.perf_counter()
+                    res = matcher.find_image(frame, name, TRACE_THRESHOLD, region)
+                    single.append(time.perf_counter() - t0)
+                    if name == target:
+                        stats["find_image"][0 if res["success"] and close_to(res["location"], expected) else 1] += 1
+                    elif res["success"]:
+                        stats["find_image"][2] += 1
+
+                t0 = time.perf_counter()
+                res = matcher.find_first(frame, names, TRACE_THRESHOLD, region)
+                batch.append(time.perf_counter() - t0)
+                if res["success"] and res["name"] == target and close_to(res["location"], expected):
+                    stats["find_first"][0] += 1
+                elif res["success"] and res["name"] != target:
+                    stats["find_first"][2] += 1
+                else:
+                    stats["find_first"][1] += 1
+
+            # find_image is timed per template, find_first per frame (all templates at once)
+            params = {"region": region_text, "templates": len(names), "match_mode": args.match_mode}
+            results.append(summarize("trace.find_image", dict(params, per="template"), single, *stats["find_image"]))
+            results.append(summarize("trace.find_first", dict(params, per="frame"), batch, *stats["find_first"]))
+    return results
+
+def bench_trace_parallel(args, rng):
+    # args.emulators threads call find_first at once, like TraceLD's workers;
+    # throughput is calls per wall-clock second, so it shows how matching scales
+    matcher = ImageMatcher()
+    matcher.load_templates(TRACE_DIR)
+    matcher.set_modes({}, args.match_mode)
+    names = sorted(matcher.template_cache)
+    region = parse_region(TRACE_REGIONS[0])
+    test_frames = []
+    for i in range(args.frames):
+        frame = make_background(rng, FRAME_SIZE, args.noise)
+        target = names[i % len(names)]
+        test_frames.append((frame, target, paste(rng, frame, matcher.template_cache[target], region, args.noise)))
+
+    results = []
+    for backend_name in args.backends:
+        backend, frames = matcher, None
+        if backend_name != "threads":
+            # "shared" hands the pool frame_ring slots instead of pickled regions
+            frames = FrameRing() if backend_name == "shared" else None
+            backend = ProcessMatcher(matcher, TRACE_DIR, args.emulators, frames)
+            # Let every worker load its templates before timing
+            for future in [backend.executor.submit(os.getpid) for _ in range(args.emulators * 2)]:
+                future.result()
+        times, stats = [], [0, 0, 0]
+        lock = threading.Lock()
+
+        def emulator(index):
+            for frame, target, expected in test_frames:
+                if frames:
+                    # Captures land in the ring in TraceLD; not part of the match time
+                    frame = frames.write(index, frame)
+                t0 = time.perf_counter()
+                res = backend.find_first(frame, names, TRACE_THRESHOLD, region)
+                elapsed = time.perf_counter() - t0
+                with lock:
+                    times.append(elapsed)
+                    if res["success"] and res["name"] == target and close_to(res["location"], expected):
+                        stats[0] += 1
+                    elif res["success"] and res["name"] != target:
+                        stats[2] += 1
+                    else:
+                        stats[1] += 1
+
+        threads = [threading.Thread(target=emulator, args=(i,)) for i in range(args.emulators)]
+        wall = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - wall
+        if backend is not matcher:
+            backend.close()
+        if frames:
+            frames.close()
+        params = {"backend": backend_name, "emulators": args.emulators, "region": TRACE_REGIONS[0],
+                  "templates": len(names), "per": "frame"}
+        result = summarize("trace.parallel", params, times, *stats)
+        result["throughput_per_s"] = len(times) / wall
+        results.append(result)
+    return results
+
+def bench_diary(args, rng):
+    results = []
+    for mode in ("full", "pyramid"):
+        # A fresh matcher per mode so neither run warms the other's hints
+        matcher = diary_engine.CachedMatcher(pyramid_templates=DIARY_TEMPLATES if mode == "pyramid" else ())
+        matcher.emulator = 0
+        matcher.default_mode = args.match_mode
+        for name in DIARY_TEMPLATES:
+            path = os.path.join(DIARY_DIR, name)
+            tpl = matcher.template(path)
+            if tpl is None:
+                continue
+            threshold = 0.90 if name == "diary.png" else 0.98
+            times = []
+            correct = wrong = false_positives = 0
+            for i in range(args.frames):
+                frame = make_background(rng, FRAME_SIZE, args.noise)
+                # Every other frame leaves the template out to measure misses as well
+                present = i % 2 == 0
+                expected = paste(rng, frame, tpl.bgr, None, args.noise) if present else None
+                with contextlib.redirect_stdout(io.StringIO()):
+                    t0 = time.perf_counter()
+                    loc = matcher(frame, path, threshold)
+                    times.append(time.perf_counter() - t0)
+                found = loc != (0, 0)
+                if present:
+                    if close_to(loc, expected):
+                        correct += 1
+                    else:
+                        wrong += 1
+                elif found:
+                    false_positives += 1
+                else:
+                    correct += 1
+            params = {"mode": mode, "template": name, "region": "full", "per": "template",
+                      "match_mode": args.match_mode}
+            results.append(summarize("diary.match", params, times, correct, wrong, false_positives))
+    return results
+
+def compare(results, baseline_path, key="p50_ms"):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    def ident(r):
+        return tuple(sorted((k, str(v)) for k, v in r.items() if k in ("bench", "region", "templates", "mode", "template",
+                                                                        "backend", "emulators")))
+    old = {ident(r): r for r in baseline.get("results", [])}
+    for r in results:
+        prev = old.get(ident(r))
+        if prev and prev.get(key):
+            r[f"{key}_vs_baseline"] = r[key] / prev[key]
+
+def print_table(results, out):
+    for r in results:
+        label = r["bench"] + " " + " ".join(f"{k}={r[k]}" for k in ("mode", "backend", "emulators", "template", "region", "templates", "per") if k in r)
+        ratio = f"  x{r['p50_ms_vs_baseline']:.2f}" if "p50_ms_vs_baseline" in r else ""
+        print(f"{label:<72} {r['throughput_per_s']:>9.1f}/s  p50={r['p50_ms']:.3f}ms p95={r['p95_ms']:.3f}ms "
+              f"p99={r['p99_ms']:.3f}ms  ok={r['correct']} wrong={r['wrong']} fp={r['false_positives']}{ratio}", file=out)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Template matching benchmark on synthetic frames")
+    parser.add_argument("--frames", type=int, default=20, help="synthetic frames per case")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--noise", type=float, default=0.0, help="gaussian pixel noise sigma")
+    parser.add_argument("--trace-regions", nargs="+", default=TRACE_REGIONS, help="x,y,w,h or full")
+    parser.add_argument("--trace-counts", nargs="+", type=int, default=TRACE_COUNTS, help="templates per frame, 0 = all")
+    parser.add_argument("--match-mode", default="bgr", choices=match_modes.MODES, help="match mode for every template")
+    parser.add_argument("--emulators", type=int, default=0, help="also time this many concurrent find_first callers")
+    parser.add_argument("--backends", nargs="+", default=["threads", "processes", "shared"], choices=["threads", "processes", "shared"])
+    parser.add_argument("--only", choices=["trace", "diary"])
+    parser.add_argument("--json", help="write results to this file ('-' for stdout)")
+    parser.add_argument("--baseline", help="earlier --json output to compare p50 against")
+    args = parser.parse_args(argv)
+
+    cv2.setRNGSeed(args.seed)
+    rng = np.random.default_rng(args.seed)
+    results = []
+    if args.only != "diary":
+        results += bench_trace(args, rng)
+        if args.emulators > 0:
+            results += bench_trace_parallel(args, rng)
+    if args.only != "trace":
+        results += bench_diary(args, rng)
+    if args.baseline:
+        compare(results, args.baseline)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "env": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "cpu_count": os.cpu_count(),
+            "opencv_threads": cv2.getNumThreads()
+        },
+        "params": {"frames": args.frames, "seed": args.seed, "noise": args.noise, "frame_size": list(FRAME_SIZE)},
+        "results": results
+    }
+    print_table(results, sys.stderr if args.json == "-" else sys.stdout)
+    if args.json == "-":
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+    elif args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    # Non-zero exit when a pasted template was missed or misplaced. False
+    # positives are only reported: some trace icons are near-duplicates
+    # (召喚怪物近距離 / 召喚怪物遠距離 score ~0.91 against each other).
+    return 1 if any(r["wrong"] for r in results) else 0
+
+if __name__ == "__main__":
+    # The processes backend spawns workers that import this file
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,334 @@
+import os
+import sys
+from configparser import ConfigParser
+import cv2
+import numpy as np
+import template_store
+import match_modes
+import ld_discovery
+from location_hints import LocationHints
+from template_index import TemplateIndex
+from ld_async import AsyncLdPlayerManager
+
+# DiaryLD 的截圖 / 比對 / 設定，不含視窗；diary_ld 在視窗出現後才在背景匯入
+
+# ==================== LdPlayer 控制類 ====================
+class LdPlayerManager(AsyncLdPlayerManager):
+    # click / screencap 為 coroutine，在 loop_thread 上執行；截圖回傳 BGR 陣列
+    def __init__(self, ld_path, screenshot_dir, index, capture_mode="raw", matcher=None):
+        super().__init__(ld_path, screenshot_dir, index, capture_mode, capture_name="cap")
+        # The CachedMatcher whose recorder (if any) also gets the clicks
+        self.matcher = matcher
+
+    def set_ld_path(self, path):
+        self.ld_path = path
+
+    def set_screenshot_dir(self, path):
+        self.screenshot_dir = path
+
+    def set_index(self, idx):
+        self.index = idx
+
+    async def click(self, x, y):
+        recorder = self.matcher.recorder if self.matcher else None
+        if recorder:
+            recorder.click(self.index, x, y)
+        await super().click(x, y)
+
+# ==================== 匹配函式 ====================
+# 預設使用金字塔搜尋的全畫面 UI 圖片
+PYRAMID_TEMPLATES = "diary.png|ball.png|check1.png|check2.png"
+
+class CachedMatcher:
+    def __init__(self, pyramid_templates=(), pyramid_level=1, coarse_margin=0.2, candidates=3):
+        self.frame = None
+        self.frame_bgr = None
+        self.frame_pyramid = []
+        # Coarse-to-fine search is opt-in per template file name
+        self.pyramid_templates = set(pyramid_templates)
+        self.pyramid_level = pyramid_level
+        # Coarse scores below threshold - coarse_margin are treated as a miss
+        self.coarse_margin = coarse_margin
+        self.candidates = candidates
+        # 上次找到各圖片的位置 (依模擬器 index)，先搜尋附近小範圍
+        self.hints = LocationHints()
+        self.emulator = None
+        # session_record.SessionRecorder while recording, else None
+        self.recorder = None
+        # match_modes per template file name; the pyramid search is only used in "bgr"
+        self.modes = {}
+        self.default_mode = "bgr"
+        self.frame_views = {}
+        # (path, mode) -> match_modes.prepare() result
+        self.prepared = {}
+        # find_first 先用 TemplateIndex 依顏色排序，可能出現的圖片先比對；None = 依清單順序
+        self.index = TemplateIndex()
+
+    def frame_to_bgr(self, cap):
+        # Screencaps are already BGR arrays; PIL images are converted once per frame
+        if isinstance(cap, np.ndarray):
+            frame_bgr = cap
+        elif cap is not self.frame:
+            # Ensure RGB (drop alpha if exists) to avoid shape mismatch or color errors
+            frame_bgr = cv2.cvtColor(np.array(cap.convert('RGB')), cv2.COLOR_RGB2BGR)
+        else:
+            return self.frame_bgr
+        if frame_bgr is not self.frame_bgr:
+            self.frame_pyramid = []
+            self.frame_views = {}
+        self.frame, self.frame_bgr = cap, frame_bgr
+        return frame_bgr
+
+    def pyramid_of(self, frame_bgr, level):
+        # Downscaled copies of the current frame, built once per frame on demand
+        while len(self.frame_pyramid) < level:
+            prev = self.frame_pyramid[-1] if self.frame_pyramid else frame_bgr
+            self.frame_pyramid.append(cv2.pyrDown(prev))
+        return self.frame_pyramid[level - 1]
+
+    def template(self, path):
+        # The process-wide store keeps each directory's templates (memory-mapped)
+        # and decodes a file again only when it changes on disk
+        tpl = template_store.load_template(path)
+        if tpl is None:
+            raise OSError(f"無法讀取圖片: {path}")
+        return tpl
+
+    def match_full(self, img, tpl_bgr):
+        result = cv2.matchTemplate(img, tpl_bgr, cv2.TM_CCOEFF_NORMED)
+        _, max_val, _, max_loc = cv2.minMaxLoc(result)
+        return max_val, max_loc
+
+    def match_pyramid(self, frame_bgr, tpl, threshold):
+        # Locate candidates on the downscaled frame, then re-score only small
+        # full-resolution windows around them. Hits are always full-resolution
+        # scores; an unclear miss falls back to the full search, so the answer
+        # only differs from match_full when the coarse score is clearly low.
+        coarse_tpl = tpl.coarse(self.pyramid_level)
+        small = self.pyramid_of(frame_bgr, self.pyramid_level)
+        if coarse_tpl is None or small.shape[0] < coarse_tpl[1].shape[0] or small.shape[1] < coarse_tpl[1].shape[1]:
+            return self.match_full(frame_bgr, tpl.bgr)
+
+        trim, small_tpl = coarse_tpl
+        scale = 1 << self.pyramid_level
+        sh, sw = small_tpl.shape[:2]
+        coarse = cv2.matchTemplate(small, small_tpl, cv2.TM_CCOEFF_NORMED)
+        candidates = []
+        for _ in range(self.candidates):
+            _, cval, _, (cx, cy) = cv2.minMaxLoc(coarse)
+            # Map the coarse hit back to the template origin at full resolution
+            candidates.append((cval, (cx - trim) * scale, (cy - trim) * scale))
+            # Suppress this peak before looking for the next candidate
+            coarse[max(cy - sh // 2, 0):cy + sh // 2 + 1, max(cx - sw // 2, 0):cx + sw // 2 + 1] = -1.0
+
+        coarse_best, coarse_x, coarse_y = candidates[0]
+        if coarse_best < threshold - self.coarse_margin:
+            return coarse_best, (max(coarse_x, 0), max(coarse_y, 0))
+
+        th, tw = tpl.bgr.shape[:2]
+        fh, fw = frame_bgr.shape[:2]
+        margin = scale * 2
+        best_val, best_loc = -1.0, (0, 0)
+        for cval, x, y in candidates:
+            if cval < threshold - self.coarse_margin:
+                break
+            x0, y0 = max(x - margin, 0), max(y - margin, 0)
+            x1, y1 = min(x + tw + margin, fw), min(y + th + margin, fh)
+            if x1 - x0 >= tw and y1 - y0 >= th:
+                val, (lx, ly) = self.match_full(frame_bgr[y0:y1, x0:x1], tpl.bgr)
+                if val > best_val:
+                    best_val, best_loc = val, (lx + x0, ly + y0)
+
+        if best_val >= threshold:
+            return best_val, best_loc
+        return self.match_full(frame_bgr, tpl.bgr)
+
+    def mode_of(self, pic2_path, tpl):
+        mode = self.modes.get(os.path.basename(pic2_path), self.default_mode)
+        # A mask without transparent pixels is a plain BGR match (and may use the pyramid)
+        if mode == "mask" and tpl.mask() is None:
+            return "bgr"
+        return mode
+
+    def match_mode(self, img, tpl, mode):
+        # match_full in the template's mode; img is a BGR frame or window
+        if mode == "bgr":
+            return self.match_full(img, tpl.bgr)
+        cache_key = (tpl.path, mode)
+        if self.prepared.get(cache_key, (None,))[0] is not tpl:
+            self.prepared[cache_key] = (tpl, match_modes.prepare(tpl, mode))
+        key, view, mask = self.prepared[cache_key][1]
+        if img is self.frame_bgr:
+            # Whole frames are converted once per view, not once per template
+            if key not in self.frame_views:
+                self.frame_views[key] = match_modes.to_view(img, key)
+            img_view = self.frame_views[key]
+        else:
+            img_view = match_modes.to_view(img, key)
+        return match_modes.match_view(img_view, view, mask)
+
+    def match_hinted(self, frame_bgr, tpl, pic2_path, threshold, mode="bgr"):
+        # Search only around this emulator's last hit of the template; (-1, None) if there is none
+        key = (self.emulator, pic2_path)
+        window = self.hints.window(key, tpl.bgr.shape, (0, 0, frame_bgr.shape[1], frame_bgr.shape[0]))
+        if window is None:
+            return -1.0, None
+        x0, y0, x1, y1 = window
+        val, (lx, ly) = self.match_mode(frame_bgr[y0:y1, x0:x1], tpl, mode)
+        self.hints.count(val >= threshold)
+        if val >= threshold:
+            self.hints.record(key, (lx + x0, ly + y0))
+        return val, (lx + x0, ly + y0)
+
+    def verify(self, cap, pic2_path, threshold=0.98, tolerance=0.01):
+        # Compares the pyramid answer with the full-resolution one for a template
+        frame_bgr = self.frame_to_bgr(cap)
+        tpl = self.template(pic2_path)
+        full_val, full_loc = self.match_full(frame_bgr, tpl.bgr)
+        pyr_val, pyr_loc = self.match_pyramid(frame_bgr, tpl, threshold)
+        same_decision = (full_val >= threshold) == (pyr_val >= threshold)
+        same_hit = full_val < threshold or (full_loc == pyr_loc and abs(full_val - pyr_val) <= tolerance)
+        return {"full": (full_val, full_loc), "pyramid": (pyr_val, pyr_loc), "ok": same_decision and same_hit}
+
+    def __call__(self, cap, pic2_path, threshold=0.98):
+        try:
+            img1_bgr = self.frame_to_bgr(cap)
+            tpl = self.template(pic2_path)
+            
+            mode = self.mode_of(pic2_path, tpl)
+            max_val, max_loc = self.match_hinted(img1_bgr, tpl, pic2_path, threshold, mode)
+            if max_val < threshold:
+                if mode == "bgr" and os.path.basename(pic2_path) in self.pyramid_templates:
+                    max_val, max_loc = self.match_pyramid(img1_bgr, tpl, threshold)
+                else:
+                    max_val, max_loc = self.match_mode(img1_bgr, tpl, mode)
+                if max_val >= threshold:
+                    self.hints.record((self.emulator, pic2_path), max_loc)
+            
+            if self.recorder:
+                self.recorder.frame(self.emulator, img1_bgr)
+                self.recorder.match(self.emulator, template=pic2_path, threshold=threshold, score=round(float(max_val), 4),
+                                    location=list(max_loc) if max_val >= threshold else None)
+
+            # Debug: Print similarity score to console
+            print(f"比對 {os.path.basename(pic2_path)}: 相似度={max_val:.4f} (門檻={threshold})")
+            
+            return max_loc if max_val >= threshold else (0, 0)
+        except Exception as e:
+            print(f"比對錯誤: {e}")
+            return (0, 0)
+
+    def find_first(self, cap, pic2_paths, threshold=0.98):
+        # 回傳第一張找到的 (path, (x, y))，都沒有則 (None, (0, 0))。
+        # 有 index 時依 index 排序比對，同時出現多張時不一定是清單中的第一張
+        if cap is None:
+            # 截圖失敗 (逾時等)，和 __call__ 一樣當作沒找到
+            print("比對錯誤: 沒有截圖")
+            return None, (0, 0)
+        try:
+            frame_bgr = self.frame_to_bgr(cap)
+            candidates = []
+            for path in pic2_paths:
+                try:
+                    tpl = self.template(path)
+                except OSError as e:
+                    print(f"比對錯誤: {e}")
+                    continue
+                if tpl is not None:
+                    candidates.append((path, tpl))
+            if self.index is not None and len(candidates) > 1:
+                candidates = self.index.rank(frame_bgr, candidates)
+        except Exception as e:
+            print(f"比對錯誤: {e}")
+            return None, (0, 0)
+        for position, (path, _) in enumerate(candidates):
+            loc = self(cap, path, threshold)
+            if loc != (0, 0):
+                if self.index is not None and len(candidates) > 1:
+                    self.index.found(position)
+                return path, loc
+        return None, (0, 0)
+
+# ==================== Config 處理 ====================
+def app_dir():
+    # 與 diary_ld.script_dir 相同：Nuitka onefile 用原本 exe 的位置，不是暫存解壓目錄
+    exe_path = sys.argv[0] if sys.argv else sys.executable
+    if exe_path.lower().endswith('.exe'):
+        return os.path.dirname(os.path.abspath(exe_path))
+    elif getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+def default_config_path():
+    # 不需匯入 diary_ld (tkinter) 就能找到 config.ini，例如 session_record 重播
+    return os.path.join(app_dir(), "config.ini")
+
+class DiarySettings:
+    # config.ini [Settings]
+    def __init__(self):
+        self.ld_path = ""
+        self.screenshot_dir = ""
+        self.ld_index = 0
+        self.capture_mode = "raw"
+        self.pyramid_templates = set(PYRAMID_TEMPLATES.split('|'))
+        # 設定後每次執行會錄製截圖/比對/點擊，可用 session_record.py 離線重播
+        self.record_path = ""
+        # 例如 "diary.png:mask|a.png:gray"；未列出的圖片使用 default_match_mode
+        self.match_modes = {}
+        self.default_match_mode = "bgr"
+        # 多張圖片時先比對顏色最接近的 (只改變順序，不排除任何圖片)
+        self.prefilter = True
+
+    @classmethod
+    def load(cls, config_path, detect=True):
+        settings = cls()
+        config = ConfigParser()
+        if os.path.exists(config_path):
+            config.read(config_path)
+            settings.ld_path = config.get("Settings", "ld_path", fallback="")
+            settings.screenshot_dir = config.get("Settings", "screenshot_dir", fallback="")
+            settings.ld_index = config.getint("Settings", "ld_index", fallback=0)
+            settings.capture_mode = config.get("Settings", "capture_mode", fallback="raw")
+            pyramid_templates = config.get("Settings", "pyramid_templates", fallback=PYRAMID_TEMPLATES)
+            settings.pyramid_templates = set(i for i in pyramid_templates.split('|') if i)
+            settings.record_path = config.get("Settings", "record_path", fallback="")
+            settings.match_modes = match_modes.parse_modes(config.get("Settings", "match_modes", fallback=""))
+            default_match_mode = config.get("Settings", "default_match_mode", fallback="bgr")
+            settings.default_match_mode = default_match_mode if default_match_mode in match_modes.MODES else "bgr"
+            settings.prefilter = config.getboolean("Settings", "prefilter", fallback=True)
+
+        # 設定的路徑不存在時從 LDPlayer 安裝目錄與 leidian.config 偵測
+        if detect and (not os.path.exists(settings.ld_path) or not os.path.isdir(settings.screenshot_dir)):
+            auto_ld, auto_scr = ld_discovery.detect_paths(settings.ld_path)
+            if not os.path.exists(settings.ld_path):
+                settings.ld_path = auto_ld or "D:\\LDPlayer\\LDPlayer9\\ld.exe"
+            if not os.path.isdir(settings.screenshot_dir):
+                settings.screenshot_dir = auto_scr
+        return settings
+
+    def save(self, config_path):
+        # 保留 config.ini 其他區段
+        config = ConfigParser()
+        if os.path.exists(config_path):
+            config.read(config_path)
+        config['Settings'] = {
+            'ld_path': self.ld_path,
+            'screenshot_dir': self.screenshot_dir,
+            'ld_index': self.ld_index,
+            'capture_mode': self.capture_mode,
+            'pyramid_templates': '|'.join(sorted(self.pyramid_templates)),
+            'record_path': self.record_path,
+            'match_modes': match_modes.format_modes(self.match_modes),
+            'default_match_mode': self.default_match_mode,
+            'prefilter': str(self.prefilter)
+        }
+        with open(config_path, 'w') as configfile:
+            config.write(configfile)
+
+    def matcher(self):
+        match = CachedMatcher(pyramid_templates=self.pyramid_templates)
+        match.modes = dict(self.match_modes)
+        match.default_mode = self.default_match_mode
+        if not self.prefilter:
+            match.index = None
+        return match
@@ -1,66 +1,37 @@
+import startup_timing
 import tkinter as tk
-from tkinter import filedialog, ttk
-import cv2
-import numpy as np
+from tkinter import filedialog
+import asyncio
+import os
+import sys
 import time
 import threading
-import os
-import subprocess
-from PIL import Image
-from configparser import ConfigParser
-
-# ==================== LdPlayer 控制類 ====================
-class LdPlayerManager:
-    def __init__(self, ld_path, screenshot_dir, index):
-        self.ld_path = ld_path
-        self.screenshot_dir = screenshot_dir
-        self.index = index
-
-    def set_ld_path(self, path):
-        self.ld_path = path
-
-    def set_screenshot_dir(self, path):
-        self.screenshot_dir = path
-
-    def set_index(self, idx):
-        self.index = idx
-
-    def click(self, x, y):
-##        print([self.ld_path, "-s", str(self.index),  "input", "tap", str(x), str(y)])
-        subprocess.run([self.ld_path, "-s", str(self.index),  "input", "tap", str(x), str(y)], creationflags=subprocess.CREATE_NO_WINDOW)
-
-    def screencap(self):
-        filepath =  f"/sdcard/Pictures/cap_{self.index}.png"
-##        print([self.ld_path, "-s", str(self.index), "screencap", filepath])
-        subprocess.run([self.ld_path, "-s", str(self.index), "screencap",  filepath], creationflags=subprocess.CREATE_NO_WINDOW)
-        return Image.open(os.path.join(self.screenshot_dir, f"cap_{self.index}.png"))
-
-# ==================== 匹配函式 ====================
-def match(cap, pic2_path, threshold=0.98):
-    try:
-        # Ensure both images are RGB (drop alpha if exists) to avoid shape mismatch or color errors
-        img1 = np.array(cap.convert('RGB'))
-        pic2 = Image.open(pic2_path).convert('RGB')
-        img2 = np.array(pic2)
-        
-        # Convert to BGR for OpenCV
-        img1_bgr = cv2.cvtColor(img1, cv2.COLOR_RGB2BGR)
-        img2_bgr = cv2.cvtColor(img2, cv2.COLOR_RGB2BGR)
-        
-        result = cv2.matchTemplate(img1_bgr, img2_bgr, cv2.TM_CCOEFF_NORMED)
-        _, max_val, _, max_loc = cv2.minMaxLoc(result)
-        
-        # Debug: Print similarity score to console
-        print(f"比對 {os.path.basename(pic2_path)}: 相似度={max_val:.4f} (門檻={threshold})")
-        
-        return max_loc if max_val >= threshold else (0, 0)
-    except Exception as e:
-        print(f"比對錯誤: {e}")
-        return (0, 0)
+import traceback
+from status_board import StatusBoard, REFRESH_MS
+startup_timing.mark("import tkinter")
+
+# diary_engine (cv2, numpy, 比對器, ...) 與 config.ini 在視窗出現後才於背景載入；見 load_engine()
+diary_engine = None
+# 視窗檢查背景載入是否完成的間隔 (ms)
+PROBE_POLL_MS = 50
+# LdPlayerManager / CachedMatcher 移到 diary_engine；舊的匯入方式仍可使用
+ENGINE_EXPORTS = ("LdPlayerManager", "CachedMatcher", "PYRAMID_TEMPLATES", "DiarySettings")
+
+def load_engine():
+    # 任何執行緒都可呼叫；第二個呼叫者會等待進行中的匯入
+    global diary_engine
+    if diary_engine is None:
+        import diary_engine as module
+        diary_engine = module
+    return diary_engine
+
+def __getattr__(name):
+    if name in ENGINE_EXPORTS:
+        return getattr(load_engine(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # ==================== Config 處理 ====================
 # Detect script directory for Nuitka onefile compatibility
-import sys
 exe_path = sys.argv[0] if sys.argv else sys.executable
 if exe_path.lower().endswith('.exe'):
     # Running as compiled exe - use argv[0] which has the real path
@@ -71,54 +42,56 @@ else:
     script_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in dir() else os.getcwd()
 
 config_path = os.path.join(script_dir, "config.ini")
-config = ConfigParser()
-if os.path.exists(config_path):
-    config.read(config_path)
-    ld_path = config.get("Settings", "ld_path", fallback="D:\\LDPlayer\\LDPlayer9\\ld.exe")
-    screenshot_dir = config.get("Settings", "screenshot_dir", fallback="D:\\Screenshots")
-    ld_index = config.getint("Settings", "ld_index", fallback=0)
-else:
-    ld_path = "D:\\LDPlayer\\LDPlayer9\\ld.exe"
-    screenshot_dir = "D:\\Screenshots"
-    ld_index = 0
-
-ld_manager = LdPlayerManager(ld_path, screenshot_dir, ld_index)
+# 由背景載入填入 (finish_startup)；之前「開始」/「儲存」不動作
+settings = None
+match = None
+ld_manager = None
+ready = False
+probe_result = None
+tb = None
 
 # ==================== GUI ====================
-# ==================== GUI ====================
-import ttkbootstrap as ttk
-from ttkbootstrap.constants import *
-
-app = ttk.Window(themename="cosmo")
-app.title("LDPlayer 自動化腳本")
-# app.geometry("600x550") # Removed fixed size for dynamic resizing
-app.minsize(600, 500) # Set minimum size instead
-
-status_var = tk.StringVar(value="狀態：準備就緒")
-
-# 設定檔 GUI 互動
-ld_path_var = tk.StringVar(value=ld_path)
-screenshot_dir_var = tk.StringVar(value=screenshot_dir)
-index_var = tk.IntVar(value=ld_index)
+# ttkbootstrap (tb) 在 main() 才匯入；只用 diary_engine 的模組 (bench_match.py 等) 不需要它
+from tkinter.constants import *
 
 png_vars = []
+# run_script 在 asyncio 執行緒上更新狀態，GUI 依固定頻率讀取
+status_board = StatusBoard()
+status_version = 0
 running = False
+loop_thread = None
+script_future = None
+# wait_for 輪詢間隔：從 WAIT_POLL 開始，每次沒找到乘上 WAIT_BACKOFF，最多 WAIT_POLL_MAX
+WAIT_POLL = 0.1
+WAIT_POLL_MAX = 0.5
+WAIT_BACKOFF = 1.5
+# 等待次數 / 總秒數 / 逾時次數，停止時顯示
+wait_stats = {"waits": 0, "seconds": 0.0, "timeouts": 0}
 
 def select_ld_path():
     path = filedialog.askopenfilename(title="選擇 ld.exe 路徑", filetypes=[("ld.exe", "*.exe")])
     if path:
         ld_path_var.set(path)
-        ld_manager.set_ld_path(path)
+        if ld_manager:
+            ld_manager.set_ld_path(path)
 
 def select_screenshot_dir():
     path = filedialog.askdirectory(title="選擇截圖資料夾")
     if path:
         screenshot_dir_var.set(path)
-        ld_manager.set_screenshot_dir(path)
+        if ld_manager:
+            ld_manager.set_screenshot_dir(path)
 
 def update_status(msg):
-    status_var.set(msg)
-    status_label.update_idletasks()
+    # 任何執行緒都可呼叫；畫面由 refresh_status 更新
+    status_board.publish(None, msg)
+
+def refresh_status():
+    global status_version
+    status_version, changed = status_board.changes(status_version)
+    if None in changed:
+        status_var.set(changed[None][0])
+    app.after(REFRESH_MS, refresh_status)
 
 def load_png_files():
     # 清除舊的 checkbox (如果有)
@@ -137,7 +110,7 @@ def load_png_files():
     
     for file in png_files:
         var = tk.BooleanVar()
-        chk = ttk.Checkbutton(png_frame, text=file, variable=var, bootstyle="round-toggle")
+        chk = tb.Checkbutton(png_frame, text=file, variable=var, bootstyle="round-toggle")
         chk.grid(row=row_count, column=col_count, sticky='w', padx=10, pady=5)
         png_vars.append((file, var))
         
@@ -146,124 +119,248 @@ def load_png_files():
             col_count = 0
             row_count += 1
 
-def run_script():
-    global running
+async def wait_for(templates, timeout, poll=WAIT_POLL, threshold=0.98, delay=0):
+    # 截圖比對直到 templates 其中之一出現 (依序檢查)，回傳 (template, x, y)；
+    # timeout 秒內沒出現回傳 (None, 0, 0)。timeout=0 只截一次圖。
+    # delay: 先等這麼久再截第一張圖，避免比對到點擊前的畫面 (計入 timeout)
+    if isinstance(templates, str):
+        templates = [templates]
+    start = time.monotonic()
+    deadline = start + timeout
+    if delay:
+        await asyncio.sleep(min(delay, timeout))
+    while running:
+        cap = await ld_manager.screencap()
+        template, (x, y) = match.find_first(cap, templates, threshold)
+        if x:
+            wait_stats["waits"] += 1
+            wait_stats["seconds"] += time.monotonic() - start
+            return template, x, y
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        await asyncio.sleep(min(poll, remaining))
+        poll = min(poll * WAIT_BACKOFF, WAIT_POLL_MAX)
+    wait_stats["waits"] += 1
+    wait_stats["seconds"] += time.monotonic() - start
+    wait_stats["timeouts"] += 1
+    return None, 0, 0
+
+async def run_script():
     ld_manager.set_index(index_var.get())
+    match.emulator = ld_manager.index
     update_status(f"執行模擬器 Index: {index_var.get()}")
     while running:
         selected_pngs = [var[0] for var in png_vars if var[1].get()]
-        ld_manager.click(400, 380)
-        time.sleep(1)
-        cap = ld_manager.screencap()
-        x, y = match(cap, "diary.png", 0.90)
+        png_paths = [os.path.join(script_dir, 'pic', png_file) for png_file in selected_pngs]
+        await ld_manager.click(400, 380)
+        # 每一步最多等原本的固定秒數，畫面一出現就繼續；
+        # 上一步沒有點擊時畫面不會變，只截一次圖
+        template, x, y = await wait_for("diary.png", 1, threshold=0.90)
         if x:
             update_status("點日記本")
-            ld_manager.click(x, y)
-            time.sleep(2)
-        cap = ld_manager.screencap()
-        x, y = match(cap, "ball.png", 0.98)
+            await ld_manager.click(x, y)
+        template, x, y = await wait_for("ball.png", 2 if x else 0)
         if x:
             update_status("點神秘珠子")
-            ld_manager.click(x, y)
-            time.sleep(2)
-        cap = ld_manager.screencap()
-        x, y = match(cap, "check1.png", 0.98)
+            await ld_manager.click(x, y)
+        template, x, y = await wait_for("check1.png", 2 if x else 0)
         if x:
             update_status("確認")
-            ld_manager.click(x + 240, y + 130)
-            time.sleep(2)
-            cap = ld_manager.screencap()
-            x, y = match(cap, "check2.png", 0.98)
-            if x:
-                while running:
-                    for png_file in selected_pngs:
-                        png_path = os.path.join(script_dir, 'pic', png_file)
-                        update_status(f"判斷 {png_file}")
-                        x, y = match(cap, png_path, 0.98)
-                        if x:
-                            update_status(f"製作 {png_file}")
-                            for _ in range(6):
-                                ld_manager.click(405, 357)
-                                time.sleep(1)
-                            break
-                    if x:
-                        break
+            await ld_manager.click(x + 240, y + 130)
+            template, x, y = await wait_for("check2.png", 2)
+            if x and not png_paths:
+                # 沒有勾選目標圖片：和原本一樣不變更也不製作
+                update_status("未勾選目標圖片")
+            elif x:
+                update_status("判斷目標圖片")
+                template, x, y = await wait_for(png_paths, 0)
+                while running and not x:
                     update_status("變更")
-                    ld_manager.click(470, 300)
-                    time.sleep(1.5)
-                    cap = ld_manager.screencap()
+                    await ld_manager.click(470, 300)
+                    # 點擊後的第一張截圖可能還是舊畫面
+                    template, x, y = await wait_for(png_paths, 1.5, delay=WAIT_POLL)
+                if x:
+                    update_status(f"製作 {os.path.basename(template)}")
+                    # 連點製作按鈕，畫面沒有可等待的變化，維持固定間隔
+                    for _ in range(6):
+                        await ld_manager.click(405, 357)
+                        await asyncio.sleep(1)
 
 def start_script():
-    global running
-    if not running:
+    global running, loop_thread, script_future
+    if ready and not running:
         running = True
-        threading.Thread(target=run_script, daemon=True).start()
+        if loop_thread is None:
+            from ld_async import EventLoopThread
+            loop_thread = EventLoopThread()
+        if settings.record_path:
+            from session_record import SessionRecorder
+            match.recorder = SessionRecorder(settings.record_path, "diary")
+        script_future = loop_thread.submit(run_script())
+        script_future.add_done_callback(script_done)
+
+def script_done(future):
+    # run_script 因例外結束 (不是按停止) 時印出錯誤並重設狀態，「開始」才能再次執行
+    global running
+    if future.cancelled() or future.exception() is None:
+        return
+    e = future.exception()
+    traceback.print_exception(type(e), e, e.__traceback__)
+    running = False
+    recorder, match.recorder = match.recorder, None
+    if recorder:
+        recorder.close()
+    update_status(f"狀態：執行錯誤，已停止 ({e})")
 
 def stop_script():
     global running
+    if not ready:
+        return
     running = False
-    update_status("狀態：已停止")
+    # 取消等待中的 sleep / 截圖，不必等到下一輪
+    if script_future is not None:
+        script_future.cancel()
+    if loop_thread is not None:
+        loop_thread.submit(ld_manager.aclose())
+    recorder, match.recorder = match.recorder, None
+    if recorder:
+        recorder.close()
+    hints = match.hints.stats()
+    waits = wait_stats["waits"]
+    average = wait_stats["seconds"] / waits if waits else 0.0
+    ranked = match.index.stats() if match.index else {"hits": 0, "first": 0}
+    update_status(f"狀態：已停止 (位置提示命中 {hints['hits']}/{hints['hits'] + hints['misses']}，"
+                  f"預篩排序第一張命中 {ranked['first']}/{ranked['hits']}，"
+                  f"平均等待 {average:.2f} 秒，逾時 {wait_stats['timeouts']}/{waits})")
+
+def probe():
+    # 不碰視窗的啟動工作，在背景執行緒上
+    global probe_result
+    try:
+        engine = load_engine()
+        startup_timing.mark("import cv2 / matchers")
+        loaded = engine.DiarySettings.load(config_path)
+        startup_timing.mark("config + path detection")
+        matcher = loaded.matcher()
+        manager = engine.LdPlayerManager(loaded.ld_path, loaded.screenshot_dir, loaded.ld_index,
+                                         loaded.capture_mode, matcher=matcher)
+        probe_result = (loaded, matcher, manager)
+    except Exception as e:
+        probe_result = e
+
+def finish_startup():
+    # 在 Tk 執行緒上輪詢 probe() 是否完成，完成後填入視窗
+    global settings, match, ld_manager, ready
+    result = probe_result
+    if result is None:
+        app.after(PROBE_POLL_MS, finish_startup)
+        return
+    if isinstance(result, Exception):
+        update_status(f"狀態：載入失敗: {result}")
+        return
+    settings, match, ld_manager = result
+    ld_path_var.set(settings.ld_path)
+    screenshot_dir_var.set(settings.screenshot_dir)
+    index_var.set(settings.ld_index)
+    ready = True
+    startup_timing.mark("ready")
+    print("啟動時間:")
+    for line in startup_timing.report():
+        print("  " + line)
+    update_status(f"狀態：準備就緒 (啟動 {startup_timing.elapsed():.1f} 秒)")
 
 def save_config():
-    config['Settings'] = {
-        'ld_path': ld_path_var.get(),
-        'screenshot_dir': screenshot_dir_var.get(),
-        'ld_index': index_var.get()
-    }
-    with open(config_path, 'w') as configfile:
-        config.write(configfile)
+    if not ready:
+        return
+    settings.ld_path = ld_path_var.get()
+    settings.screenshot_dir = screenshot_dir_var.get()
+    settings.ld_index = index_var.get()
+    settings.capture_mode = ld_manager.capture_mode
+    settings.pyramid_templates = set(match.pyramid_templates)
+    settings.match_modes = dict(match.modes)
+    settings.default_match_mode = match.default_mode
+    settings.prefilter = match.index is not None
+    settings.save(config_path)
 
 # ==================== GUI Layout Construction ====================
-
-# Main Container with padding
-main_frame = ttk.Frame(app, padding="20")
-main_frame.pack(fill=BOTH, expand=YES)
-
-# --- Settings Group ---
-settings_frame = ttk.Labelframe(main_frame, text="設定 (Settings)", padding="15")
-settings_frame.pack(fill=X, pady=(0, 15))
-
-# Grid layout for settings
-settings_frame.columnconfigure(1, weight=1)
-
-# LDPlayer Path
-ttk.Label(settings_frame, text="LDPlayer 路徑:").grid(row=0, column=0, sticky=W, pady=5)
-ttk.Entry(settings_frame, textvariable=ld_path_var).grid(row=0, column=1, sticky=EW, padx=10, pady=5)
-ttk.Button(settings_frame, text="瀏覽", command=select_ld_path, bootstyle="outline").grid(row=0, column=2, padx=5, pady=5)
-
-# Screenshot Dir
-ttk.Label(settings_frame, text="截圖資料夾:").grid(row=1, column=0, sticky=W, pady=5)
-ttk.Entry(settings_frame, textvariable=screenshot_dir_var).grid(row=1, column=1, sticky=EW, padx=10, pady=5)
-ttk.Button(settings_frame, text="瀏覽", command=select_screenshot_dir, bootstyle="outline").grid(row=1, column=2, padx=5, pady=5)
-
-# Index
-ttk.Label(settings_frame, text="模擬器 Index (0~30):").grid(row=2, column=0, sticky=W, pady=5)
-ttk.Spinbox(settings_frame, from_=0, to=30, textvariable=index_var, width=5).grid(row=2, column=1, sticky=W, padx=10, pady=5)
-
-# --- Target Images Group ---
-target_frame = ttk.Labelframe(main_frame, text="目標圖片 (Target Images)", padding="15")
-target_frame.pack(fill=BOTH, expand=YES, pady=(0, 15))
-
-# Container for checkboxes (png_frame)
-png_frame = ttk.Frame(target_frame)
-png_frame.pack(fill=BOTH, expand=YES)
-
-load_png_files()
-
-# --- Control Group ---
-control_frame = ttk.Frame(main_frame)
-control_frame.pack(fill=X, pady=(0, 10))
-
-# Center the buttons
-button_container = ttk.Frame(control_frame)
-button_container.pack(anchor=CENTER)
-
-ttk.Button(button_container, text="開始執行 (Start)", command=start_script, bootstyle="success", width=15).pack(side=LEFT, padx=5)
-ttk.Button(button_container, text="停止執行 (Stop)", command=stop_script, bootstyle="danger", width=15).pack(side=LEFT, padx=5)
-ttk.Button(button_container, text="儲存設定 (Save)", command=save_config, bootstyle="info-outline", width=15).pack(side=LEFT, padx=5)
-
-# --- Status Bar ---
-status_label = ttk.Label(app, textvariable=status_var, bootstyle="inverse-secondary", anchor=W, padding=(10, 5))
-status_label.pack(side=BOTTOM, fill=X)
-
-app.mainloop()
+def main():
+    # GUI 只在直接執行時建立，匯入此模組 (例如 bench_match.py) 不需要視窗
+    global app, status_var, ld_path_var, screenshot_dir_var, index_var, png_frame, status_label, tb
+
+    import ttkbootstrap as tb
+    startup_timing.mark("import ttkbootstrap")
+    app = tb.Window(themename="cosmo")
+    app.title("LDPlayer 自動化腳本")
+    # app.geometry("600x550") # Removed fixed size for dynamic resizing
+    app.minsize(600, 500) # Set minimum size instead
+
+    status_var = tk.StringVar(value="狀態：載入中...")
+
+    # 設定檔 GUI 互動；值由 finish_startup 填入
+    ld_path_var = tk.StringVar(value="")
+    screenshot_dir_var = tk.StringVar(value="")
+    index_var = tk.IntVar(value=0)
+
+    # Main Container with padding
+    main_frame = tb.Frame(app, padding="20")
+    main_frame.pack(fill=BOTH, expand=YES)
+
+    # --- Settings Group ---
+    settings_frame = tb.Labelframe(main_frame, text="設定 (Settings)", padding="15")
+    settings_frame.pack(fill=X, pady=(0, 15))
+
+    # Grid layout for settings
+    settings_frame.columnconfigure(1, weight=1)
+
+    # LDPlayer Path
+    tb.Label(settings_frame, text="LDPlayer 路徑:").grid(row=0, column=0, sticky=W, pady=5)
+    tb.Entry(settings_frame, textvariable=ld_path_var).grid(row=0, column=1, sticky=EW, padx=10, pady=5)
+    tb.Button(settings_frame, text="瀏覽", command=select_ld_path, bootstyle="outline").grid(row=0, column=2, padx=5, pady=5)
+
+    # Screenshot Dir
+    tb.Label(settings_frame, text="截圖資料夾:").grid(row=1, column=0, sticky=W, pady=5)
+    tb.Entry(settings_frame, textvariable=screenshot_dir_var).grid(row=1, column=1, sticky=EW, padx=10, pady=5)
+    tb.Button(settings_frame, text="瀏覽", command=select_screenshot_dir, bootstyle="outline").grid(row=1, column=2, padx=5, pady=5)
+
+    # Index
+    tb.Label(settings_frame, text="模擬器 Index (0~30):").grid(row=2, column=0, sticky=W, pady=5)
+    tb.Spinbox(settings_frame, from_=0, to=30, textvariable=index_var, width=5).grid(row=2, column=1, sticky=W, padx=10, pady=5)
+
+    # --- Target Images Group ---
+    target_frame = tb.Labelframe(main_frame, text="目標圖片 (Target Images)", padding="15")
+    target_frame.pack(fill=BOTH, expand=YES, pady=(0, 15))
+
+    # Container for checkboxes (png_frame)
+    png_frame = tb.Frame(target_frame)
+    png_frame.pack(fill=BOTH, expand=YES)
+
+    load_png_files()
+
+    # --- Control Group ---
+    control_frame = tb.Frame(main_frame)
+    control_frame.pack(fill=X, pady=(0, 10))
+
+    # Center the buttons
+    button_container = tb.Frame(control_frame)
+    button_container.pack(anchor=CENTER)
+
+    tb.Button(button_container, text="開始執行 (Start)", command=start_script, bootstyle="success", width=15).pack(side=LEFT, padx=5)
+    tb.Button(button_container, text="停止執行 (Stop)", command=stop_script, bootstyle="danger", width=15).pack(side=LEFT, padx=5)
+    tb.Button(button_container, text="儲存設定 (Save)", command=save_config, bootstyle="info-outline", width=15).pack(side=LEFT, padx=5)
+
+    # --- Status Bar ---
+    status_label = tb.Label(app, textvariable=status_var, bootstyle="inverse-secondary", anchor=W, padding=(10, 5))
+    status_label.pack(side=BOTTOM, fill=X)
+    app.after(REFRESH_MS, refresh_status)
+    startup_timing.mark("build window")
+    app.after_idle(lambda: startup_timing.mark("window shown"))
+
+    # 匯入 cv2 / 比對器、讀取 config.ini 與偵測路徑在視窗出現後才進行
+    threading.Thread(target=probe, daemon=True, name="startup-probe").start()
+    app.after(PROBE_POLL_MS, finish_startup)
+
+    app.mainloop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import threading
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+
+# Each slot: an int64 sequence number, padding, then the BGR pixels
+SLOT_HEADER = 64
+
+class FrameRing:
+    # Fixed-size shared-memory ring per emulator. Captures are converted
+    # straight into the next slot and callers get a numpy view of it, so a
+    # frame exists once and other processes read it by (block, offset, seq)
+    # instead of receiving a pickled copy. A slot's sequence number is -1
+    # while it is being written; a reader whose sequence no longer matches
+    # after matching saw a frame that was overwritten and drops the result.
+    # Views are only valid until the ring wraps: keep a copy of anything
+    # that must outlive `slots` further captures of the same emulator.
+    def __init__(self, slots=3):
+        self.slots = max(slots, 2)
+        self.blocks = {}  # emulator -> [SharedMemory, slot_bytes, next seq]
+        self.retired = {}  # emulator -> the block replaced by the last resolution change
+        self.issued = {}  # emulator -> {id(view): (view, ref)} for the last `slots` frames
+        self.lock = threading.Lock()
+
+    def _block(self, emulator, shape):
+        slot_bytes = SLOT_HEADER + int(np.prod(shape))
+        with self.lock:
+            block = self.blocks.get(emulator)
+            if block is None or block[1] < slot_bytes:
+                self.issued[emulator] = {}
+                if block is not None:
+                    # Resolution grew. The old block stays until the next change, so
+                    # a job still queued with a reference to it can attach; readers
+                    # already attached keep their mapping either way
+                    old = self.retired.pop(emulator, None)
+                    if old is not None:
+                        self._release(old)
+                    self.retired[emulator] = block[0]
+                shm = shared_memory.SharedMemory(create=True, size=slot_bytes * self.slots)
+                block = self.blocks[emulator] = [shm, slot_bytes, 0]
+            seq = block[2]
+            block[2] += 1
+            return block[0], block[1], seq
+
+    def write(self, emulator, img, code=None):
+        # Stores img (converted with cv2.cvtColor code, if given) and returns the slot view
+        h, w = img.shape[:2]
+        shape = (h, w, 3)
+        shm, slot_bytes, seq = self._block(emulator, shape)
+        offset = (seq % self.slots) * slot_bytes
+        header = np.ndarray((1,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        view = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset + SLOT_HEADER)
+        header[0] = -1
+        if code is not None:
+            cv2.cvtColor(img, code, dst=view)
+        else:
+            view[...] = img
+        header[0] = seq
+        with self.lock:
+            issued = self.issued.setdefault(emulator, {})
+            issued[id(view)] = (view, (shm.name, offset, seq, shape))
+            while len(issued) > self.slots:
+                del issued[next(iter(issued))]
+        return view
+
+    def locate(self, img):
+        # (block name, offset, seq, shape) if img is a view this ring handed out, else None
+        with self.lock:
+            for issued in self.issued.values():
+                entry = issued.get(id(img))
+                if entry and entry[0] is img:
+                    return entry[1]
+        return None
+
+    def _release(self, shm):
+        try:
+            shm.close()
+        except BufferError:
+            # A view is still referenced somewhere; the mapping goes away with it
+            pass
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        with self.lock:
+            blocks = [block[0] for block in self.blocks.values()] + list(self.retired.values())
+            self.blocks, self.retired, self.issued = {}, {}, {}
+        for shm in blocks:
+            self._release(shm)
+
+# Blocks attached by this (reader) process, by name
+_attached = {}
+
+def attach(name):
+    shm = _attached.get(name)
+    if shm is None:
+        # Pool workers share the creating process's resource tracker, so the
+        # attach adds nothing to clean up: the FrameRing unlinks the block
+        shm = shared_memory.SharedMemory(name=name)
+        _attached[name] = shm
+    return shm
+
+def detach_all():
+    # Closes this process's handles; the blocks themselves belong to the FrameRing
+    while _attached:
+        _, shm = _attached.popitem()
+        try:
+            shm.close()
+        except BufferError:
+            # A frame view is still referenced; the mapping goes with the process
+            pass
+
+def read(ref):
+    # (view, still_valid) for a FrameRing.locate() reference; view is None if already
+    # overwritten. Raises FileNotFoundError if the block has been released.
+    name, offset, seq, shape = ref
+    shm = attach(name)
+    header = np.ndarray((1,), dtype=np.int64, buffer=shm.buf, offset=offset)
+    if header[0] != seq:
+        return None, lambda: False
+    view = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset + SLOT_HEADER)
+    return view, lambda: header[0] == seq
@@ -0,0 +1,284 @@
+import os
+import time
+import struct
+import asyncio
+import threading
+import subprocess
+import numpy as np
+import cv2
+import ldplayer
+import template_store
+
+class AsyncShellSession:
+    # asyncio counterpart of ldplayer.ShellSession: one "adb shell" per emulator
+    def __init__(self, adb, serial, timeout=5):
+        self.adb = adb
+        self.serial = serial
+        self.timeout = timeout
+        self.proc = None
+        self.lock = asyncio.Lock()
+        self.header_size = None
+        # time.monotonic() of the last failed device check / raw capture, else None
+        self.device_failed = None
+        self.raw_failed = None
+
+    def alive(self):
+        return self.proc is not None and self.proc.returncode is None
+
+    def usable(self):
+        return self.device_failed is None or time.monotonic() - self.device_failed >= ldplayer.RETRY_AFTER
+
+    async def connect(self):
+        # See ldplayer.ShellSession.connect: a shell adb could not connect drops every write
+        self.close()
+        if await device_state(self.adb, self.serial, self.timeout) != "device":
+            self.device_failed = time.monotonic()
+            raise OSError(f"{self.serial}: device not reachable over adb")
+        self.device_failed = None
+        self.proc = await asyncio.create_subprocess_exec(
+            self.adb, "-s", self.serial, "shell", stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, creationflags=ldplayer.CREATE_NO_WINDOW)
+
+    def close(self):
+        proc, self.proc = self.proc, None
+        if proc is not None and proc.returncode is None:
+            try: proc.kill()
+            except OSError: pass
+        return proc
+
+    async def aclose(self):
+        # close(), then wait for the shell to exit so its pipes are released on this loop
+        proc = self.close()
+        if proc is not None:
+            try:
+                await asyncio.wait_for(proc.wait(), 1)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _send(self, command):
+        if not self.alive():
+            await self.connect()
+        self.proc.stdin.write((command + "\n").encode("utf-8"))
+        await self.proc.stdin.drain()
+
+    async def _read_exact(self, n):
+        return await asyncio.wait_for(self.proc.stdout.readexactly(n), self.timeout)
+
+    async def run(self, command):
+        # False when the command could not be sent; the caller falls back to ld.exe
+        async with self.lock:
+            for _ in range(2):
+                if not self.usable():
+                    return False
+                try:
+                    await self._send(command)
+                    return True
+                except OSError as e:
+                    print(f"Shell session {self.serial} error: {e}, reconnecting")
+                    self.close()
+            return False
+
+    async def screencap(self):
+        async with self.lock:
+            if not self.usable():
+                return None
+            if self.raw_failed is not None and time.monotonic() - self.raw_failed < ldplayer.RETRY_AFTER:
+                return None
+            if self.header_size is None:
+                # The header length depends on the Android version; learn it once
+                try:
+                    if not self.alive():
+                        await self.connect()
+                except OSError as e:
+                    print(f"Shell session {self.serial} error: {e}")
+                    return None
+                data = await exec_out_screencap(self.adb, self.serial, self.timeout)
+                self.header_size = ldplayer.raw_header_size(data)
+                if self.header_size is None:
+                    print(f"Raw screencap unavailable on {self.serial}, using file capture")
+                    self.raw_failed = time.monotonic()
+                    return None
+                self.raw_failed = None
+
+            for _ in range(2):
+                if not self.usable():
+                    return None
+                try:
+                    await self._send("screencap")
+                    header = await self._read_exact(self.header_size)
+                    w, h, fmt = struct.unpack_from("<III", header)
+                    if fmt not in ldplayer.RAW_FORMATS or not (0 < w <= 8192 and 0 < h <= 8192):
+                        raise ValueError(f"{self.serial}: bad screencap header {w}x{h} fmt={fmt}")
+                    data = await self._read_exact(w * h * 4)
+                    return np.frombuffer(data, dtype=np.uint8).reshape(h, w, 4)
+                except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+                    print(f"Shell session {self.serial} error: {e}, reconnecting")
+                    self.close()
+                except asyncio.CancelledError:
+                    # A half-read frame would desync the stream
+                    self.close()
+                    raise
+            return None
+
+async def device_state(adb, serial, timeout=5):
+    # asyncio counterpart of ldplayer.device_state
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            adb, "-s", serial, "get-state", stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, creationflags=ldplayer.CREATE_NO_WINDOW)
+    except OSError as e:
+        print(f"adb get-state error: {e}")
+        return None
+    try:
+        stdout, _ = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        print(f"adb get-state timeout: {serial}")
+        return None
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+    state = stdout.decode("utf-8", errors="replace").strip()
+    return state if proc.returncode == 0 and state else None
+
+async def exec_out_screencap(adb, serial, timeout=5):
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            adb, "-s", serial, "exec-out", "screencap", stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, creationflags=ldplayer.CREATE_NO_WINDOW)
+    except OSError as e:
+        print(f"Raw screencap error: {e}")
+        return None
+    try:
+        stdout, _ = await asyncio.wait_for(proc.communicate(), timeout)
+        return stdout
+    except asyncio.TimeoutError:
+        print(f"Raw screencap timeout: {serial}")
+        return None
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+
+class AsyncLdPlayerManager:
+    # Same operations as LdPlayerManager, as coroutines with timeouts, so one
+    # event loop can drive every emulator. screencap returns a BGR array.
+    def __init__(self, ld_path, screenshot_dir, index=0, capture_mode="raw", timeout=5, capture_name="trace_cap"):
+        self.ld_path = ld_path
+        self.screenshot_dir = screenshot_dir
+        self.index = index
+        self.capture_mode = capture_mode
+        self.timeout = timeout
+        # File name prefix used by the shared-folder fallback
+        self.capture_name = capture_name
+        # Optional trace_metrics.Metrics; records the PNG decode of file captures
+        self.metrics = None
+        # Optional frame_ring.FrameRing; captures are written into it and returned as views
+        self.frames = None
+        self.sessions = {}
+        self.sessions_adb = None
+
+    def session(self):
+        adb = ldplayer.adb_path_for(self.ld_path) if self.ld_path else None
+        if adb != self.sessions_adb:
+            self.close()
+            self.sessions_adb = adb
+        if not adb:
+            return None
+        if self.index not in self.sessions:
+            self.sessions[self.index] = AsyncShellSession(adb, ldplayer.adb_serial(self.index), self.timeout)
+        return self.sessions[self.index]
+
+    def close(self):
+        sessions, self.sessions = list(self.sessions.values()), {}
+        for session in sessions:
+            session.close()
+
+    async def aclose(self):
+        sessions, self.sessions = list(self.sessions.values()), {}
+        await asyncio.gather(*(session.aclose() for session in sessions))
+
+    async def run_command(self, *args, timeout=None):
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                self.ld_path, "-s", str(self.index), *args, stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL, creationflags=ldplayer.CREATE_NO_WINDOW)
+        except OSError as e:
+            print(f"RunCommand Error: {e}")
+            return None
+        try:
+            return await asyncio.wait_for(proc.wait(), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            print(f"RunCommand Timeout: {args}")
+            return None
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+
+    async def click(self, x, y):
+        session = self.session()
+        if session and await session.run(f"input tap {x} {y}"):
+            return
+        await self.run_command("input", "tap", str(x), str(y))
+
+    async def screencap(self):
+        if self.capture_mode == "raw":
+            session = self.session()
+            # The session already tried exec-out; a failure goes straight to the file capture
+            rgba = await session.screencap() if session else None
+            if rgba is not None:
+                if self.frames:
+                    return self.frames.write(self.index, rgba, cv2.COLOR_RGBA2BGR)
+                return cv2.cvtColor(rgba, cv2.COLOR_RGBA2BGR)
+        img = await self.screencap_file()
+        if img is not None and self.frames:
+            return self.frames.write(self.index, img)
+        return img
+
+    async def screencap_file(self):
+        filename = f"{self.capture_name}_{self.index}.png"
+        local_path = os.path.join(self.screenshot_dir, filename)
+        remote_path = f"/sdcard/Pictures/{filename}"
+
+        if os.path.exists(local_path):
+            try: os.remove(local_path)
+            except OSError: pass
+
+        await self.run_command("screencap", remote_path)
+        # Wait for file to appear (up to timeout)
+        for _ in range(int(self.timeout * 10)):
+            if os.path.exists(local_path):
+                start = time.perf_counter()
+                img = template_store.imread_unicode(local_path)
+                if self.metrics:
+                    self.metrics.observe(self.index, "decode", time.perf_counter() - start)
+                if img is not None:
+                    return img
+            await asyncio.sleep(0.1)
+        return None
+
+class EventLoopThread:
+    # Runs one asyncio loop on a daemon thread so Tk code can submit coroutines to it
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, daemon=True, name="asyncio")
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def submit(self, coro):
+        # Returns a concurrent.futures.Future; cancelling it cancels the task
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call(self, fn, *args):
+        self.loop.call_soon_threadsafe(fn, *args)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def join(self, timeout=None):
+        # After stop(): waits for the loop to finish its current callbacks
+        self.thread.join(timeout)
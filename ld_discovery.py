@@ -0,0 +1,201 @@
+import os
+import re
+import json
+import threading
+from pathlib import Path
+
+# Where LDPlayer 9 is usually installed; PATH is searched after these
+COMMON_PATHS = [
+    r"C:\LDPlayer\LDPlayer9\ld.exe",
+    r"D:\LDPlayer\LDPlayer9\ld.exe",
+    r"E:\LDPlayer\LDPlayer9\ld.exe",
+    r"F:\LDPlayer\LDPlayer9\ld.exe",
+    r"C:\Program Files\LDPlayer\LDPlayer9\ld.exe",
+    r"C:\XuanZhi\LDPlayer9\ld.exe"
+]
+# Install-wide configs holding "picturePath", in the order they are trusted
+GLOBAL_CONFIGS = [
+    "leidian.config",
+    os.path.join("vms", "config", "leidian.config"),
+    os.path.join("vms", "config", "leidians.config")
+]
+# Per-instance configs: vms/config/leidian<index>.config
+INSTANCE_CONFIG = re.compile(r"^leidian(\d+)\.config$", re.IGNORECASE)
+FALLBACK_SCREENSHOT_DIR = r"D:\Screenshots"
+
+class LdInstance:
+    def __init__(self, index, name, picture_path):
+        self.index = index
+        self.name = name
+        self.picture_path = picture_path
+
+class LdInstall:
+    def __init__(self, ld_path, picture_path, instances):
+        self.ld_path = ld_path
+        self.picture_path = picture_path  # "" when no config names an existing folder
+        self.instances = instances  # LdInstance list, by index
+
+    def screenshot_dir(self):
+        # The shared picture folder, else the first instance's that exists
+        if self.picture_path:
+            return self.picture_path
+        for instance in self.instances:
+            if instance.picture_path:
+                return instance.picture_path
+        return ""
+
+# Everything is cached per process. Parsed configs and installs are keyed by
+# the mtimes of the files they came from, so an edited leidian.config (or a
+# new instance) is picked up on the next call without rescanning anything else.
+_lock = threading.Lock()
+_configs = {}  # config path -> (mtime, dict)
+_installs = {}  # ld.exe path -> (signature, LdInstall)
+_located = {}  # (candidates, PATH) -> ld.exe paths found there
+_folders = None  # (Documents, Pictures)
+
+def mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def parse_config(text):
+    # leidian*.config is JSON; a damaged file still gives its "key": "string" pairs
+    try:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            return data
+    except ValueError:
+        pass
+    values = {}
+    for key, raw in re.findall(r'"([^"]+)"\s*:\s*"((?:[^"\\]|\\.)*)"', text):
+        try:
+            values[key] = json.loads(f'"{raw}"')
+        except ValueError:
+            values[key] = raw
+    return values
+
+def read_config(path):
+    stamp = mtime(path)
+    if stamp is None:
+        return {}
+    cached = _configs.get(path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    try:
+        with open(path, 'rb') as f:
+            data = parse_config(f.read().decode('utf-8-sig', errors='replace'))
+    except OSError as e:
+        print(f"Error reading {path}: {e}")
+        data = {}
+    _configs[path] = (stamp, data)
+    return data
+
+def existing_dir(value):
+    return value if isinstance(value, str) and value and os.path.isdir(value) else ""
+
+def install_signature(ld_dir):
+    # mtimes of the global configs, plus vms/config itself for added / removed instances
+    config_dir = os.path.join(ld_dir, "vms", "config")
+    stamps = [mtime(os.path.join(ld_dir, name)) for name in GLOBAL_CONFIGS]
+    stamps.append(mtime(config_dir))
+    if os.path.isdir(config_dir):
+        for name in os.listdir(config_dir):
+            if INSTANCE_CONFIG.match(name):
+                stamps.append((name, mtime(os.path.join(config_dir, name))))
+    return tuple(stamps)
+
+def load_install(ld_path):
+    ld_dir = os.path.dirname(ld_path)
+    signature = install_signature(ld_dir)
+    cached = _installs.get(ld_path)
+    if cached and cached[0] == signature:
+        return cached[1]
+    picture_path = ""
+    for name in GLOBAL_CONFIGS:
+        picture_path = existing_dir(read_config(os.path.join(ld_dir, name)).get("picturePath"))
+        if picture_path:
+            break
+    instances = []
+    config_dir = os.path.join(ld_dir, "vms", "config")
+    if os.path.isdir(config_dir):
+        for name in os.listdir(config_dir):
+            m = INSTANCE_CONFIG.match(name)
+            if not m:
+                continue
+            index = int(m.group(1))
+            data = read_config(os.path.join(config_dir, name))
+            player_name = data.get("statusSettings.playerName") or f"LDPlayer-{index}"
+            instances.append(LdInstance(index, player_name,
+                                        existing_dir(data.get("statusSettings.sharedPictures"))))
+    instances.sort(key=lambda i: i.index)
+    install = LdInstall(ld_path, picture_path, instances)
+    _installs[ld_path] = (signature, install)
+    return install
+
+def locate(candidates=None, path_env=None, refresh=False):
+    # Every ld.exe among candidates and the PATH entries, without duplicates
+    candidates = tuple(COMMON_PATHS if candidates is None else candidates)
+    path_env = os.environ.get("PATH", "") if path_env is None else path_env
+    key = (candidates, path_env)
+    found = None if refresh else _located.get(key)
+    if found is None or not all(os.path.exists(p) for p in found):
+        found = []
+        seen = set()
+        for p in list(candidates) + [os.path.join(d, "ld.exe") for d in path_env.split(os.pathsep) if d]:
+            norm = os.path.normcase(os.path.abspath(p))
+            if norm not in seen and os.path.isfile(p):
+                seen.add(norm)
+                found.append(p)
+        # Nothing found is not cached: LDPlayer may be installed while the tool runs
+        if found:
+            _located[key] = found
+        else:
+            _located.pop(key, None)
+    return list(found)
+
+def discover(current_ld="", candidates=None, path_env=None, refresh=False):
+    # All LDPlayer installs with their instances and picture folders; current_ld first
+    with _lock:
+        if refresh:
+            _configs.clear()
+            _installs.clear()
+        paths = []
+        if current_ld and os.path.isfile(current_ld):
+            paths.append(current_ld)
+        current = os.path.normcase(os.path.abspath(current_ld)) if current_ld else None
+        paths += [p for p in locate(candidates, path_env, refresh)
+                  if os.path.normcase(os.path.abspath(p)) != current]
+        return [load_install(p) for p in paths]
+
+def known_folders():
+    # (Documents, Pictures), looked up once; win32com is slow to import and
+    # only needed when no LDPlayer config names an existing folder
+    global _folders
+    if _folders is None:
+        home = Path.home()
+        docs, pics = str(home / "Documents"), str(home / "Pictures")
+        try:
+            from win32com.shell import shell, shellcon
+            docs = shell.SHGetFolderPath(0, shellcon.CSIDL_PERSONAL, None, 0)
+            pics = shell.SHGetFolderPath(0, shellcon.CSIDL_MYPICTURES, None, 0)
+        except Exception:
+            pass
+        _folders = (docs, pics)
+    return _folders
+
+def fallback_screenshot_dir(folders=None):
+    # LDPlayer's default folders under Documents / Pictures, else FALLBACK_SCREENSHOT_DIR
+    docs, pics = folders or known_folders()
+    for folder in (os.path.join(docs, "XuanZhi9", "Pictures"), os.path.join(pics, "LDPlayer")):
+        if os.path.isdir(folder):
+            return folder
+    return FALLBACK_SCREENSHOT_DIR
+
+def detect_paths(current_ld="", candidates=None, path_env=None, folders=None):
+    # (ld.exe path, screenshot folder); an existing current_ld is kept as it is
+    installs = discover(current_ld, candidates, path_env)
+    if not installs:
+        return "", fallback_screenshot_dir(folders)
+    install = installs[0]
+    return install.ld_path, install.screenshot_dir() or fallback_screenshot_dir(folders)
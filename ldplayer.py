@@ -0,0 +1,304 @@
+import os
+import time
+import struct
+import threading
+import subprocess
+import numpy as np
+
+CREATE_NO_WINDOW = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+
+# RGBA_8888 / RGBX_8888, the formats LDPlayer's screencap produces
+RAW_FORMATS = (1, 2)
+# After a failed device check or raw capture, a session is not tried again for
+# this many seconds; callers use ld.exe / the shared folder meanwhile
+RETRY_AFTER = 30.0
+
+def adb_path_for(ld_path):
+    # LDPlayer ships its own adb.exe next to ld.exe
+    adb = os.path.join(os.path.dirname(ld_path), "adb.exe")
+    return adb if os.path.exists(adb) else None
+
+def adb_serial(index):
+    return f"emulator-{5554 + index * 2}"
+
+def raw_header_size(data):
+    # Header is width, height, format (+ colorspace on Android 9+), then RGBA pixels
+    if not data or len(data) < 12:
+        return None
+    w, h, fmt = struct.unpack_from("<III", data)
+    if fmt not in RAW_FORMATS:
+        return None
+    header = len(data) - w * h * 4
+    return header if header in (12, 16) else None
+
+def decode_raw_screencap(data):
+    header = raw_header_size(data)
+    if header is None:
+        return None
+    w, h, _ = struct.unpack_from("<III", data)
+    return np.frombuffer(data, dtype=np.uint8, count=w * h * 4, offset=header).reshape(h, w, 4)
+
+def exec_out_screencap(adb, serial, timeout=5):
+    try:
+        result = subprocess.run([adb, "-s", serial, "exec-out", "screencap"],
+                                capture_output=True, timeout=timeout, creationflags=CREATE_NO_WINDOW)
+        return result.stdout
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f"Raw screencap error: {e}")
+        return None
+
+def device_state(adb, serial, timeout=5):
+    # "device" when adb reaches the emulator; None when it does not (adb
+    # debugging off, wrong serial, emulator not running)
+    try:
+        result = subprocess.run([adb, "-s", serial, "get-state"], capture_output=True,
+                                timeout=timeout, creationflags=CREATE_NO_WINDOW)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f"adb get-state error: {e}")
+        return None
+    state = result.stdout.decode("utf-8", errors="replace").strip()
+    return state if result.returncode == 0 and state else None
+
+def screencap_raw(ld_path, index, timeout=5):
+    # Stream the framebuffer over stdout: no PNG encode/decode, no shared-folder polling
+    adb = adb_path_for(ld_path)
+    if not adb:
+        return None
+    return decode_raw_screencap(exec_out_screencap(adb, adb_serial(index), timeout))
+
+class ShellSession:
+    # One long-lived "adb shell" per emulator; commands are written to its stdin
+    # instead of spawning a new process for every tap and capture.
+    def __init__(self, adb, serial, timeout=5):
+        self.adb = adb
+        self.serial = serial
+        self.timeout = timeout
+        self.proc = None
+        self.buffer = bytearray()
+        self.cond = threading.Condition()
+        self.lock = threading.Lock()
+        self.header_size = None
+        # time.monotonic() of the last failed device check / raw capture, else None
+        self.device_failed = None
+        self.raw_failed = None
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def usable(self):
+        # False for RETRY_AFTER seconds after adb could not reach the device
+        return self.device_failed is None or time.monotonic() - self.device_failed >= RETRY_AFTER
+
+    def connect(self):
+        # Writes to a shell that adb could not connect succeed and are dropped,
+        # so the device is checked before every (re)connect
+        self.close()
+        if device_state(self.adb, self.serial, self.timeout) != "device":
+            self.device_failed = time.monotonic()
+            raise OSError(f"{self.serial}: device not reachable over adb")
+        self.device_failed = None
+        proc = subprocess.Popen([self.adb, "-s", self.serial, "shell"], stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0,
+                                creationflags=CREATE_NO_WINDOW)
+        with self.cond:
+            self.proc = proc
+            self.buffer = bytearray()
+        threading.Thread(target=self._reader, args=(proc,), daemon=True).start()
+
+    def close(self):
+        with self.cond:
+            proc, self.proc = self.proc, None
+            self.cond.notify_all()
+        if proc is not None:
+            try:
+                proc.kill()
+                proc.stdin.close()
+                proc.wait(1)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+
+    def _reader(self, proc):
+        # The only user of proc.stdout; closes it when the shell goes away
+        try:
+            while True:
+                try:
+                    chunk = proc.stdout.read(65536)
+                except (OSError, ValueError):
+                    chunk = b""
+                with self.cond:
+                    if proc is not self.proc:
+                        return
+                    if not chunk:
+                        self.cond.notify_all()
+                        return
+                    self.buffer += chunk
+                    self.cond.notify_all()
+        finally:
+            proc.stdout.close()
+
+    def _send(self, command):
+        if not self.alive():
+            self.connect()
+        self.proc.stdin.write((command + "\n").encode("utf-8"))
+        self.proc.stdin.flush()
+
+    def _read_exact(self, n):
+        deadline = time.monotonic() + self.timeout
+        with self.cond:
+            while len(self.buffer) < n:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.alive():
+                    raise TimeoutError(f"{self.serial}: expected {n} bytes, got {len(self.buffer)}")
+                self.cond.wait(remaining)
+            data = bytes(self.buffer[:n])
+            del self.buffer[:n]
+        return data
+
+    def run(self, command):
+        # False when the command could not be sent; the caller falls back to ld.exe
+        with self.lock:
+            for _ in range(2):
+                if not self.usable():
+                    return False
+                try:
+                    self._send(command)
+                    return True
+                except OSError as e:
+                    print(f"Shell session {self.serial} error: {e}, reconnecting")
+                    self.close()
+            return False
+
+    def screencap(self):
+        with self.lock:
+            if not self.usable():
+                return None
+            if self.raw_failed is not None and time.monotonic() - self.raw_failed < RETRY_AFTER:
+                return None
+            if self.header_size is None:
+                # The header length depends on the Android version; learn it once
+                try:
+                    if not self.alive():
+                        self.connect()
+                except OSError as e:
+                    print(f"Shell session {self.serial} error: {e}")
+                    return None
+                self.header_size = raw_header_size(exec_out_screencap(self.adb, self.serial, self.timeout))
+                if self.header_size is None:
+                    print(f"Raw screencap unavailable on {self.serial}, using file capture")
+                    self.raw_failed = time.monotonic()
+                    return None
+                self.raw_failed = None
+
+            for _ in range(2):
+                if not self.usable():
+                    return None
+                try:
+                    with self.cond:
+                        self.buffer.clear()
+                    self._send("screencap")
+                    header = self._read_exact(self.header_size)
+                    w, h, fmt = struct.unpack_from("<III", header)
+                    if fmt not in RAW_FORMATS or not (0 < w <= 8192 and 0 < h <= 8192):
+                        raise ValueError(f"{self.serial}: bad screencap header {w}x{h} fmt={fmt}")
+                    data = self._read_exact(w * h * 4)
+                    return np.frombuffer(data, dtype=np.uint8).reshape(h, w, 4)
+                except (OSError, TimeoutError, ValueError) as e:
+                    print(f"Shell session {self.serial} error: {e}, reconnecting")
+                    self.close()
+            return None
+
+class ShellSessionPool:
+    def __init__(self, ld_path):
+        self.adb = adb_path_for(ld_path) if ld_path else None
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def get(self, index):
+        # None when adb is not available; callers fall back to ld.exe
+        if not self.adb:
+            return None
+        with self.lock:
+            session = self.sessions.get(index)
+            if session is None:
+                session = ShellSession(self.adb, adb_serial(index))
+                self.sessions[index] = session
+            return session
+
+    def close_all(self):
+        with self.lock:
+            sessions, self.sessions = list(self.sessions.values()), {}
+        for session in sessions:
+            session.close()
+
+def console_path_for(ld_path):
+    console_path = os.path.join(os.path.dirname(ld_path), "ldconsole.exe")
+    return console_path if os.path.exists(console_path) else ld_path
+
+def parse_list2(stdout):
+    # index,title,top-hwnd,bind-hwnd,android-started,pid,vbox-pid
+    emulators = {}
+    for line in stdout.strip().split('\n'):
+        parts = line.strip().split(',')
+        if len(parts) >= 5 and parts[0].isdigit():
+            emulators[int(parts[0])] = {"name": parts[1], "running": parts[4] == "1"}
+    return emulators
+
+def list_emulators(ld_path, timeout=10):
+    result = subprocess.run([console_path_for(ld_path), "list2"], capture_output=True,
+                            timeout=timeout, creationflags=CREATE_NO_WINDOW)
+    # Try UTF-8 first, then CP950 (Big5)
+    try:
+        stdout = result.stdout.decode('utf-8')
+    except UnicodeDecodeError:
+        stdout = result.stdout.decode('cp950', errors='replace')
+    return parse_list2(stdout)
+
+class EmulatorStatusPoller(threading.Thread):
+    # Runs "ldconsole list2" once per interval and shares the parsed table, so
+    # status checks from many workers cost one subprocess per interval in total.
+    def __init__(self, ld_path, interval=2.0, ttl=None):
+        super().__init__(daemon=True, name="status-poller")
+        self.ld_path = ld_path
+        self.interval = interval
+        self.ttl = ttl if ttl is not None else interval * 2
+        self.states = {}
+        self.updated = 0
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def subscribe(self, callback):
+        # callback(index, running) is called from the poller thread on every change
+        self.listeners.append(callback)
+
+    def poll(self, max_age=0):
+        with self.lock:
+            # Another worker may have refreshed the table while we waited for the lock
+            if max_age and time.monotonic() - self.updated <= max_age:
+                return self.states
+            emulators = list_emulators(self.ld_path)
+            old, self.states = self.states, emulators
+            self.updated = time.monotonic()
+        for index in set(old) | set(emulators):
+            was = old.get(index, {}).get("running", False)
+            now = emulators.get(index, {}).get("running", False)
+            if was != now and old:
+                for callback in self.listeners:
+                    callback(index, now)
+        return emulators
+
+    def is_running(self, index):
+        # Cached answer; only polls inline if the table is older than ttl
+        if time.monotonic() - self.updated > self.ttl:
+            try: self.poll(max_age=self.ttl)
+            except Exception as e: print(f"Status poll error: {e}")
+        return self.states.get(index, {}).get("running", False)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try: self.poll()
+            except Exception as e: print(f"Status poll error: {e}")
+            self.stop_event.wait(self.interval)
+
+    def stop(self):
+        self.stop_event.set()
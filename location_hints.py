@@ -0,0 +1,41 @@
+import threading
+
+class LocationHints:
+    # Last hit location of every (emulator, template). Buttons rarely move, so
+    # matchers search a small window around it first and only fall back to
+    # the full region on a miss.
+    def __init__(self, margin=8):
+        self.margin = margin
+        self.last = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def window(self, key, tpl_shape, bounds):
+        # (x0, y0, x1, y1) around the last hit, clipped to bounds, or None
+        loc = self.last.get(key)
+        if loc is None:
+            return None
+        th, tw = tpl_shape[:2]
+        bx0, by0, bx1, by1 = bounds
+        x0, y0 = max(loc[0] - self.margin, bx0), max(loc[1] - self.margin, by0)
+        x1, y1 = min(loc[0] + tw + self.margin, bx1), min(loc[1] + th + self.margin, by1)
+        if x1 - x0 < tw or y1 - y0 < th:
+            return None
+        return x0, y0, x1, y1
+
+    def record(self, key, loc):
+        with self.lock:
+            self.last[key] = loc
+
+    def count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
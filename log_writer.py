@@ -0,0 +1,114 @@
+import os
+import queue
+import atexit
+import threading
+from datetime import datetime
+
+_CLEAR = object()
+_FLUSH = object()
+
+class LogWriter(threading.Thread):
+    # Callers only put a line on a queue; one background thread keeps the file
+    # open, writes whatever has queued up since its last write in one batch and
+    # rotates the file when it grows past max_bytes (path -> path.1 -> ... -> path.N).
+    def __init__(self, path, max_bytes=5 * 1024 * 1024, backups=3):
+        super().__init__(daemon=True, name="log-writer")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.queue = queue.SimpleQueue()
+        self.file = None
+        self.dropped = 0
+
+    def write(self, msg, emulator=None):
+        now = datetime.now().strftime("%H:%M:%S.%f")[:-3]
+        tag = f"[{now}] [{emulator}] " if emulator is not None else f"[{now}] "
+        self.queue.put(tag + msg + "\n")
+
+    def clear(self):
+        # Truncate the log; queued lines from before the call are dropped
+        self.queue.put(_CLEAR)
+
+    def flush(self, timeout=2.0):
+        # Blocks until everything queued so far is on disk
+        done = threading.Event()
+        self.queue.put((_FLUSH, done))
+        return done.wait(timeout)
+
+    def _open(self, mode="a"):
+        self.file = open(self.path, mode, encoding="utf-8")
+
+    def _close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def _rotate(self):
+        self._close()
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def _write_batch(self, lines):
+        if not lines:
+            return
+        if self.file is None:
+            self._open()
+        self.file.write("".join(lines))
+        self.file.flush()
+        if self.max_bytes and self.file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            lines, waiters = [], []
+            while True:
+                if item is _CLEAR:
+                    lines = []
+                    self._close()
+                    try: self._open("w")
+                    except OSError as e: print(f"Log clear error: {e}")
+                elif isinstance(item, tuple):
+                    waiters.append(item[1])
+                else:
+                    lines.append(item)
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(lines)
+            except OSError as e:
+                self.dropped += len(lines)
+                self._close()
+                print(f"Log write error: {e}")
+            for done in waiters:
+                done.set()
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+def get_writer(path, max_bytes=None, backups=None):
+    # One writer thread per log file per process
+    key = os.path.abspath(path)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            writer = _writers[key] = LogWriter(path)
+            writer.start()
+        if max_bytes is not None:
+            writer.max_bytes = max_bytes
+        if backups is not None:
+            writer.backups = backups
+        return writer
+
+@atexit.register
+def _flush_all():
+    for writer in list(_writers.values()):
+        writer.flush(1.0)
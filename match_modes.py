@@ -0,0 +1,62 @@
+import cv2
+import numpy as np
+
+# Per-template matching modes:
+#   bgr     all three channels (the original behaviour)
+#   gray    luminance only, a third of the data
+#   channel the template's most varied channel only
+#   mask    all three channels, ignoring transparent template pixels
+MODES = ("bgr", "gray", "channel", "mask")
+
+def parse_modes(text):
+    # "a.png:gray|b.png:mask" -> {"a.png": "gray", "b.png": "mask"}
+    modes = {}
+    for item in text.split('|'):
+        name, _, mode = item.rpartition(':')
+        mode = mode.strip().lower()
+        if name and mode in MODES:
+            modes[name.strip()] = mode
+        elif item.strip():
+            print(f"Unknown match mode: {item}")
+    return modes
+
+def format_modes(modes):
+    return '|'.join(f"{name}:{mode}" for name, mode in sorted(modes.items()))
+
+def dominant_channel(bgr):
+    return int(np.argmax(bgr.reshape(-1, 3).std(axis=0)))
+
+def view_key(tpl, mode):
+    # Frames are converted once per view key and shared by every template using it
+    if mode == "gray":
+        return "gray"
+    if mode == "channel":
+        return f"c{dominant_channel(tpl.bgr)}"
+    return "bgr"
+
+def to_view(img, key):
+    if key == "gray":
+        return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    if key.startswith("c"):
+        return np.ascontiguousarray(img[:, :, int(key[1])])
+    return img
+
+def prepare(tpl, mode):
+    # (view key, template array in that view, mask or None) for a template_store.Template
+    key = view_key(tpl, mode)
+    # Without transparent pixels a mask changes nothing, so a plain match is used
+    mask = tpl.mask() if mode == "mask" else None
+    if key == "gray":
+        return key, tpl.gray, None
+    return key, to_view(tpl.bgr, key), mask
+
+def match_view(img_view, tpl_view, mask=None):
+    # TM_CCOEFF_NORMED, with masked pixels left out; returns (max_val, max_loc)
+    if mask is None:
+        res = cv2.matchTemplate(img_view, tpl_view, cv2.TM_CCOEFF_NORMED)
+    else:
+        res = cv2.matchTemplate(img_view, tpl_view, cv2.TM_CCOEFF_NORMED, mask=mask)
+        # Flat windows give inf / nan under a mask
+        res = np.nan_to_num(res, nan=-1.0, posinf=-1.0, neginf=-1.0)
+    _, max_val, _, max_loc = cv2.minMaxLoc(res)
+    return max_val, max_loc
@@ -0,0 +1,98 @@
+import os
+import multiprocessing
+from multiprocessing import util
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import cv2
+import numpy as np
+import frame_ring
+
+# The matcher of this worker process, loaded once by _init_worker
+_matcher = None
+
+def _init_worker(trace_dir, modes, default_mode):
+    global _matcher
+    from trace_engine import ImageMatcher
+    # One OpenCV thread per worker; the pool already spreads jobs over the cores
+    cv2.setNumThreads(1)
+    _matcher = ImageMatcher()
+    _matcher.load_templates(trace_dir)
+    _matcher.set_modes(modes, default_mode)
+    # Run when the pool shuts the worker down; atexit handlers do not run in pool workers
+    util.Finalize(None, frame_ring.detach_all, exitpriority=10)
+
+def _ready():
+    return os.getpid()
+
+def _find_first(region, names, threshold, all_scores):
+    return _matcher.find_first(region, names, threshold, all_scores=all_scores)
+
+def _find_first_shared(ref, names, threshold, search_region, all_scores):
+    # Matches a frame_ring slot in place; a frame overwritten before or during
+    # the match gives a "stale" result instead of a wrong one
+    try:
+        frame, still_valid = frame_ring.read(ref)
+    except FileNotFoundError:
+        # The block was released (two resolution changes since the capture);
+        # the caller still has the frame and matches it itself
+        return {"success": False, "scores": {}, "released": True}
+    if frame is None:
+        return {"success": False, "scores": {}, "stale": True}
+    result = _matcher.find_first(frame, names, threshold, search_region, all_scores=all_scores)
+    if not still_valid():
+        return {"success": False, "scores": {}, "stale": True}
+    return result
+
+class ProcessMatcher:
+    # Drop-in for ImageMatcher.find_first that runs the matching on a pool of
+    # processes, so matches for different emulators use every core instead of
+    # sharing one interpreter. Each worker loads the templates once; a job
+    # only carries the cropped search region and the template names, or with
+    # a frame_ring.FrameRing only the frame's slot reference.
+    def __init__(self, matcher, trace_dir, workers=None, frames=None):
+        self.matcher = matcher
+        self.frames = frames
+        self.workers = workers or os.cpu_count() or 4
+        self.broken = False
+        # spawn everywhere: what Windows does anyway, and no forked copy of the GUI's threads
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_init_worker,
+                                            initargs=(trace_dir, dict(matcher.modes), matcher.default_mode))
+
+    def warm_up(self):
+        # Start the workers now rather than on the first cycles; does not wait for them
+        for _ in range(self.workers):
+            self.executor.submit(_ready)
+
+    def find_first(self, source_img, names, threshold=0.9, search_region=None, emulator=None, all_scores=False):
+        if emulator is not None:
+            # Hint windows are matched here; only the full-region search goes to the pool
+            return self.matcher.with_hints(self.find_first, source_img, names, threshold, search_region, emulator,
+                                           all_scores)
+        if self.broken:
+            return self.matcher.find_first(source_img, names, threshold, search_region, all_scores=all_scores)
+        ref = self.frames.locate(source_img) if self.frames else None
+        if ref is not None:
+            # Matched in place, so locations are already in frame coordinates
+            offset_x = offset_y = 0
+            job = (_find_first_shared, ref, list(names), threshold, search_region, all_scores)
+        else:
+            region, (offset_x, offset_y) = self.matcher.crop_region(source_img, search_region)
+            job = (_find_first, np.ascontiguousarray(region), list(names), threshold, all_scores)
+        try:
+            result = self.executor.submit(*job).result()
+        except BrokenProcessPool as e:
+            # A worker died (or could not start); keep matching in this process
+            print(f"Match pool error, matching in-process: {e}")
+            self.broken = True
+            return self.matcher.find_first(source_img, names, threshold, search_region, all_scores=all_scores)
+        if result.get("released"):
+            return self.matcher.find_first(source_img, names, threshold, search_region, all_scores=all_scores)
+        if result["success"]:
+            x, y = result["location"]
+            result["location"] = (x + offset_x, y + offset_y)
+        return result
+
+    def close(self):
+        # Waits for the workers to exit, so a FrameRing closed afterwards is no longer read
+        self.executor.shutdown(wait=True, cancel_futures=True)
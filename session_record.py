@@ -0,0 +1,314 @@
+import os
+import io
+import sys
+import json
+import time
+import queue
+import struct
+import zipfile
+import argparse
+import threading
+import contextlib
+import cv2
+import numpy as np
+import match_modes
+
+# A recorded session is one zip file:
+#   meta.json         tool, mode and creation time
+#   events/N.jsonl    one JSON object per frame / match / click, in order, in chunks
+#   frames/N.png      the captured frames (or only the search region)
+# PNGs are already compressed, so members are stored as-is.
+# Entries are written (and flushed) as the session runs, so an archive whose
+# recorder never closed (crash, killed process) still has everything up to the
+# last chunk; only the zip's central directory is missing. SessionReader reads
+# such archives from the local entry headers. Version 1 archives kept all events
+# in memory and wrote a single events.jsonl on close.
+ARCHIVE_VERSION = 2
+# Buffered events are written as one entry after this many, or this many seconds
+EVENT_CHUNK = 200
+EVENT_CHUNK_SECONDS = 1.0
+# Zip local file header: signature, version, flags, method, time, date, crc,
+# compressed size, size, name length, extra length
+LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+
+class SessionRecorder(threading.Thread):
+    # Frames are PNG-encoded and written on this thread; callers only queue
+    # references to the arrays (captures are never modified after matching).
+    def __init__(self, path, tool, region=None):
+        super().__init__(daemon=True, name="session-recorder")
+        self.path = path
+        self.tool = tool
+        # (x, y, w, h): store only this part of each frame, e.g. TraceLD's search region
+        self.region = region
+        self.started = time.time()
+        # (frame number, image) or an event dict; None stops the thread
+        self.queue = queue.SimpleQueue()
+        self.frames = 0
+        self.chunks = 0
+        self.last_frame = {}  # emulator -> (frame, frame number)
+        self.lock = threading.Lock()
+        self.zip = zipfile.ZipFile(path, "w", zipfile.ZIP_STORED)
+        meta = {"version": ARCHIVE_VERSION, "tool": self.tool, "created": self.started,
+                "region": list(self.region) if self.region else None}
+        self._write("meta.json", json.dumps(meta).encode("utf-8"))
+        self.start()
+
+    def _event(self, event):
+        event["t"] = round(time.time() - self.started, 4)
+        self.queue.put(event)
+
+    def frame(self, emulator, img):
+        # Records img once, however many matches run against it
+        with self.lock:
+            last = self.last_frame.get(emulator)
+            if last and last[0] is img:
+                return last[1]
+            self.frames += 1
+            number = self.frames
+            self.last_frame[emulator] = (img, number)
+        offset = (0, 0)
+        if self.region:
+            x, y, w, h = self.region
+            if x + w <= img.shape[1] and y + h <= img.shape[0]:
+                img, offset = img[y:y + h, x:x + w], (x, y)
+        self.queue.put((number, img))
+        self._event({"kind": "frame", "emu": emulator, "frame": number, "offset": list(offset),
+                     "shape": list(img.shape)})
+        return number
+
+    def match(self, emulator, **fields):
+        self._event(dict(fields, kind="match", emu=emulator))
+
+    def click(self, emulator, x, y):
+        self._event({"kind": "click", "emu": emulator, "x": int(x), "y": int(y)})
+
+    def _write(self, name, data):
+        # Flushed right away so a crash keeps every finished entry
+        self.zip.writestr(name, data)
+        self.zip.fp.flush()
+
+    def _write_events(self, events):
+        if events:
+            self.chunks += 1
+            data = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in events)
+            self._write(f"events/{self.chunks}.jsonl", data.encode("utf-8"))
+            events.clear()
+
+    def run(self):
+        # Only this thread writes to the zip after __init__
+        events = []
+        deadline = time.monotonic() + EVENT_CHUNK_SECONDS
+        while True:
+            try:
+                item = self.queue.get(timeout=max(deadline - time.monotonic(), 0.01))
+            except queue.Empty:
+                item = ()
+            if item is None:
+                self._write_events(events)
+                return
+            if isinstance(item, dict):
+                events.append(item)
+            elif item:
+                number, img = item
+                ok, data = cv2.imencode(".png", img, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+                if ok:
+                    self._write(f"frames/{number}.png", data.tobytes())
+            if len(events) >= EVENT_CHUNK or time.monotonic() >= deadline:
+                self._write_events(events)
+                deadline = time.monotonic() + EVENT_CHUNK_SECONDS
+
+    def close(self):
+        self.queue.put(None)
+        self.join()
+        self.zip.close()
+
+def scan_entries(path):
+    # name -> (data offset, size) from the local headers of a zip that was never
+    # closed; stops at the first entry that was not completely written
+    entries = {}
+    with open(path, "rb") as f:
+        data = f.read()
+    pos = 0
+    while pos + LOCAL_HEADER.size <= len(data):
+        sig, _, flags, method, _, _, _, csize, size, name_len, extra_len = LOCAL_HEADER.unpack_from(data, pos)
+        if sig != b"PK\x03\x04" or method != zipfile.ZIP_STORED or flags & 0x08:
+            break
+        start = pos + LOCAL_HEADER.size + name_len + extra_len
+        if start + csize > len(data):
+            break
+        name = data[pos + LOCAL_HEADER.size:pos + LOCAL_HEADER.size + name_len].decode("utf-8", errors="replace")
+        entries[name] = (start, csize)
+        pos = start + csize
+    return entries, data
+
+class SessionReader:
+    def __init__(self, path):
+        try:
+            self.zip = zipfile.ZipFile(path, "r")
+            self.names = set(self.zip.namelist())
+            self.truncated = False
+        except zipfile.BadZipFile:
+            # The recorder never closed the archive; read what was written
+            self.zip = None
+            self.entries, self.data = scan_entries(path)
+            self.names = set(self.entries)
+            self.truncated = True
+            print(f"{path}: archive was not closed, reading the {len(self.entries)} complete entries", file=sys.stderr)
+        self.meta = json.loads(self.read("meta.json"))
+        if "events.jsonl" in self.names:
+            chunks = ["events.jsonl"]
+        else:
+            chunks = sorted((n for n in self.names if n.startswith("events/")),
+                            key=lambda n: int(os.path.splitext(os.path.basename(n))[0]))
+        self.events = []
+        for name in chunks:
+            for line in self.read(name).decode("utf-8").splitlines():
+                if line:
+                    self.events.append(json.loads(line))
+        self.meta.setdefault("frames", sum(1 for e in self.events if e["kind"] == "frame"))
+
+    def read(self, name):
+        if self.zip is not None:
+            return self.zip.read(name)
+        start, size = self.entries[name]
+        return self.data[start:start + size]
+
+    def frame(self, number):
+        # None when the frame was not written (archive cut off before it)
+        name = f"frames/{number}.png"
+        if name not in self.names:
+            return None
+        data = np.frombuffer(self.read(name), dtype=np.uint8)
+        return cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+    def matches(self):
+        # (match event, frame event) pairs; the frame is the emulator's latest before the match.
+        # Matches on frames missing from a cut-off archive are left out.
+        last_frame = {}
+        for event in self.events:
+            if event["kind"] == "frame":
+                last_frame[event["emu"]] = event
+            elif event["kind"] == "match" and event["emu"] in last_frame:
+                if f"frames/{last_frame[event['emu']]['frame']}.png" in self.names:
+                    yield event, last_frame[event["emu"]]
+
+def shift(loc, offset):
+    return [loc[0] + offset[0], loc[1] + offset[1]] if loc else None
+
+def replay_trace(reader, trace_dir, include_reused=False, modes=None, default_mode="bgr"):
+    # Runs ImageMatcher.find_first on every recorded frame and compares with the recording
+    from trace_engine import ImageMatcher
+    matcher = ImageMatcher()
+    matcher.load_templates(trace_dir)
+    matcher.set_modes(modes or {}, default_mode)
+    cache = {}
+    times, diffs = [], []
+    for event, frame_event in reader.matches():
+        if event.get("reused") and not include_reused:
+            continue
+        number = frame_event["frame"]
+        if number not in cache:
+            cache = {number: reader.frame(number)}
+        img, offset = cache[number], frame_event["offset"]
+        region = event.get("region")
+        if offset != [0, 0] and region:
+            # Only the region was stored; it already is the search area
+            region = None
+        t0 = time.perf_counter()
+        result = matcher.find_first(img, event["images"], event["threshold"], region)
+        times.append(time.perf_counter() - t0)
+        got = (result.get("name") if result["success"] else None, shift(result.get("location"), offset) if result["success"] else None)
+        want = (event.get("name"), event.get("location"))
+        if got != want:
+            diffs.append({"frame": number, "emu": event["emu"], "recorded": want, "replayed": got})
+    return times, diffs
+
+def resolve_template(path, template_dirs):
+    if os.path.exists(path):
+        return path
+    for directory in template_dirs:
+        candidate = os.path.join(directory, os.path.basename(path))
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+def replay_diary(reader, template_dirs, modes=None, default_mode="bgr"):
+    # Runs diary_ld's matcher on every recorded frame and compares with the recording
+    import diary_engine
+    # Only pyramid_templates is needed from config.ini; skip LDPlayer path detection
+    settings = diary_engine.DiarySettings.load(diary_engine.default_config_path(), detect=False)
+    matcher = diary_engine.CachedMatcher(pyramid_templates=settings.pyramid_templates)
+    matcher.modes = modes or {}
+    matcher.default_mode = default_mode
+    cache = {}
+    times, diffs = [], []
+    for event, frame_event in reader.matches():
+        path = resolve_template(event["template"], template_dirs)
+        if path is None:
+            diffs.append({"frame": frame_event["frame"], "missing_template": event["template"]})
+            continue
+        number = frame_event["frame"]
+        if number not in cache:
+            cache = {number: reader.frame(number)}
+        matcher.emulator = event["emu"]
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            loc = matcher(cache[number], path, event["threshold"])
+            times.append(time.perf_counter() - t0)
+        got = list(loc) if loc != (0, 0) else None
+        if got != event.get("location"):
+            diffs.append({"frame": number, "emu": event["emu"], "template": event["template"],
+                          "recorded": event.get("location"), "replayed": got})
+    return times, diffs
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded session through the matchers, no emulator needed")
+    parser.add_argument("archive")
+    parser.add_argument("--trace-dir", help="TraceLD templates (default: TraceLD_Project/trace)")
+    parser.add_argument("--template-dir", action="append", default=[], help="where to look for diary templates")
+    parser.add_argument("--include-reused", action="store_true", help="also replay frames whose result was reused")
+    parser.add_argument("--repeat", type=int, default=1, help="replay the session this many times")
+    parser.add_argument("--modes", default="", help="match modes to check against the recording, e.g. 'a.png:gray|b.png:mask'")
+    parser.add_argument("--default-mode", default="bgr", choices=match_modes.MODES, help="mode for templates not in --modes")
+    parser.add_argument("--json", help="write the report to this file ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    reader = SessionReader(args.archive)
+    modes = match_modes.parse_modes(args.modes)
+    times, diffs = [], []
+    for _ in range(args.repeat):
+        if reader.meta["tool"] == "trace":
+            t, d = replay_trace(reader, args.trace_dir or os.path.join(base_dir, "TraceLD_Project", "trace"),
+                                args.include_reused, modes, args.default_mode)
+        else:
+            dirs = args.template_dir + [base_dir, os.path.join(base_dir, "pic"), os.path.join(base_dir, "DiaryLD_Project")]
+            t, d = replay_diary(reader, dirs, modes, args.default_mode)
+        times += t
+        diffs += d
+
+    times_ms = np.array(times or [0.0]) * 1000.0
+    report = {
+        "archive": os.path.basename(args.archive),
+        "meta": reader.meta,
+        "truncated": reader.truncated,
+        "matches": len(times),
+        "mean_ms": float(times_ms.mean()),
+        "p50_ms": float(np.percentile(times_ms, 50)),
+        "p95_ms": float(np.percentile(times_ms, 95)),
+        "p99_ms": float(np.percentile(times_ms, 99)),
+        "mismatches": len(diffs),
+        "diffs": diffs[:50]
+    }
+    out = sys.stderr if args.json == "-" else sys.stdout
+    print(f"{report['matches']} matches  mean={report['mean_ms']:.2f}ms p50={report['p50_ms']:.2f}ms "
+          f"p95={report['p95_ms']:.2f}ms p99={report['p99_ms']:.2f}ms  mismatches={report['mismatches']}", file=out)
+    if args.json == "-":
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+    elif args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if diffs else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
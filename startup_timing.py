@@ -0,0 +1,26 @@
+import time
+import threading
+
+# Import this module first in an entry script: its import time is the zero point
+_start = time.perf_counter()
+_marks = []
+_lock = threading.Lock()
+
+def mark(label):
+    # Records label with the time since the previous mark; any thread may call it
+    with _lock:
+        _marks.append((label, time.perf_counter(), threading.current_thread().name))
+
+def elapsed():
+    return time.perf_counter() - _start
+
+def report():
+    # One line per mark: step time, time since start, and the thread it ran on
+    with _lock:
+        marks = list(_marks)
+    lines = []
+    prev = _start
+    for label, at, thread in marks:
+        lines.append(f"{label:<28} {(at - prev) * 1000:8.1f} ms  (at {(at - _start) * 1000:8.1f} ms, {thread})")
+        prev = at
+    return lines
@@ -0,0 +1,27 @@
+import time
+import threading
+
+# How often the GUIs pull the board (milliseconds)
+REFRESH_MS = 200
+
+class StatusBoard:
+    # Latest status message per emulator (key None = overall status). Workers
+    # overwrite their own entry from any thread; the GUI asks for the entries
+    # that changed since its last refresh, so a busy cycle costs one dict
+    # write per message instead of one Tk callback.
+    def __init__(self):
+        self.entries = {}  # key -> (version, message, timestamp)
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def publish(self, key, msg):
+        with self.lock:
+            self.version += 1
+            self.entries[key] = (self.version, msg, time.time())
+
+    def changes(self, since=0):
+        # Returns (version, {key: (message, timestamp)}) for entries newer than since
+        with self.lock:
+            changed = {key: (msg, ts) for key, (version, msg, ts) in self.entries.items() if version > since}
+            return self.version, changed
+
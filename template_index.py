@@ -0,0 +1,64 @@
+import threading
+import numpy as np
+
+class TemplateIndex:
+    # Orders library templates so the likely ones get the exact match first.
+    # Nothing is ruled out: every template still gets its exact match unless an
+    # earlier one hits, so a true match is never lost to the index.
+    # Each template keeps its `top` most common colours (quantized to `bits`
+    # per channel); its rank is how much of those colours the frame has, as a
+    # fraction of what the template has (1.0 = every colour fully present).
+    # This is only a heuristic: TM_CCOEFF_NORMED ignores brightness and
+    # contrast, so a dimmed or brightened copy can still match while its
+    # colours land in other bins; such a template is ranked low, not dropped.
+    def __init__(self, bits=3, top=4):
+        self.bits = bits
+        self.top = top
+        self.signatures = {}  # path -> (Template, colour bins, pixel counts)
+        self.frame = None
+        self.frame_counts = None
+        self.hits = 0
+        self.first = 0
+        self.lock = threading.Lock()
+
+    def quantize(self, bgr):
+        shift = 8 - self.bits
+        q = (bgr.reshape(-1, 3) >> shift).astype(np.int32)
+        return (q[:, 0] << (2 * self.bits)) | (q[:, 1] << self.bits) | q[:, 2]
+
+    def signature(self, path, tpl):
+        cached = self.signatures.get(path)
+        if cached is None or cached[0] is not tpl:
+            counts = np.bincount(self.quantize(tpl.bgr), minlength=1 << (3 * self.bits))
+            bins = np.argsort(counts)[::-1][:self.top]
+            bins = bins[counts[bins] > 0]
+            cached = self.signatures[path] = (tpl, bins, counts[bins])
+        return cached[1], cached[2]
+
+    def counts_of(self, frame_bgr):
+        # Colour histogram of the frame, once per frame
+        if frame_bgr is not self.frame:
+            self.frame_counts = np.bincount(self.quantize(frame_bgr), minlength=1 << (3 * self.bits))
+            self.frame = frame_bgr
+        return self.frame_counts
+
+    def coverage(self, frame_bgr, path, tpl):
+        bins, counts = self.signature(path, tpl)
+        if not len(bins):
+            return 1.0
+        return float(np.min(np.minimum(self.counts_of(frame_bgr)[bins] / counts, 1.0)))
+
+    def rank(self, frame_bgr, templates):
+        # All (path, tpl) pairs, most likely first; ties keep their order
+        return sorted(templates, key=lambda item: -self.coverage(frame_bgr, *item))
+
+    def found(self, position):
+        # The exact match hit the template ranked at position
+        with self.lock:
+            self.hits += 1
+            if position == 0:
+                self.first += 1
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "first": self.first}
@@ -0,0 +1,273 @@
+import os
+import json
+import time
+import uuid
+import threading
+import cv2
+import numpy as np
+
+# Decoded templates are kept next to the images in STORE_DIR as one flat
+# uint8 data file (memory-mapped on load) plus a JSON index keyed by file
+# name, size and mtime. Only new or modified PNGs are decoded again.
+STORE_DIR = ".template_store"
+INDEX_FILE = "index.json"
+STORE_VERSION = 2
+PYRAMID_LEVELS = 2
+MIN_PYRAMID_SIZE = 8
+# Seconds an unreferenced data file is kept, so one another process has just
+# written (and not yet named in its index) is not removed under it
+UNREFERENCED_GRACE = 60.0
+
+def imread_unicode(path, flags=cv2.IMREAD_COLOR):
+    try:
+        # Support Chinese characters in path
+        return cv2.imdecode(np.fromfile(path, dtype=np.uint8), flags)
+    except Exception as e:
+        print(f"Error reading {path}: {e}")
+        return None
+
+def coarse_template(bgr, level, reduced=None):
+    # pyrDown copy of a template for coarse search, with the border (blurred
+    # against pyrDown's edge padding instead of the real surroundings) trimmed
+    # off. reduced is bgr already pyrDown'ed level times, e.g. a stored pyramid
+    # level. Returns (trim, image), or None if the template is too small.
+    img = reduced
+    if img is None:
+        img = bgr
+        for _ in range(level):
+            img = cv2.pyrDown(img)
+    img = img[level:-level, level:-level]
+    if img.shape[0] < MIN_PYRAMID_SIZE or img.shape[1] < MIN_PYRAMID_SIZE:
+        return None
+    return level, img
+
+def build_pyramid(img, levels=PYRAMID_LEVELS):
+    pyramid = []
+    for _ in range(levels):
+        if img.shape[0] < MIN_PYRAMID_SIZE * 2 or img.shape[1] < MIN_PYRAMID_SIZE * 2:
+            break
+        img = cv2.pyrDown(img)
+        pyramid.append(img)
+    return pyramid
+
+class Template:
+    def __init__(self, name, path, bgr, gray, pyramid, alpha=None):
+        self.name = name
+        self.path = path
+        self.bgr = bgr
+        self.gray = gray
+        self.pyramid = pyramid  # pyrDown levels of bgr, index 0 = half size
+        self.alpha = alpha      # alpha channel of RGBA PNGs, else None
+        self.coarse_cache = {}
+
+    def mask(self):
+        # 0/255 mask of the opaque pixels, or None when nothing is transparent
+        if self.alpha is None or self.alpha.min() == 255:
+            return None
+        if "mask" not in self.coarse_cache:
+            self.coarse_cache["mask"] = np.where(self.alpha > 0, 255, 0).astype(np.uint8)
+        return self.coarse_cache["mask"]
+
+    def coarse(self, level):
+        # From the stored pyramid when it goes that deep (memory-mapped, no pyrDown)
+        if level not in self.coarse_cache:
+            reduced = self.pyramid[level - 1] if 0 < level <= len(self.pyramid) else None
+            self.coarse_cache[level] = coarse_template(self.bgr, level, reduced)
+        return self.coarse_cache[level]
+
+    def arrays(self):
+        arrays = {"bgr": self.bgr, "gray": self.gray}
+        if self.alpha is not None:
+            arrays["alpha"] = self.alpha
+        for i, level in enumerate(self.pyramid):
+            arrays[f"pyr{i + 1}"] = level
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, name, path, arrays):
+        pyramid = []
+        while f"pyr{len(pyramid) + 1}" in arrays:
+            pyramid.append(arrays[f"pyr{len(pyramid) + 1}"])
+        return cls(name, path, arrays["bgr"], arrays["gray"], pyramid, arrays.get("alpha"))
+
+    @classmethod
+    def decode(cls, path, pyramid_levels=PYRAMID_LEVELS):
+        img = imread_unicode(path, cv2.IMREAD_UNCHANGED)
+        if img is None:
+            return None
+        alpha = None
+        if img.ndim == 2:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+        elif img.shape[2] == 4:
+            alpha = np.ascontiguousarray(img[:, :, 3])
+            img = np.ascontiguousarray(img[:, :, :3])
+        if img.dtype != np.uint8:
+            # 16-bit PNGs; IMREAD_COLOR used to do this conversion
+            img = (img // 257).astype(np.uint8)
+            if alpha is not None:
+                alpha = (alpha // 257).astype(np.uint8)
+        bgr = img
+        gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+        return cls(os.path.basename(path), path, bgr, gray, build_pyramid(bgr, pyramid_levels), alpha)
+
+class TemplateStore:
+    def __init__(self, directory, pyramid_levels=PYRAMID_LEVELS):
+        self.directory = directory
+        self.pyramid_levels = pyramid_levels
+        self.store_dir = os.path.join(directory, STORE_DIR)
+        self.templates = {}
+        self.stamps = {}  # name -> (size, mtime_ns) of the decoded file
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def _stamp(self, path):
+        st = os.stat(path)
+        return (st.st_size, st.st_mtime_ns)
+
+    def _read_index(self):
+        index_path = os.path.join(self.store_dir, INDEX_FILE)
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if index.get("version") != STORE_VERSION or index.get("pyramid_levels") != self.pyramid_levels:
+                return {}
+            data = np.memmap(os.path.join(self.store_dir, index["data"]), dtype=np.uint8, mode="r")
+        except (OSError, ValueError, KeyError):
+            return {}
+        self._remove_unreferenced(index["data"], index_path)
+
+        stored = {}
+        for name, info in index.get("files", {}).items():
+            arrays = {}
+            for key, (offset, shape) in info["arrays"].items():
+                size = int(np.prod(shape))
+                arrays[key] = data[offset:offset + size].reshape(shape)
+            stored[name] = (tuple(info["stamp"]), arrays)
+        return stored
+
+    def _write_index(self, stamps, templates):
+        os.makedirs(self.store_dir, exist_ok=True)
+        data_name = f"data-{uuid.uuid4().hex[:8]}.bin"
+        files = {}
+        offset = 0
+        with open(os.path.join(self.store_dir, data_name), "wb") as f:
+            for name, tpl in templates.items():
+                arrays = {}
+                for key, arr in tpl.arrays().items():
+                    f.write(np.ascontiguousarray(arr).tobytes())
+                    arrays[key] = [offset, list(arr.shape)]
+                    offset += arr.size
+                files[name] = {"stamp": list(stamps[name]), "arrays": arrays}
+
+        index = {
+            "version": STORE_VERSION,
+            "pyramid_levels": self.pyramid_levels,
+            "data": data_name,
+            "files": files
+        }
+        tmp_path = os.path.join(self.store_dir, INDEX_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.store_dir, INDEX_FILE))
+
+    def _remove_unreferenced(self, data_name, index_path):
+        # Data files the index no longer names, left by an earlier write. Not
+        # removed in _write_index: another running tool may still have the old
+        # file mapped, so it waits until the next load (and on Windows, until
+        # nothing maps it). Only files older than the index and the grace
+        # period go: a newer one may be another process's write whose index
+        # is not in place yet.
+        try:
+            index_mtime = os.stat(index_path).st_mtime
+        except OSError:
+            return
+        cutoff = min(index_mtime, time.time() - UNREFERENCED_GRACE)
+        for file in os.listdir(self.store_dir):
+            if file.startswith("data-") and file != data_name:
+                path = os.path.join(self.store_dir, file)
+                try:
+                    if os.stat(path).st_mtime < cutoff:
+                        os.remove(path)
+                except OSError: pass
+
+    def load(self):
+        with self.lock:
+            if not os.path.isdir(self.directory):
+                self.templates, self.stamps = {}, {}
+                return self.templates
+
+            stored = self._read_index()
+            templates, stamps = {}, {}
+            changed = False
+            for file in os.listdir(self.directory):
+                if not file.lower().endswith(".png"):
+                    continue
+                path = os.path.join(self.directory, file)
+                stamp = self._stamp(path)
+                if file in stored and stored[file][0] == stamp:
+                    templates[file] = Template.from_arrays(file, path, stored[file][1])
+                else:
+                    tpl = Template.decode(path, self.pyramid_levels)
+                    if tpl is None:
+                        continue
+                    templates[file] = tpl
+                    changed = True
+                stamps[file] = stamp
+
+            if changed or set(stored) != set(templates):
+                try:
+                    self._write_index(stamps, templates)
+                except OSError as e:
+                    print(f"Template store write error: {e}")
+
+            self.templates, self.stamps = templates, stamps
+            self.loaded = True
+            return self.templates
+
+    def _update(self, name, path, stamp):
+        # Re-decodes one new or modified file; the others keep their arrays
+        with self.lock:
+            if self.stamps.get(name) == stamp:
+                return
+            tpl = Template.decode(path, self.pyramid_levels)
+            if tpl is None:
+                return
+            # New dicts, so a caller iterating what load() returned is not disturbed
+            templates, stamps = dict(self.templates), dict(self.stamps)
+            templates[name], stamps[name] = tpl, stamp
+            try:
+                self._write_index(stamps, templates)
+            except OSError as e:
+                print(f"Template store write error: {e}")
+            self.templates, self.stamps = templates, stamps
+
+    def get(self, name):
+        # Single-file lookup; the directory is loaded once, then only a file
+        # that changed on disk is decoded again
+        path = os.path.join(self.directory, name)
+        try:
+            stamp = self._stamp(path)
+        except OSError:
+            return None
+        if not self.loaded:
+            self.load()
+        if self.stamps.get(name) != stamp:
+            self._update(name, path, stamp)
+        return self.templates.get(name)
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def open_store(directory, pyramid_levels=PYRAMID_LEVELS):
+    # One store per directory per process, shared by every matcher
+    key = (os.path.normcase(os.path.abspath(directory)), pyramid_levels)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = TemplateStore(directory, pyramid_levels)
+            _stores[key] = store
+        return store
+
+def load_template(path):
+    directory, name = os.path.split(os.path.abspath(path))
+    return open_store(directory).get(name)
@@ -0,0 +1,59 @@
+import cv2
+import numpy as np
+import pytest
+import match_modes
+from trace_engine import ImageMatcher
+
+def textured(rng, h, w):
+    img = rng.integers(0, 255, (h // 3 + 1, w // 3 + 1, 3), dtype=np.uint8)
+    return cv2.resize(img, (w, h), interpolation=cv2.INTER_CUBIC)
+
+@pytest.fixture
+def scene():
+    rng = np.random.default_rng(11)
+    frame = textured(rng, 240, 320)
+    # Two templates of one size (scored as a group) and one of another size
+    templates = {"a.png": textured(rng, 24, 32), "b.png": textured(rng, 24, 32), "c.png": textured(rng, 30, 18)}
+    frame[40:64, 60:92] = templates["a.png"]
+    frame[150:180, 200:218] = templates["c.png"]
+    return frame, templates
+
+def reference(region, tpl, key="bgr"):
+    _, score, _, loc = cv2.minMaxLoc(cv2.matchTemplate(match_modes.to_view(region, key),
+                                                       match_modes.to_view(tpl, key), cv2.TM_CCOEFF_NORMED))
+    return score, loc
+
+@pytest.mark.parametrize("search_region", [None, (30, 20, 250, 200)])
+def test_find_all_equals_match_template(scene, search_region):
+    frame, templates = scene
+    matcher = ImageMatcher()
+    matcher.template_cache.update(templates)
+    region, (ox, oy) = matcher.crop_region(frame, search_region)
+    results = matcher.find_all(frame, list(templates), 0.9, search_region)
+    assert [r["name"] for r in results] == list(templates)
+    for r in results:
+        score, (x, y) = reference(region, templates[r["name"]])
+        assert r["score"] == pytest.approx(score, abs=1e-4)
+        assert r["location"] == (x + ox, y + oy)
+        assert r["success"] == (score >= 0.9)
+    assert [r["success"] for r in results] == [True, False, True]
+
+def test_find_all_gray_mode(scene, tmp_path):
+    frame, templates = scene
+    for name, tpl in templates.items():
+        cv2.imwrite(str(tmp_path / name), tpl)
+    matcher = ImageMatcher()
+    matcher.load_templates(str(tmp_path))
+    matcher.set_modes({"a.png": "gray", "c.png": "gray"})
+    for r in matcher.find_all(frame, ["a.png", "b.png", "c.png"], 0.9):
+        key = "gray" if r["name"] != "b.png" else "bgr"
+        score, loc = reference(frame, templates[r["name"]], key)
+        assert r["score"] == pytest.approx(score, abs=1e-4)
+        assert r["location"] == loc
+
+def test_find_all_skips_unknown_and_oversized(scene):
+    frame, templates = scene
+    matcher = ImageMatcher()
+    matcher.template_cache.update(templates)
+    assert [r["name"] for r in matcher.find_all(frame, ["missing.png", "c.png"], 0.9)] == ["c.png"]
+    assert matcher.find_all(frame, ["a.png"], 0.9, (0, 0, 20, 20)) == []
@@ -0,0 +1,22 @@
+import numpy as np
+import frame_ring
+import match_pool
+
+def test_old_block_survives_one_resolution_change():
+    ring = frame_ring.FrameRing(slots=2)
+    try:
+        small = ring.write(0, np.full((4, 6, 3), 7, np.uint8))
+        ref = ring.locate(small)
+        ring.write(0, np.zeros((8, 12, 3), np.uint8))
+        frame, still_valid = frame_ring.read(ref)
+        assert frame is not None and still_valid()
+        assert (frame == 7).all()
+        del frame
+        frame_ring.detach_all()
+        # A second change releases it; the worker reports that instead of failing
+        ring.write(0, np.zeros((16, 24, 3), np.uint8))
+        result = match_pool._find_first_shared(ref, ["a.png"], 0.9, None, False)
+        assert result["released"] and not result["success"]
+    finally:
+        frame_ring.detach_all()
+        ring.close()
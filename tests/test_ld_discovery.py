@@ -0,0 +1,83 @@
+import os
+import json
+import ld_discovery
+
+def make_install(root, picture_path="", instances=()):
+    # ld.exe with leidian.config and vms/config/leidian<index>.config
+    ld_dir = root / "LDPlayer9"
+    (ld_dir / "vms" / "config").mkdir(parents=True)
+    ld_path = ld_dir / "ld.exe"
+    ld_path.write_bytes(b"")
+    (ld_dir / "leidian.config").write_text(json.dumps({"picturePath": picture_path}), encoding="utf-8")
+    for index, name, shared in instances:
+        data = {"statusSettings.playerName": name, "statusSettings.sharedPictures": shared}
+        (ld_dir / "vms" / "config" / f"leidian{index}.config").write_text(json.dumps(data), encoding="utf-8")
+    return str(ld_path)
+
+def bump_mtime(path):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+def test_json_config(tmp_path):
+    pictures = tmp_path / "pictures"
+    pictures.mkdir()
+    ld_path = make_install(tmp_path, str(pictures), [(1, "second", ""), (0, "main", str(pictures))])
+    install, = ld_discovery.discover(candidates=[ld_path], path_env="")
+    assert install.ld_path == ld_path
+    assert install.picture_path == str(pictures)
+    assert [(i.index, i.name) for i in install.instances] == [(0, "main"), (1, "second")]
+    assert ld_discovery.detect_paths(candidates=[ld_path], path_env="", folders=(str(tmp_path), str(tmp_path))) == (ld_path, str(pictures))
+
+def test_regex_fallback():
+    text = '{"picturePath": "D:\\\\Pics", "statusSettings.playerName": "a \\"b\\"", broken'
+    assert ld_discovery.parse_config(text) == {"picturePath": "D:\\Pics", "statusSettings.playerName": 'a "b"'}
+
+def test_damaged_config_still_names_folder(tmp_path):
+    pictures = tmp_path / "pictures"
+    pictures.mkdir()
+    ld_path = make_install(tmp_path)
+    text = '{"picturePath": ' + json.dumps(str(pictures)) + ', "x": '
+    (tmp_path / "LDPlayer9" / "leidian.config").write_text(text, encoding="utf-8")
+    install, = ld_discovery.discover(candidates=[ld_path], path_env="")
+    assert install.screenshot_dir() == str(pictures)
+
+def test_mtime_invalidates_cache(tmp_path):
+    first, second = tmp_path / "first", tmp_path / "second"
+    first.mkdir()
+    second.mkdir()
+    ld_path = make_install(tmp_path, str(first))
+    assert ld_discovery.discover(candidates=[ld_path], path_env="")[0].picture_path == str(first)
+
+    config = tmp_path / "LDPlayer9" / "leidian.config"
+    config.write_text(json.dumps({"picturePath": str(second)}), encoding="utf-8")
+    bump_mtime(config)
+    assert ld_discovery.discover(candidates=[ld_path], path_env="")[0].picture_path == str(second)
+
+    # A new instance config changes the install's signature too
+    instance = tmp_path / "LDPlayer9" / "vms" / "config" / "leidian3.config"
+    instance.write_text(json.dumps({"statusSettings.playerName": "new"}), encoding="utf-8")
+    bump_mtime(instance.parent)
+    assert [i.name for i in ld_discovery.discover(candidates=[ld_path], path_env="")[0].instances] == ["new"]
+
+def test_empty_result_not_cached(tmp_path):
+    ld_dir = tmp_path / "later"
+    candidates = [str(ld_dir / "ld.exe")]
+    path_env = os.pathsep.join([str(tmp_path / "bin"), ""])
+    assert ld_discovery.locate(candidates, path_env) == []
+    # Installed while the tool is running
+    ld_dir.mkdir()
+    (ld_dir / "ld.exe").write_bytes(b"")
+    assert ld_discovery.locate(candidates, path_env) == candidates
+
+def test_path_env_searched_after_candidates(tmp_path):
+    ld_path = make_install(tmp_path)
+    path_env = os.pathsep.join([os.path.dirname(ld_path), os.path.dirname(ld_path)])
+    assert ld_discovery.locate([], path_env) == [ld_path]
+    assert ld_discovery.locate([ld_path], path_env) == [ld_path]
+
+def test_fallback_screenshot_dir(tmp_path):
+    assert ld_discovery.detect_paths(candidates=[], path_env="", folders=(str(tmp_path), str(tmp_path))) == \
+        ("", ld_discovery.FALLBACK_SCREENSHOT_DIR)
+    pictures = tmp_path / "LDPlayer"
+    pictures.mkdir()
+    assert ld_discovery.fallback_screenshot_dir((str(tmp_path / "docs"), str(tmp_path))) == str(pictures)
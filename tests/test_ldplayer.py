@@ -0,0 +1,121 @@
+import os
+import sys
+import time
+import struct
+import asyncio
+import numpy as np
+import pytest
+import ldplayer
+import ld_async
+import trace_engine
+
+def raw(w, h, fmt=1, header=16):
+    pixels = np.arange(w * h * 4, dtype=np.uint32).astype(np.uint8)
+    head = struct.pack("<III", w, h, fmt) + b"\0" * (header - 12)
+    return head + pixels.tobytes(), pixels.reshape(h, w, 4)
+
+def test_parse_list2():
+    stdout = ("0,LDPlayer,131844,262918,1,4321,5678\r\n"
+              "1,雷電模擬器-1,0,0,0,-1,-1\r\n"
+              "\r\n"
+              "garbage line\r\n"
+              "2,short,0\r\n")
+    assert ldplayer.parse_list2(stdout) == {
+        0: {"name": "LDPlayer", "running": True},
+        1: {"name": "雷電模擬器-1", "running": False}
+    }
+    assert ldplayer.parse_list2("") == {}
+
+def test_raw_header_size():
+    assert ldplayer.raw_header_size(raw(4, 3, header=12)[0]) == 12
+    assert ldplayer.raw_header_size(raw(4, 3, header=16)[0]) == 16
+    assert ldplayer.raw_header_size(raw(4, 3, fmt=2)[0]) == 16
+
+def test_raw_header_size_rejects():
+    data, _ = raw(4, 3)
+    assert ldplayer.raw_header_size(None) is None
+    assert ldplayer.raw_header_size(b"") is None
+    assert ldplayer.raw_header_size(data[:11]) is None
+    # Unknown pixel format, truncated pixels, unexpected header length
+    assert ldplayer.raw_header_size(raw(4, 3, fmt=5)[0]) is None
+    assert ldplayer.raw_header_size(data[:-1]) is None
+    assert ldplayer.raw_header_size(raw(4, 3, header=20)[0]) is None
+
+def test_decode_raw_screencap():
+    for header in (12, 16):
+        data, pixels = raw(5, 2, header=header)
+        img = ldplayer.decode_raw_screencap(data)
+        assert img.shape == (2, 5, 4)
+        assert np.array_equal(img, pixels)
+    assert ldplayer.decode_raw_screencap(b"\0" * 8) is None
+
+def fake_tools(tmp_path, adb_body):
+    # ld.exe and adb.exe stand-ins that append their arguments to calls.txt
+    log = tmp_path / "calls.txt"
+    for name, body in (("ld.exe", ""), ("adb.exe", adb_body)):
+        script = tmp_path / name
+        script.write_text(f"#!{sys.executable}\nimport sys, time\n"
+                          f"open({str(log)!r}, 'a').write('{name} ' + ' '.join(sys.argv[1:]) + '\\n')\n" + body)
+        script.chmod(0o755)
+    return str(tmp_path / "ld.exe"), log
+
+# adb that cannot reach the emulator, e.g. adb debugging switched off
+FAILING_ADB = "time.sleep(0.2)\nsys.stderr.write('error: device not found\\n')\nsys.exit(1)\n"
+# adb with a reachable emulator whose shell records the commands it gets
+WORKING_ADB = ("if sys.argv[3] == 'get-state':\n    print('device')\n    sys.exit()\n"
+               f"for line in sys.stdin:\n    open({{log!r}}, 'a').write('shell ' + line)\n")
+
+def calls(log):
+    return log.read_text().splitlines() if log.exists() else []
+
+@pytest.mark.skipif(os.name == "nt", reason="fake tools are scripts")
+def test_failing_adb_falls_back_to_ld_exe(tmp_path):
+    ld_path, log = fake_tools(tmp_path, FAILING_ADB)
+    pool = ldplayer.ShellSessionPool(ld_path)
+    manager = trace_engine.LdPlayerManager(ld_path, str(tmp_path), 0, sessions=pool)
+    for x in range(3):
+        manager.click(x, 5)
+    taps = [line for line in calls(log) if line.startswith("ld.exe")]
+    assert taps == [f"ld.exe -s 0 input tap {x} 5" for x in range(3)]
+    # The device is checked once, not for every tap
+    assert [line for line in calls(log) if line.startswith("adb.exe")] == ["adb.exe -s emulator-5554 get-state"]
+    # Raw capture is not attempted while the device is unreachable
+    assert pool.get(0).screencap() is None
+    assert not any("exec-out" in line for line in calls(log))
+    pool.close_all()
+
+@pytest.mark.skipif(os.name == "nt", reason="fake tools are scripts")
+def test_failing_adb_falls_back_to_ld_exe_async(tmp_path):
+    ld_path, log = fake_tools(tmp_path, FAILING_ADB)
+    manager = ld_async.AsyncLdPlayerManager(ld_path, str(tmp_path), 0)
+
+    async def clicks():
+        for x in range(3):
+            await manager.click(x, 5)
+        await manager.aclose()
+    asyncio.run(clicks())
+    assert [line for line in calls(log) if line.startswith("ld.exe")] == [f"ld.exe -s 0 input tap {x} 5" for x in range(3)]
+    assert sum(line.startswith("adb.exe") for line in calls(log)) == 1
+
+@pytest.mark.skipif(os.name == "nt", reason="fake tools are scripts")
+def test_failed_raw_capture_not_retried(tmp_path):
+    # Device is reachable but exec-out returns no framebuffer
+    ld_path, log = fake_tools(tmp_path, "if sys.argv[3] == 'get-state':\n    print('device')\n")
+    session = ldplayer.ShellSessionPool(ld_path).get(0)
+    assert session.screencap() is None
+    assert session.screencap() is None
+    assert sum("exec-out" in line for line in calls(log)) == 1
+    session.close()
+
+@pytest.mark.skipif(os.name == "nt", reason="fake tools are scripts")
+def test_working_adb_uses_the_shell(tmp_path):
+    log = tmp_path / "calls.txt"
+    ld_path, _ = fake_tools(tmp_path, WORKING_ADB.format(log=str(log)))
+    session = ldplayer.ShellSessionPool(ld_path).get(0)
+    assert session.run("input tap 1 2")
+    assert session.run("input tap 3 4")
+    deadline = time.monotonic() + 5
+    while len(calls(log)) < 4 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    session.close()
+    assert [line for line in calls(log) if not line.startswith("adb.exe")] == ["shell input tap 1 2", "shell input tap 3 4"]
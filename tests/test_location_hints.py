@@ -0,0 +1,26 @@
+from location_hints import LocationHints
+
+def test_no_window_before_a_hit():
+    hints = LocationHints()
+    assert hints.window((0, "a.png"), (20, 30), (0, 0, 640, 480)) is None
+
+def test_window_around_last_hit():
+    hints = LocationHints(margin=8)
+    hints.record((0, "a.png"), (100, 50))
+    assert hints.window((0, "a.png"), (20, 30), (0, 0, 640, 480)) == (92, 42, 138, 78)
+    # Hints are per key, e.g. per emulator
+    assert hints.window((1, "a.png"), (20, 30), (0, 0, 640, 480)) is None
+
+def test_window_clipped_to_bounds():
+    hints = LocationHints(margin=8)
+    hints.record("k", (2, 3))
+    assert hints.window("k", (20, 30), (0, 0, 640, 480)) == (0, 0, 40, 31)
+    # Region that no longer holds the template around the hit
+    assert hints.window("k", (20, 30), (20, 20, 640, 480)) is None
+
+def test_stats():
+    hints = LocationHints()
+    assert hints.stats() == {"hits": 0, "misses": 0, "hit_rate": 0.0}
+    for hit in (True, True, False, True):
+        hints.count(hit)
+    assert hints.stats() == {"hits": 3, "misses": 1, "hit_rate": 0.75}
@@ -0,0 +1,21 @@
+from match_modes import parse_modes, format_modes
+
+def test_parse_modes():
+    assert parse_modes("a.png:gray|b.png:MASK| c d.png : channel ") == \
+        {"a.png": "gray", "b.png": "mask", "c d.png": "channel"}
+    assert parse_modes("") == {}
+
+def test_parse_modes_skips_unknown(capsys):
+    assert parse_modes("a.png:sepia|b.png|c.png:bgr") == {"c.png": "bgr"}
+    out = capsys.readouterr().out
+    assert "a.png:sepia" in out and "b.png" in out
+
+def test_names_with_colons():
+    # Only the last colon separates the mode
+    assert parse_modes("C:/pic/a.png:gray") == {"C:/pic/a.png": "gray"}
+
+def test_format_round_trip():
+    modes = {"b.png": "mask", "a.png": "gray"}
+    assert format_modes(modes) == "a.png:gray|b.png:mask"
+    assert parse_modes(format_modes(modes)) == modes
+    assert format_modes({}) == ""
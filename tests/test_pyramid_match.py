@@ -0,0 +1,54 @@
+import cv2
+import numpy as np
+import pytest
+from diary_engine import CachedMatcher
+
+def textured(rng, h, w):
+    img = rng.integers(0, 255, (h // 4 + 1, w // 4 + 1, 3), dtype=np.uint8)
+    return cv2.resize(img, (w, h), interpolation=cv2.INTER_CUBIC)
+
+def scene(x, y, seed=5):
+    rng = np.random.default_rng(seed)
+    tpl = textured(rng, 45, 63)
+    frame = textured(rng, 300, 400)
+    frame[y:y + tpl.shape[0], x:x + tpl.shape[1]] = tpl
+    return tpl, frame
+
+@pytest.fixture
+def matcher_for(tmp_path):
+    def make(tpl, level=1):
+        path = str(tmp_path / "t.png")
+        cv2.imwrite(path, tpl)
+        return CachedMatcher(pyramid_templates=["t.png"], pyramid_level=level), path
+    return make
+
+# Odd positions do not survive pyrDown: the coarse hit rounds to an even
+# (or multiple of 4) origin and the full-resolution window has to cover it
+@pytest.mark.parametrize("level", [1, 2])
+@pytest.mark.parametrize("x, y", [(0, 0), (120, 80), (121, 81), (123, 83), (201, 150), (337, 255)])
+def test_pyramid_agrees_with_full_search(matcher_for, level, x, y):
+    tpl, frame = scene(x, y)
+    matcher, path = matcher_for(tpl, level)
+    result = matcher.verify(frame, path)
+    assert result["ok"], result
+    assert result["pyramid"][1] == (x, y)
+    # Found by the windowed re-score, not by falling back to the full search
+    searched = []
+    match_full = matcher.match_full
+    matcher.match_full = lambda img, t: searched.append(img.shape) or match_full(img, t)
+    matcher.match_pyramid(frame, matcher.template(path), 0.98)
+    assert frame.shape not in searched
+
+def test_pyramid_miss_agrees_with_full_search(matcher_for):
+    tpl, _ = scene(0, 0)
+    _, frame = scene(10, 10, seed=6)
+    matcher, path = matcher_for(tpl)
+    result = matcher.verify(frame, path)
+    assert result["ok"], result
+    assert result["full"][0] < 0.98 and result["pyramid"][0] < 0.98
+
+def test_pyramid_call_matches_plain_call(matcher_for):
+    tpl, frame = scene(77, 131)
+    matcher, path = matcher_for(tpl)
+    plain = CachedMatcher()
+    assert matcher(frame, path) == plain(frame, path) == (77, 131)
@@ -0,0 +1,35 @@
+import threading
+from status_board import StatusBoard
+
+def test_changes_since_version():
+    board = StatusBoard()
+    assert board.changes() == (0, {})
+    board.publish(None, "running")
+    board.publish(0, "capture")
+    version, changed = board.changes()
+    assert version == 2
+    assert {key: msg for key, (msg, _) in changed.items()} == {None: "running", 0: "capture"}
+
+    board.publish(0, "match")
+    version, changed = board.changes(version)
+    assert version == 3
+    assert {key: msg for key, (msg, _) in changed.items()} == {0: "match"}
+    assert board.changes(version) == (3, {})
+
+def test_latest_message_wins():
+    board = StatusBoard()
+    for i in range(5):
+        board.publish(1, f"step {i}")
+    _, changed = board.changes()
+    assert changed[1][0] == "step 4"
+
+def test_publish_from_threads():
+    board = StatusBoard()
+    threads = [threading.Thread(target=lambda k=k: [board.publish(k, i) for i in range(200)]) for k in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    version, changed = board.changes()
+    assert version == 800
+    assert {key: msg for key, (msg, _) in changed.items()} == {k: 199 for k in range(4)}
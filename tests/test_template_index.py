@@ -0,0 +1,57 @@
+import cv2
+import numpy as np
+from template_store import Template
+from template_index import TemplateIndex
+from diary_engine import CachedMatcher
+
+def textured(rng, h, w):
+    # Smooth random texture, so the pyrDown'd copy still matches
+    img = rng.integers(60, 150, (h // 4, w // 4, 3), dtype=np.uint8)
+    return cv2.resize(img, (w, h), interpolation=cv2.INTER_CUBIC)
+
+def brightened_scene(seed=3, shift=60):
+    # Frame holding the template brightened by shift: TM_CCOEFF_NORMED still
+    # scores ~1 there, but the template's colours are not in the frame
+    rng = np.random.default_rng(seed)
+    bgr = textured(rng, 48, 64)
+    frame = np.full((240, 320, 3), 20, np.uint8)
+    frame[100:148, 150:214] = bgr + shift
+    return bgr, frame
+
+def make_template(bgr):
+    return Template("t.png", "t.png", bgr, cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY), [])
+
+def test_brightness_shift_scores_high():
+    bgr, frame = brightened_scene()
+    _, score, _, loc = cv2.minMaxLoc(cv2.matchTemplate(frame, bgr, cv2.TM_CCOEFF_NORMED))
+    assert score > 0.99 and loc == (150, 100)
+
+def test_true_match_is_never_dropped():
+    bgr, frame = brightened_scene()
+    tpl = make_template(bgr)
+    index = TemplateIndex()
+    # Its colours are not in the frame, but it is only ranked, not removed
+    assert index.coverage(frame, "t.png", tpl) < 0.5
+    other = make_template(np.full((48, 64, 3), 20, np.uint8))
+    ranked = index.rank(frame, [("t.png", tpl), ("other.png", other)])
+    assert sorted(path for path, _ in ranked) == ["other.png", "t.png"]
+
+def test_rank_puts_present_colours_first():
+    rng = np.random.default_rng(4)
+    present, absent = textured(rng, 40, 40), textured(rng, 40, 40) // 4
+    frame = np.zeros((200, 200, 3), np.uint8)
+    frame[50:90, 60:100] = present
+    templates = [("absent.png", make_template(absent)), ("present.png", make_template(present))]
+    assert [path for path, _ in TemplateIndex().rank(frame, templates)] == ["present.png", "absent.png"]
+
+def test_matcher_finds_brightened_template(tmp_path):
+    bgr, frame = brightened_scene()
+    path = str(tmp_path / "t.png")
+    cv2.imwrite(path, bgr)
+    matcher = CachedMatcher()
+    # 0.98 is the reroll threshold; the brightened copy still scores > 0.99
+    other = str(tmp_path / "other.png")
+    cv2.imwrite(other, np.full((48, 64, 3), 20, np.uint8))
+    for threshold in (0.90, 0.98):
+        template, (x, y) = matcher.find_first(frame, [other, path], threshold)
+        assert template == path and (x, y) == (150, 100)
@@ -0,0 +1,33 @@
+import os
+import time
+import cv2
+import numpy as np
+import template_store
+
+def data_files(store):
+    return sorted(f for f in os.listdir(store.store_dir) if f.startswith("data-"))
+
+def make_store(tmp_path):
+    cv2.imwrite(str(tmp_path / "a.png"), np.full((10, 12, 3), 90, np.uint8))
+    store = template_store.TemplateStore(str(tmp_path))
+    store.load()
+    return store
+
+def test_fresh_unreferenced_data_is_kept(tmp_path):
+    # Another process wrote this data file and has not replaced the index yet
+    store = make_store(tmp_path)
+    pending = os.path.join(store.store_dir, "data-pending.bin")
+    open(pending, "wb").close()
+    template_store.TemplateStore(str(tmp_path)).load()
+    assert os.path.exists(pending)
+
+def test_old_unreferenced_data_is_removed(tmp_path):
+    store = make_store(tmp_path)
+    current = data_files(store)
+    stale = os.path.join(store.store_dir, "data-stale.bin")
+    open(stale, "wb").close()
+    old = time.time() - template_store.UNREFERENCED_GRACE - 10
+    os.utime(stale, (old, old))
+    template_store.TemplateStore(str(tmp_path)).load()
+    assert not os.path.exists(stale)
+    assert data_files(store) == current
@@ -0,0 +1,56 @@
+import json
+import pytest
+from trace_metrics import BUCKETS, Histogram, Metrics
+
+def test_histogram_buckets():
+    hist = Histogram()
+    for seconds in (0.0005, 0.001, 0.003, 0.003, 10.0):
+        hist.observe(seconds)
+    assert hist.count == 5
+    assert hist.total == pytest.approx(10.0075)
+    assert hist.max == 10.0
+    # le is inclusive: 0.001 lands in the 0.001 bucket
+    assert hist.counts[BUCKETS.index(0.001)] == 2
+    assert hist.counts[BUCKETS.index(0.005)] == 2
+    assert hist.counts[-1] == 1
+
+def test_histogram_quantile():
+    hist = Histogram()
+    assert hist.quantile(0.5) == 0.0
+    for _ in range(100):
+        hist.observe(0.015)
+    # Interpolated inside (0.01, 0.02], never above the largest observation
+    assert 0.01 < hist.quantile(0.5) <= 0.015
+    assert hist.quantile(0.99) == pytest.approx(0.015)
+    summary = hist.summary()
+    assert summary["count"] == 100 and summary["mean_ms"] == pytest.approx(15.0)
+
+def test_prometheus_export():
+    metrics = Metrics()
+    metrics.observe(0, "match", 0.004)
+    metrics.observe(0, "match", 0.5)
+    metrics.count(0, "captures", 2)
+    metrics.matched(1, 'a "b".png')
+    metrics.gauge(0, "next_wait_seconds", 0.25)
+    lines = metrics.to_prometheus().splitlines()
+    assert "# TYPE trace_stage_seconds histogram" in lines
+    assert 'trace_stage_seconds_bucket{emulator="0",stage="match",le="0.005"} 1' in lines
+    assert 'trace_stage_seconds_bucket{emulator="0",stage="match",le="0.5"} 2' in lines
+    assert 'trace_stage_seconds_bucket{emulator="0",stage="match",le="+Inf"} 2' in lines
+    assert 'trace_stage_seconds_count{emulator="0",stage="match"} 2' in lines
+    assert 'trace_events_total{emulator="0",event="captures"} 2' in lines
+    assert 'trace_matches_total{emulator="1",template="a \\"b\\".png"} 1' in lines
+    assert "# TYPE trace_next_wait_seconds gauge" in lines
+    assert 'trace_next_wait_seconds{emulator="0"} 0.25' in lines
+
+def test_json_export(tmp_path):
+    metrics = Metrics()
+    metrics.observe(0, "cycle", 0.1)
+    metrics.observe(1, "cycle", 0.3)
+    metrics.export(str(tmp_path / "m"))
+    data = json.loads((tmp_path / "m.json").read_text(encoding="utf-8"))
+    assert data["stages"]["0"]["cycle"]["count"] == 1
+    assert data["totals"]["cycle"]["count"] == 2
+    assert data["totals"]["cycle"]["max_ms"] == pytest.approx(300.0)
+    assert (tmp_path / "m.prom").exists()
+    assert not list(tmp_path.glob("*.tmp"))
@@ -0,0 +1,33 @@
+from trace_scheduler import AdaptiveInterval
+
+def test_starts_at_min_wait():
+    pacer = AdaptiveInterval(0.2, 3.0)
+    assert pacer(0) == 0.2
+
+def test_backoff_until_max_wait():
+    pacer = AdaptiveInterval(0.2, 1.0, backoff=2.0)
+    waits = []
+    for _ in range(5):
+        pacer.update(0, False)
+        waits.append(pacer(0))
+    assert waits == [0.4, 0.8, 1.0, 1.0, 1.0]
+
+def test_activity_resets_to_min_wait():
+    pacer = AdaptiveInterval(0.5, 4.0, backoff=3.0)
+    pacer.update(1, False)
+    pacer.update(1, False)
+    assert pacer(1) == 4.0
+    pacer.update(1, True)
+    assert pacer(1) == 0.5
+
+def test_emulators_are_independent():
+    pacer = AdaptiveInterval(0.5, 4.0)
+    pacer.update(0, False)
+    assert pacer(0) == 1.0 and pacer(1) == 0.5
+    pacer.forget(0)
+    assert pacer(0) == 0.5
+
+def test_max_below_min_is_clamped():
+    pacer = AdaptiveInterval(2.0, 1.0)
+    pacer.update(0, False)
+    assert pacer(0) == 2.0
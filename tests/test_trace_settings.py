@@ -0,0 +1,9 @@
+from trace_engine import TraceSettings
+
+def test_bad_numbers_fall_back_to_defaults(tmp_path):
+    ini = tmp_path / "trace.ini"
+    ini.write_text("[Settings]\nwait_seconds = 1,5\nframe_slots = three\nlog_backups = 7\n", encoding="utf-8")
+    settings = TraceSettings.load(str(ini))
+    assert settings.wait_seconds == 1.0
+    assert settings.frame_slots == 3
+    assert settings.log_backups == 7
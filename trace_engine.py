@@ -0,0 +1,946 @@
+import os
+import sys
+import time
+import signal
+import argparse
+import threading
+import subprocess
+import multiprocessing
+import configparser
+import cv2
+import numpy as np
+from datetime import datetime
+import template_store
+import match_modes
+import log_writer
+import ldplayer
+import ld_discovery
+from location_hints import LocationHints
+from trace_scheduler import EmulatorScheduler, AsyncEmulatorScheduler, AdaptiveInterval
+from ld_async import AsyncLdPlayerManager
+from trace_metrics import Metrics, MetricsExporter
+from match_pool import ProcessMatcher
+from frame_ring import FrameRing
+from status_board import StatusBoard
+from session_record import SessionRecorder
+
+# How often the supervisor syncs the workers with the emulator selection
+SUPERVISOR_INTERVAL = 0.5
+# How long stop() waits for cycles in progress before tearing down what they use;
+# longer than a file capture's 5 s wait for the screenshot
+STOP_TIMEOUT = 6.0
+LOG_FILE = "trace_log.txt"
+# Search region from C#: Rectangle(180, 120, 430, 60)
+SEARCH_REGION = (180, 120, 430, 60)
+MATCH_THRESHOLD = 0.9
+# Skills are tapped at the matched x on this row
+CLICK_Y = 320
+
+class LdPlayerManager:
+    def __init__(self, ld_path, screenshot_dir, index=0, capture_mode="raw", sessions=None, metrics=None, frames=None):
+        self.ld_path = ld_path
+        self.screenshot_dir = screenshot_dir
+        self.index = index
+        # "raw" streams the framebuffer over adb stdout, "file" uses the shared Pictures folder
+        self.capture_mode = capture_mode
+        # Optional ldplayer.ShellSessionPool; taps and raw captures go through its long-lived shells
+        self.sessions = sessions
+        # Optional trace_metrics.Metrics; records the PNG decode of file captures
+        self.metrics = metrics
+        # Optional frame_ring.FrameRing; captures are written into it and returned as views
+        self.frames = frames
+
+    def run_command(self, *args):
+        try:
+            cmd = [self.ld_path, "-s", str(self.index)] + list(args)
+            subprocess.run(cmd, check=False, creationflags=ldplayer.CREATE_NO_WINDOW)
+        except Exception as e:
+            print(f"RunCommand Error: {e}")
+
+    def session(self):
+        return self.sessions.get(self.index) if self.sessions else None
+
+    def click(self, x, y):
+        session = self.session()
+        if session and session.run(f"input tap {x} {y}"):
+            return
+        self.run_command("input", "tap", str(x), str(y))
+
+    def screencap(self):
+        if self.capture_mode == "raw":
+            session = self.session()
+            if session:
+                # The session already tried exec-out; a failure goes straight to the file capture
+                rgba = session.screencap()
+            else:
+                rgba = ldplayer.screencap_raw(self.ld_path, self.index)
+            if rgba is not None:
+                if self.frames:
+                    return self.frames.write(self.index, rgba, cv2.COLOR_RGBA2BGR)
+                return cv2.cvtColor(rgba, cv2.COLOR_RGBA2BGR)
+        img = self.screencap_file()
+        if img is not None and self.frames:
+            return self.frames.write(self.index, img)
+        return img
+
+    def screencap_file(self):
+        filename = f"trace_cap_{self.index}.png"
+        local_path = os.path.join(self.screenshot_dir, filename)
+        remote_path = f"/sdcard/Pictures/{filename}"
+        
+        # Remove old file if exists
+        if os.path.exists(local_path):
+            try: os.remove(local_path)
+            except: pass
+
+        try:
+            self.run_command("screencap", remote_path)
+            # Wait for file to appear (up to 5 seconds)
+            for _ in range(50):
+                if os.path.exists(local_path):
+                    # Try to read it to ensure it's not being written
+                    start = time.perf_counter()
+                    img = cv2.imread(local_path)
+                    if self.metrics:
+                        self.metrics.observe(self.index, "decode", time.perf_counter() - start)
+                    if img is not None:
+                        return img
+                time.sleep(0.1)
+            return None
+        except Exception as e:
+            print(f"Screencap Error: {e}")
+            return None
+
+class ImageMatcher:
+    def __init__(self):
+        self.template_cache = {}
+        # name -> template_store.Template, for the reduced-channel and masked modes
+        self.templates = {}
+        # name -> match_modes mode; templates not listed use default_mode
+        self.modes = {}
+        self.default_mode = "bgr"
+        # name -> (view key, view template, mask)
+        self.prepared_cache = {}
+        self.hints = LocationHints()
+
+    def load_templates(self, trace_dir):
+        self.template_cache.clear()
+        self.templates.clear()
+        self.prepared_cache.clear()
+        if not os.path.exists(trace_dir):
+            return
+        
+        # Decoded templates come from the on-disk store; only changed PNGs are decoded
+        for name, tpl in template_store.open_store(trace_dir).load().items():
+            self.template_cache[name] = tpl.bgr
+            self.templates[name] = tpl
+
+    def set_modes(self, modes, default_mode="bgr"):
+        self.modes = dict(modes)
+        self.default_mode = default_mode
+        self.prepared_cache.clear()
+
+    def crop_region(self, source_img, search_region):
+        # Apply search region if provided (x, y, w, h)
+        if search_region:
+            x, y, w, h = search_region
+            if x >= 0 and y >= 0 and x + w <= source_img.shape[1] and y + h <= source_img.shape[0]:
+                return source_img[y:y+h, x:x+w], (x, y)
+        return source_img, (0, 0)
+
+    def find_image(self, source_img, template_name, threshold=0.9, search_region=None):
+        if template_name not in self.template_cache:
+            return None
+        
+        key, template, mask = self._prepared(template_name)
+        region, (offset_x, offset_y) = self.crop_region(source_img, search_region)
+        max_val, max_loc = match_modes.match_view(match_modes.to_view(region, key), template, mask)
+
+        if max_val >= threshold:
+            return {
+                "success": True,
+                "location": (max_loc[0] + offset_x, max_loc[1] + offset_y),
+                "score": max_val
+            }
+        return {"success": False}
+
+    def _prepared(self, name):
+        if name not in self.prepared_cache:
+            tpl = self.templates.get(name)
+            if tpl is None:
+                # Arrays put into template_cache directly have no Template; match them in BGR
+                self.prepared_cache[name] = ("bgr", self.template_cache[name], None)
+            else:
+                self.prepared_cache[name] = match_modes.prepare(tpl, self.modes.get(name, self.default_mode))
+        return self.prepared_cache[name]
+
+    def _scorer(self, region):
+        # score(name) -> (score, location in region), or None for unknown templates and
+        # ones larger than region. The region is converted once per view key.
+        rh, rw = region.shape[:2]
+        views = {}
+        def score(name):
+            tpl = self.template_cache.get(name)
+            if tpl is None or tpl.shape[0] > rh or tpl.shape[1] > rw:
+                return None
+            key, view, mask = self._prepared(name)
+            if key not in views:
+                views[key] = match_modes.to_view(region, key)
+            return match_modes.match_view(views[key], view, mask)
+        return score
+
+    def find_all(self, source_img, names, threshold=0.9, search_region=None):
+        # Scores every template against one prepared region (a plain uint8
+        # TM_CCOEFF_NORMED per template; the region is cropped and converted once)
+        region, (offset_x, offset_y) = self.crop_region(source_img, search_region)
+        score_of = self._scorer(region)
+        results = []
+        for name in names:
+            scored = score_of(name)
+            if scored is None:
+                continue
+            score, (loc_x, loc_y) = scored
+            results.append({
+                "name": name,
+                "success": score >= threshold,
+                "location": (loc_x + offset_x, loc_y + offset_y),
+                "score": score
+            })
+        return results
+
+    def find_hinted(self, source_img, names, threshold=0.9, search_region=None, emulator=None):
+        # First template in names order found in the window around this emulator's
+        # last hit of it: (its position in names, result, windows tried), or (None, None, tried)
+        region, (offset_x, offset_y) = self.crop_region(source_img, search_region)
+        bounds = (offset_x, offset_y, offset_x + region.shape[1], offset_y + region.shape[0])
+        tried = 0
+        for i, name in enumerate(names):
+            if name not in self.template_cache:
+                continue
+            key, template, mask = self._prepared(name)
+            window = self.hints.window((emulator, name), template.shape, bounds)
+            if window is None:
+                continue
+            x0, y0, x1, y1 = window
+            score, (loc_x, loc_y) = match_modes.match_view(match_modes.to_view(source_img[y0:y1, x0:x1], key), template, mask)
+            tried += 1
+            self.hints.count(score >= threshold)
+            if score >= threshold:
+                return i, {"name": name, "success": True, "location": (loc_x + x0, loc_y + y0), "score": score}, tried
+        return None, None, tried
+
+    def with_hints(self, find_first, source_img, names, threshold, search_region, emulator, all_scores=False):
+        # Windows around the emulator's last hits are matched first, in this process
+        # (they are small). A hint hit leaves only the higher-priority templates for
+        # find_first's full-region search, so the answer is still the first hit in
+        # names order. result["hints"] = (hint hits, hint misses) of this call.
+        # all_scores (debug output) needs every template's full-region score, so
+        # the hints are skipped then.
+        if all_scores:
+            result = find_first(source_img, names, threshold, search_region, all_scores=True)
+            if result["success"]:
+                self.hints.record((emulator, result["name"]), result["location"])
+            result["hints"] = (0, 0)
+            return result
+        index, hinted, tried = self.find_hinted(source_img, names, threshold, search_region, emulator)
+        if hinted is None:
+            result = find_first(source_img, names, threshold, search_region)
+        elif index:
+            result = find_first(source_img, names[:index], threshold, search_region)
+            if not result["success"] and not result.get("stale"):
+                result = dict(hinted, scores=dict(result["scores"], **{hinted["name"]: hinted["score"]}))
+        else:
+            result = dict(hinted, scores={hinted["name"]: hinted["score"]})
+        if result["success"]:
+            self.hints.record((emulator, result["name"]), result["location"])
+        hits = 1 if hinted else 0
+        result["hints"] = (hits, tried - hits)
+        return result
+
+    def find_first(self, source_img, names, threshold=0.9, search_region=None, emulator=None, all_scores=False):
+        # Highest-priority hit in names order. Templates are matched in that order
+        # and the search stops at the first hit; "scores" holds the templates
+        # matched, or every template with all_scores (debug output).
+        if emulator is not None:
+            return self.with_hints(self.find_first, source_img, names, threshold, search_region, emulator, all_scores)
+        region, (offset_x, offset_y) = self.crop_region(source_img, search_region)
+        score_of = self._scorer(region)
+        scores = {}
+        found = None
+        for name in names:
+            scored = score_of(name)
+            if scored is None:
+                continue
+            score, (loc_x, loc_y) = scored
+            scores[name] = score
+            if found is None and score >= threshold:
+                found = {"name": name, "success": True, "location": (loc_x + offset_x, loc_y + offset_y), "score": score}
+                if not all_scores:
+                    break
+        if found:
+            return dict(found, scores=scores)
+        return {"success": False, "scores": scores}
+
+class RegionChangeDetector:
+    # Remembers a downsampled fingerprint of each emulator's search region and
+    # the match result for it, so an unchanged region is not matched again.
+    def __init__(self, tolerance=8, scale=4):
+        self.tolerance = tolerance  # max per-pixel difference of the fingerprints; < 0 disables reuse
+        self.scale = scale
+        self.last = {}  # emu_index -> (fingerprint, key, result)
+        self.checks = 0
+        self.reused = 0
+        self.lock = threading.Lock()
+
+    def fingerprint(self, region):
+        h, w = region.shape[:2]
+        small = cv2.resize(region, (max(w // self.scale, 1), max(h // self.scale, 1)), interpolation=cv2.INTER_AREA)
+        return small.astype(np.int16)
+
+    def lookup(self, emu_index, region, key):
+        # Returns (result, fingerprint); result is None when the region must be matched
+        fp = self.fingerprint(region)
+        with self.lock:
+            self.checks += 1
+            prev = self.last.get(emu_index)
+        if self.tolerance < 0 or prev is None or prev[1] != key or prev[0].shape != fp.shape:
+            return None, fp
+        if np.abs(prev[0] - fp).max() > self.tolerance:
+            return None, fp
+        with self.lock:
+            self.reused += 1
+        return prev[2], fp
+
+    def store(self, emu_index, fp, key, result):
+        with self.lock:
+            self.last[emu_index] = (fp, key, result)
+
+    def forget(self, emu_index):
+        with self.lock:
+            self.last.pop(emu_index, None)
+
+    def stats(self):
+        with self.lock:
+            rate = self.reused / self.checks if self.checks else 0.0
+            return {"checks": self.checks, "reused": self.reused, "reuse_rate": rate}
+
+def app_dir():
+    # For Nuitka onefile: use the original exe location, not temp extraction dir
+    # Check if running as compiled exe by looking at sys.argv[0]
+    exe_path = sys.argv[0] if sys.argv else sys.executable
+    if exe_path.lower().endswith('.exe'):
+        # Running as compiled exe - use argv[0] which has the real path
+        return os.path.dirname(os.path.abspath(exe_path))
+    elif getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+def find_trace_dir(script_dir):
+    # Fallback to TraceLD_Project/trace if local trace is missing or empty
+    trace_dir = os.path.join(script_dir, "trace")
+    if not os.path.isdir(trace_dir) or not any(f.lower().endswith(".png") for f in os.listdir(trace_dir)):
+        fallback = os.path.join(script_dir, "TraceLD_Project", "trace")
+        if os.path.exists(fallback) and any(f.lower().endswith(".png") for f in os.listdir(fallback)):
+            return fallback
+    return trace_dir
+
+def ordered_images(trace_dir, saved_items):
+    # Saved priority order first, then new files by name
+    current_files = set(f for f in os.listdir(trace_dir) if f.lower().endswith(".png"))
+    images = [i for i in saved_items if i in current_files]
+    return images + sorted(current_files - set(images))
+
+def read_config(config_path):
+    config = configparser.ConfigParser()
+    if os.path.exists(config_path):
+        # Try UTF-8 first, then CP950 (Big5)
+        try:
+            config.read(config_path, encoding='utf-8')
+        except UnicodeDecodeError:
+            try:
+                config.read(config_path, encoding='cp950')
+            except Exception as e:
+                print(f"Error reading config: {e}")
+    return config
+
+def parse_emulators(text):
+    # "3|5" or the older "3: LDPlayer-3|5: LDPlayer-5"
+    indices = []
+    for item in text.split('|'):
+        head = item.split(':')[0].strip()
+        if head.isdigit():
+            indices.append(int(head))
+    return indices
+
+def read_number(section, key, default, kind=float):
+    # A value that does not parse falls back to default instead of failing the whole load
+    try:
+        return kind(section.get(key, str(default)))
+    except ValueError:
+        print(f"Invalid {key} in config: {section.get(key)!r}, using {default}")
+        return default
+
+def write_log(msg, emulator=None):
+    # Queued for the background writer; no file open/close on the caller's thread
+    log_writer.get_writer(LOG_FILE).write(msg, emulator)
+
+def auto_detect_paths(current_ld=""):
+    # Cached by ld_discovery; repeated calls only stat the LDPlayer config files
+    return ld_discovery.detect_paths(current_ld)
+
+class TraceSettings:
+    # Everything trace.ini [Settings] holds, shared by the GUI and the CLI
+    def __init__(self):
+        self.ld_path = ""
+        self.screenshot_dir = ""
+        self.wait_seconds = 1.0
+        # Adaptive wait: min_wait_seconds right after a match or screen change, doubling
+        # (wait_backoff) while nothing changes, up to max_wait_seconds. Off = wait_seconds always.
+        self.adaptive_wait = False
+        self.min_wait_seconds = 0.2
+        self.max_wait_seconds = 2.0
+        self.wait_backoff = 2.0
+        self.debug_mode = False
+        self.selected_emulators = []
+        self.capture_mode = "raw"
+        # 0 = one concurrent match per CPU core
+        self.max_match_jobs = None
+        # "threads" = match in the emulator's worker, "processes" = on a pool of max_match_jobs processes
+        self.match_backend = "threads"
+        # With processes: captures per emulator kept in shared memory for the pool (0 = pickle each region)
+        self.frame_slots = 3
+        # "threads" = one worker thread per emulator, "asyncio" = one event loop for all
+        self.scheduler = "threads"
+        # Seconds between background "ldconsole list2" polls while running
+        self.status_interval = 2.0
+        # Search regions that differ by at most this much reuse the last result (-1 = always match)
+        self.change_tolerance = 8
+        # Seconds between rewrites of <metrics_path>.prom / .json (0 = only at stop)
+        self.metrics_interval = 10.0
+        # Empty = no metrics files, the summary is still shown at stop; relative paths are under app_dir()
+        self.metrics_path = ""
+        # trace_log.txt rotates to .1 .. .N once it reaches log_max_kb
+        self.log_max_kb = 5120
+        self.log_backups = 3
+        # session_record archive written while running ("" = off); "region" keeps only SEARCH_REGION
+        self.record_path = ""
+        self.record_mode = "region"
+        # match_modes per template ("a.png:gray|b.png:mask") and for the rest
+        self.match_modes = {}
+        self.default_match_mode = "bgr"
+        self.image_order = []
+
+    @classmethod
+    def load(cls, config_path):
+        settings = cls()
+        config = read_config(config_path)
+        if 'Settings' in config:
+            section = config['Settings']
+            settings.ld_path = section.get('ld_path', '')
+            settings.screenshot_dir = section.get('screenshot_dir', '')
+            settings.wait_seconds = read_number(section, 'wait_seconds', 1.0)
+            settings.adaptive_wait = section.get('adaptive_wait', 'False').lower() == "true"
+            settings.min_wait_seconds = read_number(section, 'min_wait_seconds', 0.2)
+            settings.max_wait_seconds = read_number(section, 'max_wait_seconds', 2.0)
+            settings.wait_backoff = max(read_number(section, 'wait_backoff', 2.0), 1.0)
+            settings.debug_mode = section.get('debug_mode', 'False').lower() == "true"
+            settings.selected_emulators = parse_emulators(section.get('selected_emulators', ''))
+            settings.capture_mode = section.get('capture_mode', 'raw')
+            settings.max_match_jobs = read_number(section, 'max_match_jobs', 0, int) or None
+            settings.scheduler = section.get('scheduler', 'threads')
+            settings.match_backend = section.get('match_backend', 'threads')
+            settings.frame_slots = read_number(section, 'frame_slots', 3, int)
+            settings.status_interval = read_number(section, 'status_interval', 2.0)
+            settings.change_tolerance = read_number(section, 'change_tolerance', 8, int)
+            settings.metrics_interval = read_number(section, 'metrics_interval', 10.0)
+            settings.metrics_path = section.get('metrics_path', '')
+            settings.log_max_kb = read_number(section, 'log_max_kb', 5120, int)
+            settings.log_backups = read_number(section, 'log_backups', 3, int)
+            settings.record_path = section.get('record_path', '')
+            settings.record_mode = section.get('record_mode', 'region')
+            settings.match_modes = match_modes.parse_modes(section.get('match_modes', ''))
+            settings.default_match_mode = section.get('default_match_mode', 'bgr')
+            if settings.default_match_mode not in match_modes.MODES:
+                print(f"Unknown match mode: {settings.default_match_mode}")
+                settings.default_match_mode = "bgr"
+            settings.image_order = [i for i in section.get('image_order', '').split('|') if i]
+
+        # Auto detect missing paths; nothing to probe when both saved paths still exist.
+        # One call is enough: with a missing ld_path the screenshot dir is already
+        # derived from the detected one.
+        ld_ok = settings.ld_path and os.path.exists(settings.ld_path)
+        scr_ok = settings.screenshot_dir and os.path.exists(settings.screenshot_dir)
+        if not ld_ok or not scr_ok:
+            auto_ld, auto_scr = auto_detect_paths(settings.ld_path)
+            if not ld_ok:
+                settings.ld_path = auto_ld
+            if not scr_ok:
+                settings.screenshot_dir = auto_scr
+        return settings
+
+    def save(self, config_path):
+        config = configparser.ConfigParser()
+        config['Settings'] = {
+            'ld_path': self.ld_path,
+            'screenshot_dir': self.screenshot_dir,
+            'wait_seconds': str(self.wait_seconds),
+            'adaptive_wait': str(self.adaptive_wait),
+            'min_wait_seconds': str(self.min_wait_seconds),
+            'max_wait_seconds': str(self.max_wait_seconds),
+            'wait_backoff': str(self.wait_backoff),
+            'debug_mode': str(self.debug_mode),
+            'selected_emulators': '|'.join(str(i) for i in self.selected_emulators),
+            'capture_mode': self.capture_mode,
+            'max_match_jobs': str(self.max_match_jobs or 0),
+            'scheduler': self.scheduler,
+            'match_backend': self.match_backend,
+            'frame_slots': str(self.frame_slots),
+            'status_interval': str(self.status_interval),
+            'change_tolerance': str(self.change_tolerance),
+            'metrics_interval': str(self.metrics_interval),
+            'metrics_path': self.metrics_path,
+            'log_max_kb': str(self.log_max_kb),
+            'log_backups': str(self.log_backups),
+            'record_path': self.record_path,
+            'record_mode': self.record_mode,
+            'match_modes': match_modes.format_modes(self.match_modes),
+            'default_match_mode': self.default_match_mode,
+            'image_order': '|'.join(self.image_order)
+        }
+        
+        with open(config_path, 'w', encoding='utf-8') as f:
+            config.write(f)
+
+class TraceEngine:
+    # The automation without any GUI. Front ends push the image order, wait
+    # time and emulator selection in through configure(); workers only read
+    # those plain attributes. Status is published to self.board, which a GUI
+    # polls; on_status(msg, emulator) additionally sees every message. The
+    # callbacks are called from worker threads.
+    def __init__(self, settings, trace_dir, on_status=None, on_emulator_closed=None, on_finished=None):
+        self.settings = settings
+        self.trace_dir = trace_dir
+        self.board = StatusBoard()
+        self.on_status = on_status
+        self.on_emulator_closed = on_emulator_closed
+        self.on_finished = on_finished
+        self.matcher = ImageMatcher()
+        # Whatever runs find_first: the matcher itself or a ProcessMatcher around it
+        self.match_backend = self.matcher
+        self.is_running = False
+        self.supervisor = None
+        self.scheduler = None
+        self.sessions = None
+        self.status_poller = None
+        self.change_detector = None
+        self.pacer = None
+        self.frames = None
+        self.metrics = Metrics()
+        self.metrics_exporter = None
+        self.recorder = None
+        self.managers = {}
+        self.images = list(settings.image_order)
+        self.wait_sec = settings.wait_seconds
+        self.adaptive = settings.adaptive_wait
+        self.debug = settings.debug_mode
+        self.selected = set(settings.selected_emulators)
+        self.lock = threading.Lock()
+
+    def configure(self, images=None, wait_sec=None, debug=None, selected=None, adaptive=None):
+        with self.lock:
+            if images is not None:
+                self.images = list(images)
+            if wait_sec is not None:
+                self.wait_sec = float(wait_sec)
+            if adaptive is not None:
+                self.adaptive = adaptive
+            if debug is not None:
+                self.debug = debug
+            if selected is not None:
+                self.selected = set(selected)
+
+    def status(self, msg, emulator=None):
+        self.board.publish(emulator, msg)
+        if self.on_status:
+            self.on_status(msg, emulator)
+        if self.debug:
+            write_log(msg, emulator)
+
+    def log(self, msg, emulator=None):
+        write_log(msg, emulator)
+
+    def start(self):
+        if self.is_running:
+            return
+        settings = self.settings
+        writer = log_writer.get_writer(LOG_FILE, settings.log_max_kb * 1024, settings.log_backups)
+        if self.debug:
+            writer.clear()
+
+        self.status("載入圖片快取...")
+        self.matcher.load_templates(self.trace_dir)
+        self.matcher.set_modes(settings.match_modes, settings.default_match_mode)
+        self.match_backend = self.matcher
+        self.frames = None
+        if settings.match_backend == "processes":
+            if settings.frame_slots > 0:
+                self.frames = FrameRing(settings.frame_slots)
+            # Created after load_templates, so the workers find the template store up to date
+            self.match_backend = ProcessMatcher(self.matcher, self.trace_dir, settings.max_match_jobs, self.frames)
+            self.match_backend.warm_up()
+
+        self.sessions = ldplayer.ShellSessionPool(settings.ld_path)
+        self.status_poller = ldplayer.EmulatorStatusPoller(settings.ld_path, settings.status_interval)
+        self.status_poller.subscribe(self.on_emulator_state_changed)
+        self.status_poller.start()
+        self.managers = {}
+        self.change_detector = RegionChangeDetector(settings.change_tolerance)
+        # Always kept up to date, so adaptive waiting can be switched on while running
+        self.pacer = AdaptiveInterval(settings.min_wait_seconds, settings.max_wait_seconds, settings.wait_backoff)
+        self.metrics = Metrics()
+        if settings.metrics_path:
+            metrics_path = os.path.join(app_dir(), settings.metrics_path)
+            self.metrics_exporter = MetricsExporter(self.metrics, metrics_path,
+                                                    settings.metrics_interval if settings.metrics_interval > 0 else None)
+            self.metrics_exporter.start()
+        if settings.record_path:
+            region = SEARCH_REGION if settings.record_mode == "region" else None
+            self.recorder = SessionRecorder(settings.record_path, "trace", region)
+        if settings.scheduler == "asyncio":
+            # One event loop drives every emulator instead of a thread each
+            self.scheduler = AsyncEmulatorScheduler(self.process_emulator_async, self.next_wait, settings.max_match_jobs)
+        else:
+            self.scheduler = EmulatorScheduler(self.process_emulator, self.next_wait, settings.max_match_jobs)
+        self.is_running = True
+
+        self.supervisor = threading.Thread(target=self.run_automation, daemon=True)
+        self.supervisor.start()
+
+    def release(self):
+        # The workers are stopped and waited for first: shell sessions, the
+        # match pool and the frame ring go away only once no cycle uses them
+        if self.scheduler:
+            if isinstance(self.scheduler, AsyncEmulatorScheduler):
+                self.scheduler.stop_all(STOP_TIMEOUT, cleanup=self.close_managers)
+            else:
+                self.scheduler.stop_all(STOP_TIMEOUT)
+        if self.sessions:
+            self.sessions.close_all()
+        if self.status_poller:
+            self.status_poller.stop()
+            self.status_poller = None
+        if self.metrics_exporter:
+            self.metrics_exporter.stop()
+            self.metrics_exporter = None
+        recorder, self.recorder = self.recorder, None
+        if recorder:
+            recorder.close()
+        backend, self.match_backend = self.match_backend, self.matcher
+        if backend is not self.matcher:
+            backend.close()
+        frames, self.frames = self.frames, None
+        if frames:
+            frames.close()
+
+    def claim_stop(self):
+        # True for exactly one caller per run, however stop() and the supervisor race
+        with self.lock:
+            running, self.is_running = self.is_running, False
+        return running
+
+    def stop(self):
+        # Safe from any thread and more than once. Blocks until the cycles in
+        # progress finish (up to STOP_TIMEOUT), so GUIs call it off their UI
+        # thread. Returns False when the engine was already stopped.
+        if not self.claim_stop():
+            return False
+        supervisor = self.supervisor
+        if supervisor is not None and supervisor is not threading.current_thread():
+            supervisor.join(SUPERVISOR_INTERVAL + STOP_TIMEOUT)
+        self.release()
+        if self.change_detector:
+            stats = self.change_detector.stats()
+            cycle = self.metrics.to_json()["totals"].get("cycle", {})
+            hints = self.matcher.hints.stats()
+            self.status(f"已停止 (比對重用率 {stats['reuse_rate']:.0%}, {stats['reused']}/{stats['checks']}, "
+                        f"位置提示命中 {hints['hits']}/{hints['hits'] + hints['misses']}, "
+                        f"平均週期 {cycle.get('mean_ms', 0):.0f} ms)")
+        else:
+            self.status("已停止")
+        return True
+
+    def next_wait(self, emu_index):
+        # Seconds until this emulator's next cycle; a gauge, not a stage: nothing is being timed
+        wait = self.pacer(emu_index) if self.adaptive else self.wait_sec
+        self.metrics.gauge(emu_index, "next_wait_seconds", wait)
+        return wait
+
+    def manager_for(self, emu_index):
+        if emu_index not in self.managers:
+            settings = self.settings
+            if settings.scheduler == "asyncio":
+                self.managers[emu_index] = AsyncLdPlayerManager(settings.ld_path, settings.screenshot_dir, emu_index,
+                                                                capture_mode=settings.capture_mode)
+                self.managers[emu_index].metrics = self.metrics
+                self.managers[emu_index].frames = self.frames
+            else:
+                self.managers[emu_index] = LdPlayerManager(settings.ld_path, settings.screenshot_dir, emu_index,
+                                                           capture_mode=settings.capture_mode, sessions=self.sessions,
+                                                           metrics=self.metrics, frames=self.frames)
+        return self.managers[emu_index]
+
+    async def close_managers(self):
+        for manager in self.managers.values():
+            if isinstance(manager, AsyncLdPlayerManager):
+                await manager.aclose()
+
+    def run_automation(self):
+        # Supervisor: keeps one worker per selected emulator
+        scheduler = self.scheduler
+        try:
+            self.status("開始執行...")
+            
+            while self.is_running:
+                with self.lock:
+                    selected_indices = sorted(self.selected)
+
+                if not selected_indices:
+                    self.status("未選擇任何模擬器")
+                    break
+
+                scheduler.sync(selected_indices)
+                time.sleep(SUPERVISOR_INTERVAL)
+        except Exception as e:
+            self.status(f"錯誤: {e}")
+        finally:
+            # Ended on its own (nothing selected or an error) rather than through stop()
+            if scheduler is self.scheduler and self.stop() and self.on_finished:
+                self.on_finished()
+
+    def process_emulator(self, emu_index):
+        # One capture/match/click cycle for one emulator, run on that emulator's worker
+        if not self.is_running:
+            return False
+
+        ld_manager = self.manager_for(emu_index)
+        metrics = self.metrics
+        try:
+            cycle_start = time.perf_counter()
+            self.status("截圖中...", emu_index)
+            with metrics.time(emu_index, "capture"):
+                cap_img = ld_manager.screencap()
+            if cap_img is None:
+                metrics.count(emu_index, "capture_failures")
+                return self.on_capture_failed(emu_index)
+            metrics.count(emu_index, "captures")
+
+            with self.scheduler.match_slots:
+                with metrics.time(emu_index, "match"):
+                    loc = self.match_capture(emu_index, cap_img)
+            if loc:
+                with metrics.time(emu_index, "click"):
+                    ld_manager.click(loc[0], CLICK_Y)
+                self.record_click(emu_index, loc[0], CLICK_Y)
+            metrics.observe(emu_index, "cycle", time.perf_counter() - cycle_start)
+        except Exception as e:
+            self.status(f"錯誤: {e}", emu_index)
+        return True
+
+    async def process_emulator_async(self, emu_index):
+        # Same cycle as process_emulator for the asyncio scheduler
+        if not self.is_running:
+            return False
+
+        ld_manager = self.manager_for(emu_index)
+        metrics = self.metrics
+        try:
+            cycle_start = time.perf_counter()
+            self.status("截圖中...", emu_index)
+            with metrics.time(emu_index, "capture"):
+                cap_img = await ld_manager.screencap()
+            if cap_img is None:
+                metrics.count(emu_index, "capture_failures")
+                return await self.scheduler.run_blocking(self.on_capture_failed, emu_index)
+            metrics.count(emu_index, "captures")
+
+            # Includes the wait for a free match slot in the executor
+            with metrics.time(emu_index, "match"):
+                loc = await self.scheduler.run_match(self.match_capture, emu_index, cap_img)
+            if loc:
+                with metrics.time(emu_index, "click"):
+                    await ld_manager.click(loc[0], CLICK_Y)
+                self.record_click(emu_index, loc[0], CLICK_Y)
+            metrics.observe(emu_index, "cycle", time.perf_counter() - cycle_start)
+        except Exception as e:
+            self.status(f"錯誤: {e}", emu_index)
+        return True
+
+    def match_capture(self, emu_index, cap_img):
+        # Returns the click location of the highest-priority match, or None
+        images, debug = self.images, self.debug
+        search_region = SEARCH_REGION
+
+        region, _ = self.matcher.crop_region(cap_img, search_region)
+        key = tuple(images)
+        result, fp = self.change_detector.lookup(emu_index, region, key)
+        reused = result is not None
+        if not reused:
+            self.status(f"比對 {len(images)} 張圖片", emu_index)
+            result = self.match_backend.find_first(cap_img, images, threshold=MATCH_THRESHOLD, search_region=search_region,
+                                                   emulator=emu_index, all_scores=debug)
+            hint_hits, hint_misses = result.get("hints", (0, 0))
+            if hint_hits:
+                self.metrics.count(emu_index, "hint_hits", hint_hits)
+            if hint_misses:
+                self.metrics.count(emu_index, "hint_misses", hint_misses)
+            if result.get("stale"):
+                # The frame was overwritten in the ring before it was matched; wait for the next one
+                self.metrics.count(emu_index, "match_stale")
+                return None
+            self.change_detector.store(emu_index, fp, key, result)
+            self.metrics.count(emu_index, "match_runs")
+            if debug:
+                for name, score in result["scores"].items():
+                    self.log(f"{name}: {score:.4f}", emu_index)
+        else:
+            self.metrics.count(emu_index, "match_reused")
+            if debug:
+                self.log("畫面未變更，沿用上次比對結果", emu_index)
+
+        if self.pacer:
+            # Without reuse (change_tolerance < 0) every region counts as new, so only matches count
+            changed = not reused and self.change_detector.tolerance >= 0
+            self.pacer.update(emu_index, result["success"] or changed)
+
+        recorder = self.recorder
+        if recorder:
+            # Ring slots are reused after a few captures; the recorder encodes later
+            recorder.frame(emu_index, cap_img.copy() if self.frames else cap_img)
+            recorder.match(emu_index, images=images, threshold=MATCH_THRESHOLD, region=list(search_region),
+                           reused=reused,
+                           name=result.get("name") if result["success"] else None,
+                           location=list(result["location"]) if result["success"] else None)
+
+        if result["success"]:
+            loc = result["location"]
+            self.metrics.matched(emu_index, result["name"])
+            self.status(f"匹配: {result['name']} -> 點擊 ({loc[0]}, {CLICK_Y})", emu_index)
+            return loc
+        self.status("無匹配項", emu_index)
+        return None
+
+    def record_click(self, emu_index, x, y):
+        recorder = self.recorder
+        if recorder:
+            recorder.click(emu_index, x, y)
+
+    def check_emulator_status(self, index):
+        # Served from the background poller's table while the engine runs
+        if self.status_poller:
+            return self.status_poller.is_running(index)
+
+        if not os.path.exists(self.settings.ld_path):
+            return False
+        try:
+            return ldplayer.list_emulators(self.settings.ld_path).get(index, {}).get("running", False)
+        except Exception:
+            return False
+
+    def deselect(self, index):
+        with self.lock:
+            self.selected.discard(index)
+        self.status("模擬器已關閉，取消勾選", index)
+        if self.on_emulator_closed:
+            self.on_emulator_closed(index)
+
+    def on_emulator_state_changed(self, index, running):
+        # Called from the status poller thread
+        if running or not self.is_running:
+            return
+        self.deselect(index)
+
+    def on_capture_failed(self, emu_index):
+        # Returns False when the emulator is gone and its worker should retire
+        self.status("截圖失敗，檢查狀態...", emu_index)
+        if not self.check_emulator_status(emu_index):
+            self.deselect(emu_index)
+            return False
+        return True
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="TraceLD without the GUI, driven by trace.ini")
+    parser.add_argument("--config", default=os.path.join(app_dir(), "trace.ini"), help="trace.ini path")
+    parser.add_argument("--trace-dir", help="template folder (default: trace next to the config)")
+    parser.add_argument("--emulators", help="comma separated indices (default: selected_emulators, else every running one)")
+    parser.add_argument("--wait", type=float, help="seconds between cycles without adaptive waiting (default: wait_seconds)")
+    waits = parser.add_mutually_exclusive_group()
+    waits.add_argument("--adaptive-wait", action="store_true",
+                       help="wait min_wait_seconds .. max_wait_seconds depending on screen activity")
+    waits.add_argument("--fixed-wait", action="store_true", help="always wait --wait seconds (overrides adaptive_wait)")
+    parser.add_argument("--scheduler", choices=["threads", "asyncio"])
+    parser.add_argument("--match-backend", choices=["threads", "processes"])
+    parser.add_argument("--debug", action="store_true", help=f"write match scores to {LOG_FILE}")
+    parser.add_argument("--record", help="save frames, matches and clicks to this session archive (.zip)")
+    parser.add_argument("--record-full", action="store_true", help="record whole frames instead of the search region")
+    args = parser.parse_args(argv)
+
+    settings = TraceSettings.load(args.config)
+    if args.scheduler:
+        settings.scheduler = args.scheduler
+    if args.match_backend:
+        settings.match_backend = args.match_backend
+    if args.wait is not None:
+        settings.wait_seconds = args.wait
+    if args.adaptive_wait:
+        settings.adaptive_wait = True
+    if args.fixed_wait:
+        settings.adaptive_wait = False
+    if args.debug:
+        settings.debug_mode = True
+    if args.record:
+        settings.record_path = args.record
+    if args.record_full:
+        settings.record_mode = "frame"
+    if not os.path.exists(settings.ld_path):
+        print("找不到 LDPlayer 執行檔 (ld.exe)！")
+        return 2
+
+    trace_dir = args.trace_dir or find_trace_dir(os.path.dirname(os.path.abspath(args.config)))
+    if not os.path.isdir(trace_dir):
+        print(f"找不到 trace 資料夾：{trace_dir}")
+        return 2
+    settings.image_order = ordered_images(trace_dir, settings.image_order)
+
+    if args.emulators:
+        settings.selected_emulators = parse_emulators(args.emulators.replace(',', '|'))
+    if not settings.selected_emulators:
+        emulators = ldplayer.list_emulators(settings.ld_path)
+        settings.selected_emulators = [i for i, info in emulators.items() if info["running"]]
+    if not settings.selected_emulators:
+        print("沒有執行中的模擬器")
+        return 2
+
+    def print_status(msg, emulator=None):
+        now = datetime.now().strftime("%H:%M:%S")
+        tag = f" [{emulator}]" if emulator is not None else ""
+        print(f"[{now}]{tag} {msg}", flush=True)
+
+    finished = threading.Event()
+    engine = TraceEngine(settings, trace_dir, on_status=print_status, on_finished=finished.set)
+    if hasattr(signal, "SIGTERM"):
+        # Stop cleanly when run as a service
+        signal.signal(signal.SIGTERM, lambda *_: finished.set())
+    engine.start()
+    try:
+        while not finished.wait(SUPERVISOR_INTERVAL):
+            pass
+    except KeyboardInterrupt:
+        pass
+    engine.stop()
+    for line in engine.metrics.summary():
+        print(line)
+    return 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
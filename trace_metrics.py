@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in seconds (Prometheus "le" labels)
+BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, float("inf"))
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        # Linear interpolation inside the bucket that holds the q-th observation
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                low = BUCKETS[i - 1] if i else 0.0
+                high = BUCKETS[i] if BUCKETS[i] != float("inf") else self.max
+                return min(low + (high - low) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum_ms": self.total * 1000,
+            "mean_ms": self.total * 1000 / self.count if self.count else 0.0,
+            "p50_ms": self.quantile(0.50) * 1000,
+            "p95_ms": self.quantile(0.95) * 1000,
+            "p99_ms": self.quantile(0.99) * 1000,
+            "max_ms": self.max * 1000
+        }
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Metrics:
+    # Per-emulator stage latencies (capture, decode, match, click, cycle),
+    # event counters, hits per template and gauges such as the next wait.
+    # Recording is one lock and a few additions, cheap enough for every
+    # cycle of every emulator.
+    def __init__(self):
+        self.started = time.time()
+        self.stages = {}    # (emulator, stage) -> Histogram
+        self.counters = {}  # (emulator, event) -> int
+        self.matches = {}   # (emulator, template) -> int
+        self.gauges = {}    # (emulator, name) -> last value, e.g. the wait before the next cycle
+        self.lock = threading.Lock()
+
+    def observe(self, emulator, stage, seconds):
+        with self.lock:
+            hist = self.stages.get((emulator, stage))
+            if hist is None:
+                hist = self.stages[(emulator, stage)] = Histogram()
+            hist.observe(seconds)
+
+    @contextmanager
+    def time(self, emulator, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(emulator, stage, time.perf_counter() - start)
+
+    def count(self, emulator, event, n=1):
+        with self.lock:
+            self.counters[(emulator, event)] = self.counters.get((emulator, event), 0) + n
+
+    def gauge(self, emulator, name, value):
+        with self.lock:
+            self.gauges[(emulator, name)] = value
+
+    def matched(self, emulator, template):
+        with self.lock:
+            self.matches[(emulator, template)] = self.matches.get((emulator, template), 0) + 1
+
+    def to_json(self):
+        with self.lock:
+            data = {"updated": time.time(), "uptime_s": time.time() - self.started,
+                    "stages": {}, "counters": {}, "matches": {}, "gauges": {}, "totals": {}}
+            totals = {}
+            for (emu, stage), hist in sorted(self.stages.items(), key=lambda i: (str(i[0][0]), i[0][1])):
+                data["stages"].setdefault(str(emu), {})[stage] = hist.summary()
+                merged = totals.setdefault(stage, Histogram())
+                merged.counts = [a + b for a, b in zip(merged.counts, hist.counts)]
+                merged.total += hist.total
+                merged.count += hist.count
+                merged.max = max(merged.max, hist.max)
+            data["totals"] = {stage: hist.summary() for stage, hist in totals.items()}
+            for (emu, event), n in self.counters.items():
+                data["counters"].setdefault(str(emu), {})[event] = n
+            for (emu, template), n in self.matches.items():
+                data["matches"].setdefault(str(emu), {})[template] = n
+            for (emu, name), value in self.gauges.items():
+                data["gauges"].setdefault(str(emu), {})[name] = value
+        return data
+
+    def to_prometheus(self):
+        lines = []
+        with self.lock:
+            lines.append("# HELP trace_stage_seconds Time spent in each stage of an emulator cycle")
+            lines.append("# TYPE trace_stage_seconds histogram")
+            for (emu, stage), hist in self.stages.items():
+                labels = f'emulator="{escape_label(emu)}",stage="{escape_label(stage)}"'
+                cumulative = 0
+                for le, n in zip(BUCKETS, hist.counts):
+                    cumulative += n
+                    le_text = "+Inf" if le == float("inf") else repr(le)
+                    lines.append(f'trace_stage_seconds_bucket{{{labels},le="{le_text}"}} {cumulative}')
+                lines.append(f"trace_stage_seconds_sum{{{labels}}} {hist.total}")
+                lines.append(f"trace_stage_seconds_count{{{labels}}} {hist.count}")
+            lines.append("# HELP trace_events_total Captures, capture failures, reused and fresh matches, location-hint hits and misses")
+            lines.append("# TYPE trace_events_total counter")
+            for (emu, event), n in self.counters.items():
+                lines.append(f'trace_events_total{{emulator="{escape_label(emu)}",event="{escape_label(event)}"}} {n}')
+            lines.append("# HELP trace_matches_total Successful matches per template")
+            lines.append("# TYPE trace_matches_total counter")
+            for (emu, template), n in self.matches.items():
+                lines.append(f'trace_matches_total{{emulator="{escape_label(emu)}",template="{escape_label(template)}"}} {n}')
+            for name in sorted(set(name for _, name in self.gauges)):
+                lines.append(f"# HELP trace_{name} Current value per emulator")
+                lines.append(f"# TYPE trace_{name} gauge")
+                for (emu, gauge), value in self.gauges.items():
+                    if gauge == name:
+                        lines.append(f'trace_{name}{{emulator="{escape_label(emu)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        # Writes path.prom and path.json; readers never see a half-written file
+        for ext, text in ((".prom", self.to_prometheus()),
+                          (".json", json.dumps(self.to_json(), ensure_ascii=False, indent=1))):
+            tmp_path = path + ext + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, path + ext)
+
+    def summary(self):
+        # One line per stage over all emulators, for the stop message / CLI
+        data = self.to_json()
+        lines = []
+        for stage, s in data["totals"].items():
+            lines.append(f"{stage}: n={s['count']} mean={s['mean_ms']:.1f}ms p50={s['p50_ms']:.1f}ms "
+                         f"p95={s['p95_ms']:.1f}ms max={s['max_ms']:.1f}ms")
+        events = {}
+        for counters in data["counters"].values():
+            for event, n in counters.items():
+                events[event] = events.get(event, 0) + n
+        if events:
+            lines.append(" ".join(f"{event}={n}" for event, n in sorted(events.items())))
+        # Gauges per emulator: "next_wait_seconds: 0=0.2 3=1.6"
+        gauges = {}
+        for emu, values in data["gauges"].items():
+            for name, value in values.items():
+                gauges.setdefault(name, []).append(f"{emu}={value:g}")
+        for name, values in sorted(gauges.items()):
+            lines.append(f"{name}: " + " ".join(values))
+        return lines
+
+class MetricsExporter(threading.Thread):
+    # Rewrites the metrics files every interval and once more on stop
+    def __init__(self, metrics, path, interval=10.0):
+        super().__init__(daemon=True, name="metrics-exporter")
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.stop_event = threading.Event()
+
+    def write(self):
+        try:
+            self.metrics.export(self.path)
+        except OSError as e:
+            print(f"Metrics export error: {e}")
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.write()
+
+    def stop(self):
+        self.stop_event.set()
+        self.write()
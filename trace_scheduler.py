@@ -0,0 +1,183 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from ld_async import EventLoopThread
+
+class AdaptiveInterval:
+    # Per-emulator wait between cycles: back to min_wait after a cycle that
+    # matched or saw the screen change, then backoff times longer after every
+    # quiet cycle, up to max_wait. Usable directly as a scheduler's interval.
+    def __init__(self, min_wait, max_wait, backoff=2.0):
+        self.min_wait = min_wait
+        self.max_wait = max(max_wait, min_wait)
+        self.backoff = backoff
+        self.current = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, index):
+        with self.lock:
+            return self.current.get(index, self.min_wait)
+
+    def update(self, index, active):
+        with self.lock:
+            if active:
+                self.current[index] = self.min_wait
+            else:
+                wait = self.current.get(index, self.min_wait) * self.backoff
+                self.current[index] = min(max(wait, self.min_wait), self.max_wait)
+
+    def forget(self, index):
+        with self.lock:
+            self.current.pop(index, None)
+
+class EmulatorWorker(threading.Thread):
+    def __init__(self, index, cycle, interval):
+        super().__init__(daemon=True, name=f"emu-{index}")
+        self.index = index
+        self.cycle = cycle          # cycle(index) -> False to retire this worker
+        self.interval = interval    # interval(index) -> seconds until the next cycle
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                if self.cycle(self.index) is False:
+                    break
+            except Exception as e:
+                print(f"[{self.index}] Worker error: {e}")
+            self.stop_event.wait(self.interval(self.index))
+
+    def stop(self):
+        self.stop_event.set()
+
+class EmulatorScheduler:
+    # Runs every selected emulator on its own thread with its own cadence, so a
+    # slow or hung instance only delays itself. CPU-bound matching is bounded
+    # globally through match_slots.
+    def __init__(self, cycle, interval, max_match_jobs=None):
+        self.cycle = cycle
+        self.interval = interval
+        self.match_slots = threading.BoundedSemaphore(max_match_jobs or os.cpu_count() or 4)
+        self.workers = {}
+        self.stopped = False
+        self.lock = threading.Lock()
+
+    def sync(self, indices):
+        # Start workers for newly selected emulators and stop deselected ones.
+        # A worker that retired itself stays retired until it is deselected.
+        wanted = set(indices)
+        with self.lock:
+            if self.stopped:
+                return
+            for index in list(self.workers):
+                if index not in wanted:
+                    self.workers.pop(index).stop()
+            for index in wanted:
+                if index not in self.workers:
+                    worker = EmulatorWorker(index, self.cycle, self.interval)
+                    self.workers[index] = worker
+                    worker.start()
+
+    def active(self):
+        with self.lock:
+            return sorted(i for i, w in self.workers.items() if w.is_alive())
+
+    def stop_all(self, timeout=None):
+        # Final: later sync() calls start nothing. With a timeout, waits up to
+        # that long for the workers' current cycles; a second call does nothing.
+        with self.lock:
+            if self.stopped:
+                return
+            self.stopped = True
+            workers, self.workers = list(self.workers.values()), {}
+        for worker in workers:
+            worker.stop()
+        if timeout:
+            deadline = time.monotonic() + timeout
+            for worker in workers:
+                worker.join(max(deadline - time.monotonic(), 0))
+                if worker.is_alive():
+                    print(f"[{worker.index}] Worker still busy after {timeout}s")
+
+class AsyncEmulatorScheduler:
+    # Same interface as EmulatorScheduler, but every emulator is a task on one
+    # shared event loop instead of a thread. cycle(index) is a coroutine;
+    # matching is handed to a pool of max_match_jobs threads via run_match.
+    def __init__(self, cycle, interval, max_match_jobs=None, loop_thread=None):
+        self.cycle = cycle
+        self.interval = interval
+        self.owns_loop = loop_thread is None
+        self.loop_thread = loop_thread or EventLoopThread()
+        self.executor = ThreadPoolExecutor(max_workers=max_match_jobs or os.cpu_count() or 4)
+        self.tasks = {}
+        self.stopped = False
+        self.lock = threading.Lock()
+
+    async def _worker(self, index):
+        while True:
+            try:
+                if await self.cycle(index) is False:
+                    return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[{index}] Worker error: {e}")
+            await asyncio.sleep(self.interval(index))
+
+    async def _sync(self, wanted):
+        for index in list(self.tasks):
+            if index not in wanted:
+                self.tasks.pop(index).cancel()
+        for index in wanted:
+            if index not in self.tasks:
+                self.tasks[index] = asyncio.ensure_future(self._worker(index))
+
+    async def _stop_all(self, cleanup):
+        tasks, self.tasks = list(self.tasks.values()), {}
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if cleanup:
+            await cleanup()
+        self.executor.shutdown(wait=False)
+        if self.owns_loop:
+            self.loop_thread.stop()
+
+    def sync(self, indices):
+        with self.lock:
+            if self.stopped:
+                return
+            future = self.loop_thread.submit(self._sync(set(indices)))
+        future.result()
+
+    def active(self):
+        return sorted(i for i, t in list(self.tasks.items()) if not t.done())
+
+    def stop_all(self, timeout=None, cleanup=None):
+        # Final, and only the first call does anything. cleanup(), a coroutine
+        # function, runs on the loop once every task has finished. With a
+        # timeout, also waits for the match threads and (if this scheduler
+        # owns it) the loop thread.
+        with self.lock:
+            if self.stopped:
+                return
+            self.stopped = True
+            future = self.loop_thread.submit(self._stop_all(cleanup))
+        if not timeout:
+            return
+        try:
+            future.result(timeout)
+        except FutureTimeout:
+            print(f"Emulator tasks still running after {timeout}s")
+        # A cancelled run_match leaves its thread running until the match returns
+        self.executor.shutdown(wait=True)
+        if self.owns_loop:
+            self.loop_thread.join(timeout)
+
+    async def run_match(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def run_blocking(self, fn, *args):
+        return await asyncio.to_thread(fn, *args)